@@ -0,0 +1,484 @@
+"""Benchmarks for _Review_Functions.CodeAggregator.
+
+Usage:
+    python _Review_Bench.py pipeline --size-mb 4
+    python _Review_Bench.py comments --size-mb 4
+    python _Review_Bench.py stubs --copies 100
+    python _Review_Bench.py suite --files 5000 --json run.json
+    python _Review_Bench.py suite --files 5000 --baseline run.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import logging
+import tracemalloc
+from pathlib import Path
+
+from _Review_Functions import CodeAggregator, ChunkWriter
+
+HERE = Path(__file__).resolve().parent
+
+
+# ----------------------
+# Reference implementations (pre-pipeline text chain)
+# ----------------------
+
+def legacy_truncate(text, limit, note):
+    if limit is None or limit <= 0:
+        return text
+    lines = text.splitlines(keepends=True)
+    if len(lines) <= limit:
+        return text
+    omitted = len(lines) - limit
+    suffix = f"\n... (truncated, {omitted} more lines omitted; {note})"
+    return "".join(lines[:limit]) + suffix
+
+
+def legacy_remove_comments(content, extension):
+    if extension == ".py":
+        return "\n".join(
+            line for line in content.splitlines() if not line.lstrip().startswith("#")
+        )
+    if extension == ".js":
+        no_block = re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL)
+        return "\n".join(line.split("//", 1)[0] for line in no_block.splitlines())
+    if extension == ".html":
+        return content
+    if extension == ".css":
+        return re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL)
+    temp = re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL)
+    return "\n".join(
+        line.split("#", 1)[0].split("//", 1)[0] for line in temp.splitlines()
+    )
+
+
+def legacy_render(agg, file_path):
+    """The read/slice/cap/compact chain as it was before the line pipeline."""
+    extension = file_path.suffix.lower()
+    file_content = file_path.read_text(encoding="utf-8", errors="replace")
+    file_content = "".join(file_content.splitlines(keepends=True))
+    if agg.max_lines_per_file:
+        file_content = legacy_truncate(
+            file_content, agg.max_lines_per_file, "early cap: max_lines_per_file"
+        )
+    if agg.compaction_level == "stubs":
+        file_content = agg._create_stubs(file_content, extension)
+    if not agg.comments:
+        # Comment lexers replaced the regex chain; compare plumbing only
+        file_content = agg.remove_comments(file_content, extension)
+    if agg.compaction_level == "whitespace":
+        file_content = "\n".join(
+            line.rstrip() for line in file_content.splitlines() if line.strip()
+        )
+    if agg.compaction_level in ("none", "whitespace") and agg.truncate_lines:
+        file_content = legacy_truncate(
+            file_content,
+            agg.truncate_lines,
+            f"post cap: truncate_lines={agg.truncate_lines}",
+        )
+    header = f"\n[-] This file: {file_path} | Contents:\n"
+    return header + file_content + "\n" + "=" * 80 + "\n"
+
+
+# ----------------------
+# Helpers
+# ----------------------
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def build_large_files(out_dir: Path, size_mb: float):
+    """Concatenate the repo's own JS/CSS/HTML until each file hits size_mb."""
+    target = int(size_mb * 1024 * 1024)
+    sources = {
+        ".js": sorted((HERE / "static" / "js").glob("*.js")),
+        ".css": sorted((HERE / "static" / "css").glob("*.css")),
+        ".html": sorted((HERE / "templates").glob("*.html")),
+    }
+    files = []
+    for ext, paths in sources.items():
+        seed = "".join(p.read_text(encoding="utf-8") for p in paths)
+        if not seed:
+            continue
+        reps = max(1, target // len(seed.encode("utf-8")))
+        path = out_dir / f"large{ext}"
+        path.write_text(seed * reps, encoding="utf-8")
+        files.append(path)
+    return files
+
+
+# ----------------------
+# Synthetic project generator
+# ----------------------
+
+SNIPPETS = {
+    ".py": (
+        "# helper {i}\n"
+        "class Model{i}(Base):\n"
+        '    """Model number {i}."""\n\n'
+        "    def method_{i}(self, value, url='http://x/{i}'):\n"
+        "        # scale value\n"
+        "        return {{'v': value * {i}, 'url': url}}\n\n\n"
+    ),
+    ".js": (
+        "/* block {i} */\n"
+        "function handler{i}(event) {{\n"
+        "  const url = 'http://x/{i}'; // trailing\n"
+        "  return `${{event.type}}-{i}`.replace(/[{{}}]/g, '');\n"
+        "}}\n\n"
+    ),
+    ".css": (
+        "/* rule {i} */\n"
+        ".item-{i} {{\n"
+        "  color: #{i:06x};\n"
+        "  background: url(http://x/{i}.png);\n"
+        "}}\n\n"
+    ),
+    ".html": (
+        "<!-- section {i} -->\n"
+        "<nav><a href=\"/{i}\">{i}</a></nav>\n"
+        "<ul><li>a{i}</li><li>b{i}</li><li>c{i}</li><li>d{i}</li></ul>\n"
+        "<script>var n{i} = {i};</script>\n"
+    ),
+    ".json": '  {{"id": {i}, "name": "item {i}", "tags": ["a", "b"]}},\n',
+    ".md": "## Heading {i}\n\nSome *text* for item {i}, see http://x/{i}.\n\n",
+}
+DEFAULT_MIX = "py=3,js=3,css=1,html=1,json=1,md=1"
+IGNORED_DIRS = ["node_modules", "__pycache__", ".git"]
+
+
+def parse_mix(spec):
+    """'py=3,js=1' -> ([".py", ".js"], [3, 1])"""
+    exts, weights = [], []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        ext = "." + name.strip().lstrip(".")
+        if ext not in SNIPPETS:
+            raise SystemExit(f"unknown extension in --mix: {ext}")
+        exts.append(ext)
+        weights.append(float(weight or 1))
+    return exts, weights
+
+
+def file_text(ext, size, rng):
+    """Text of roughly 'size' bytes built from the extension's snippet."""
+    start = rng.randrange(1, 1 << 20)
+    parts, total, i = [], 0, start
+    while total < size:
+        part = SNIPPETS[ext].format(i=i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    text = "".join(parts)
+    if ext == ".json":
+        return "[\n" + text.rstrip(",\n") + "\n]\n"
+    return text
+
+
+def generate_tree(root: Path, files, depth, fanout, mix, size_kb, ignored, seed):
+    """Write a synthetic project under root; returns (file count, bytes)."""
+    rng = random.Random(seed)
+    exts, weights = parse_mix(mix)
+
+    dirs = [Path()]
+    level = [Path()]
+    for d in range(depth):
+        level = [p / f"pkg{d}_{k}" for p in level for k in range(fanout)]
+        dirs.extend(level)
+
+    written = 0
+    for n in range(files):
+        ext = rng.choices(exts, weights)[0]
+        size = max(64, int(rng.expovariate(1 / (size_kb * 1024))))
+        path = root / rng.choice(dirs) / f"file_{n}{ext}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        written += path.write_bytes(file_text(ext, size, rng).encode("utf-8"))
+
+    # Ignored dirs get files too, so pruning shows up in the timings
+    for name in ignored:
+        for k in range(max(1, files // 100)):
+            path = root / name / f"dep_{k}" / "index.js"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(file_text(".js", 2048, rng), encoding="utf-8")
+    return files, written
+
+
+# ----------------------
+# Benchmarks
+# ----------------------
+
+PIPELINE_CONFIGS = [
+    dict(compaction_level="whitespace", comments=False),
+    dict(compaction_level="whitespace", comments=True, max_lines_per_file=700,
+         truncate_lines=650),
+    dict(compaction_level="none", comments=False, truncate_lines=650),
+]
+
+
+def bench_pipeline(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = build_large_files(Path(tmp), args.size_mb)
+        print(f"{'file':<12}{'config':<34}{'legacy s':>10}{'pipeline s':>12}{'speedup':>9}")
+        for cfg in PIPELINE_CONFIGS:
+            agg = CodeAggregator(use_cache=False, **cfg)
+            label = ",".join(f"{k[:5]}={v}" for k, v in cfg.items())
+            for path in files:
+                t_old, old = best_of(lambda: legacy_render(agg, path), args.repeat)
+                t_new, new = best_of(
+                    lambda: agg._render_file(path, None)[0], args.repeat
+                )
+                if old != new:
+                    print(f"MISMATCH: {path.name} with {cfg}")
+                    return 1
+                print(
+                    f"{path.name:<12}{label[:33]:<34}{t_old:>10.4f}{t_new:>12.4f}"
+                    f"{t_old / t_new:>8.2f}x"
+                )
+    return 0
+
+
+def bench_comments(args):
+    agg = CodeAggregator(use_cache=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = build_large_files(Path(tmp), args.size_mb)
+        cases = [(p.name, p.suffix, p.read_text(encoding="utf-8")) for p in files]
+
+        # Minified (one huge line) and unterminated-comment worst cases
+        js = agg.remove_comments(cases[0][2], ".js")
+        cases.append(("minified.js", ".js", js.replace("\n", " ")))
+        cases.append(("open_blocks.css", ".css", "a{} /*" * (args.pathological_kb * 170)))
+
+        print(f"{'input':<18}{'MB':>6}{'legacy s':>10}{'lexer s':>10}{'speedup':>9}")
+        for name, ext, text in cases:
+            t_new, _ = best_of(lambda: agg.remove_comments(text, ext), args.repeat)
+            mb = len(text.encode("utf-8")) / 1e6
+            if ext == ".html":
+                # The legacy path left HTML untouched: nothing to compare
+                print(f"{name:<18}{mb:>6.2f}{'-':>10}{t_new:>10.4f}{'-':>9}")
+                continue
+            t_old, _ = best_of(lambda: legacy_remove_comments(text, ext), args.repeat)
+            print(
+                f"{name:<18}{mb:>6.2f}{t_old:>10.4f}{t_new:>10.4f}"
+                f"{t_old / t_new:>8.2f}x"
+            )
+    return 0
+
+
+def bench_stubs(args):
+    templates = sorted((HERE / "templates").glob("*.html"))
+    texts = [p.read_text(encoding="utf-8") for p in templates] * args.copies
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+    print(f"{len(texts)} templates, {mb:.2f} MB")
+    print(f"{'engine':<10}{'seconds':>10}{'ms/file':>10}")
+    for engine in ("bs4", "stdlib"):
+        agg = CodeAggregator(use_cache=False, compaction_level="stubs",
+                             html_stubs=engine)
+        if engine == "bs4" and agg._create_stubs_html(texts[0]) == texts[0]:
+            print(f"{engine:<10}{'(beautifulsoup4 not installed)':>20}")
+            continue
+        t, _ = best_of(
+            lambda: [agg._create_stubs_html(t) for t in texts], args.repeat
+        )
+        print(f"{engine:<10}{t:>10.3f}{t * 1000 / len(texts):>10.2f}")
+    return 0
+
+
+def peak_alloc_mb(fn):
+    """Peak memory (MB) Python allocates while fn runs, on top of what was
+    allocated before. Pool workers in other processes are not counted."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def time_stage(name, fn, files, nbytes):
+    # Timed untraced; tracemalloc slows allocation-heavy code several-fold
+    t0 = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - t0
+    return name, {
+        "seconds": round(seconds, 6),
+        "files": files,
+        "mb": round(nbytes / 1e6, 3),
+        "files_per_s": round(files / seconds, 1) if seconds else None,
+        "mb_per_s": round(nbytes / 1e6 / seconds, 3) if seconds else None,
+        "peak_mb": round(peak_alloc_mb(fn), 1),
+    }
+
+
+def run_suite(root: Path, args, files, nbytes):
+    def aggregator(**kw):
+        return CodeAggregator(
+            root_dir=root, ignore_dirs=IGNORED_DIRS, use_cache=False,
+            workers=args.workers, **kw
+        )
+
+    stages = []
+
+    agg = aggregator()
+    stages.append(time_stage("dirtree", agg._generate_dirtree, files, 0))
+
+    agg = aggregator()
+    stages.append(time_stage("aggregate_files", agg.aggregate_files, files, nbytes))
+
+    for level in ("none", "whitespace", "stubs"):
+        agg = aggregator(compaction_level=level, comments=True)
+        stages.append(
+            time_stage(f"compaction_{level}", agg.aggregate_files, files, nbytes)
+        )
+
+    entries, _ = agg._walk_tree()
+    texts = [
+        (e.path.read_text(encoding="utf-8"), e.suffix.lower()) for e in entries
+    ]
+    stages.append(
+        time_stage(
+            "comments",
+            lambda: [agg.remove_comments(t, ext) for t, ext in texts],
+            len(texts),
+            sum(len(t.encode("utf-8")) for t, _ in texts),
+        )
+    )
+    del texts
+
+    blocks = aggregator().aggregate_files()
+    out_bytes = sum(len(b.encode("utf-8")) for b in blocks)
+    with tempfile.TemporaryDirectory() as out:
+        def write():
+            with ChunkWriter(os.path.join(out, "bench"), ".txt", args.split_at) as w:
+                for block in blocks:
+                    w.write(block)
+
+        stages.append(time_stage("split_write", write, len(blocks), out_bytes))
+    return dict(stages)
+
+
+def compare(stages, baseline, max_slowdown):
+    """Print per-stage ratios against a baseline; True if all within limit."""
+    ok = True
+    print(f"\n{'stage':<22}{'base s':>10}{'now s':>10}{'ratio':>8}")
+    for name, now in stages.items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or not base["seconds"]:
+            continue
+        ratio = now["seconds"] / base["seconds"]
+        flag = ""
+        if ratio > max_slowdown:
+            ok = False
+            flag = "  REGRESSION"
+        print(f"{name:<22}{base['seconds']:>10.3f}{now['seconds']:>10.3f}"
+              f"{ratio:>7.2f}x{flag}")
+    return ok
+
+
+def bench_suite(args):
+    params = {
+        "files": args.files, "depth": args.depth, "fanout": args.fanout,
+        "mix": args.mix, "size_kb": args.size_kb, "seed": args.seed,
+        "workers": args.workers, "split_at": args.split_at,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(args.tree) if args.tree else Path(tmp) / "project"
+        if not root.exists():
+            t0 = time.perf_counter()
+            generate_tree(root, args.files, args.depth, args.fanout, args.mix,
+                          args.size_kb, IGNORED_DIRS, args.seed)
+            print(f"generated {root} in {time.perf_counter() - t0:.1f}s")
+        entries, _ = CodeAggregator(
+            root_dir=root, ignore_dirs=IGNORED_DIRS, use_cache=False
+        )._walk_tree()
+        files = len(entries)
+        nbytes = sum(e.stat.st_size for e in entries)
+        stages = run_suite(root, args, files, nbytes)
+
+    print(f"{'stage':<22}{'seconds':>10}{'files/s':>12}{'MB/s':>10}{'peak MB':>9}")
+    for name, r in stages.items():
+        print(f"{name:<22}{r['seconds']:>10.3f}{r['files_per_s'] or 0:>12.0f}"
+              f"{r['mb_per_s'] or 0:>10.2f}{r['peak_mb']:>9.1f}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "stages": stages,
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"wrote {args.json}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("params") != params:
+            print("warning: baseline was recorded with different parameters")
+        if not compare(stages, baseline, args.max_slowdown):
+            return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pipeline", help="line pipeline vs. the old text chain")
+    p.add_argument("--size-mb", type=float, default=4.0)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("comments", help="comment lexers vs. the old regex chain")
+    p.add_argument("--size-mb", type=float, default=4.0)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument(
+        "--pathological-kb",
+        type=int,
+        default=64,
+        help="size of the unterminated-comment input (the old chain is quadratic)",
+    )
+    p.set_defaults(func=bench_comments)
+
+    p = sub.add_parser("stubs", help="stdlib HTML stub engine vs. bs4")
+    p.add_argument("--copies", type=int, default=20)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_stubs)
+
+    p = sub.add_parser("suite", help="per-stage timings on a synthetic tree")
+    p.add_argument("--files", type=int, default=1000)
+    p.add_argument("--depth", type=int, default=3)
+    p.add_argument("--fanout", type=int, default=4)
+    p.add_argument("--mix", default=DEFAULT_MIX,
+                   help=f"extension weights (default: {DEFAULT_MIX})")
+    p.add_argument("--size-kb", type=float, default=4.0,
+                   help="mean file size (exponentially distributed)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--split-at", type=int, default=8400)
+    p.add_argument("--tree", help="reuse/keep the generated tree in this dir")
+    p.add_argument("--json", help="write the report to this file")
+    p.add_argument("--baseline", help="report to compare against")
+    p.add_argument("--max-slowdown", type=float, default=1.25,
+                   help="fail when a stage is this many times slower")
+    p.set_defaults(func=bench_suite)
+
+    args = parser.parse_args(argv)
+    logging.getLogger("code_aggregator").setLevel(logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,8 +4,32 @@ import json
 from pathlib import Path
 from datetime import datetime
 import logging
-
-# Optional dependency for HTML stubs:
+import argparse
+import fnmatch
+import hashlib
+import tempfile
+import mmap
+import sqlite3
+import itertools
+import io
+import tokenize
+import ast
+import bisect
+import functools
+import contextlib
+import heapq
+import time
+import select
+import ctypes
+import ctypes.util
+import struct
+import subprocess
+from stat import S_ISREG
+from collections import Counter, namedtuple
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Optional HTML stub engine (html_stubs="bs4"); the default is stdlib:
 #   pip install beautifulsoup4
 try:
     from bs4 import BeautifulSoup, Comment
@@ -27,6 +51,1409 @@ app.logger = logging.getLogger("code_aggregator")
 JSON_TRUNCATE_LENGTH = 400
 HTML_TRUNCATE_ITEMS = 2
 
+# Persistent block cache defaults
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Bytes read per batch by the line pipeline (see BoundedReader)
+READ_BLOCK_BYTES = 256 * 1024
+# A NUL in the first SNIFF_BYTES marks a file as binary
+SNIFF_BYTES = 8192
+# Per-file read ceiling; bytes past it are never read
+MAX_FILE_BYTES = 32 * 1024 * 1024
+
+# Files/bodies smaller than this are never replaced by a reference
+DEDUPE_MIN_BYTES = 128
+
+# Everything str.splitlines() treats as a line boundary
+LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+# The same, UTF-8 encoded, as seen by BoundedReader after newline translation
+# ('\r\n' and '\r' read as '\n'); used to count lines without decoding
+BYTE_LINE_BREAKS = (
+    b"\n", b"\r", b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e",
+    b"\xc2\x85", b"\xe2\x80\xa8", b"\xe2\x80\xa9",
+)
+
+# Comment lexer patterns (see strip_*_comments below)
+_SQ_STRING = r"'[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*'?"
+_DQ_STRING = r'"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"?'
+_BLOCK_COMMENT = r"(?P<bc>/\*[\s\S]*?\*/)|(?P<open>/\*)"
+_STRINGS = f"{_SQ_STRING}|{_DQ_STRING}"
+
+
+def _all_but(chars):
+    """Class matching any character but 'chars', as ranges: sre tests a
+    negated class member by member but a range class with one bitmap
+    lookup, which makes runs of plain code over twice as fast to skip."""
+    ranges, lo = [], 0
+    for c in sorted(map(ord, chars)):
+        if lo < c:
+            ranges.append(f"\\u{lo:04x}-\\u{c - 1:04x}")
+        lo = c + 1
+    ranges.append(f"\\u{lo:04x}-\\U0010ffff")
+    return f"[{''.join(ranges)}]"
+
+
+def _token_re(stops, skips, tokens):
+    """Pattern for match(text, pos): runs over code the lexer has no use
+    for ([^stops], and 'skips' such as whole strings) inside the regex
+    engine, then takes the token after it ('end' at the end of text).
+    Every stop character starts a skip or a token, so a match never
+    fails or backtracks."""
+    run = f"{_all_but(stops)}*"
+    return re.compile(rf"{run}(?:(?:{skips}){run})*(?:{tokens}|(?P<end>\Z))")
+
+
+# Next token a lexer must look at. An unterminated string ends at its
+# line. An unterminated block comment fails the lazy 'bc' once (scanning
+# to the end) and then matches 'open', which ends lexing.
+_JS_TOKENS = rf"(?P<tpl>`)|(?P<lc>//[^\n]*)|{_BLOCK_COMMENT}|(?P<slash>/)"
+JS_TOKEN_RE = _token_re("'\"`/", _STRINGS, _JS_TOKENS)
+# ... inside a template's ${ }, where braces must be counted
+JS_TOKEN_BRACES_RE = _token_re(
+    "'\"`/{}", _STRINGS, _JS_TOKENS + r"|(?P<lb>\{)|(?P<rb>\})"
+)
+# ... for callers that want code brackets too
+JS_TOKEN_BRACKETS_RE = _token_re(
+    "'\"`/{}()",
+    _STRINGS,
+    _JS_TOKENS + r"|(?P<lb>\{)|(?P<rb>\})|(?P<lp>\()|(?P<rp>\))",
+)
+JS_TEMPLATE_RE = re.compile(r"[^`\\$]*(?:(?:\\[\s\S]|\$(?!\{))[^`\\$]*)*")
+# Body of a regex literal after its opening '/', up to the closing '/'
+# and flags (group 1). It never fails and never backtracks: it stops at
+# the closing '/', a newline or the end, so each literal is scanned once.
+JS_REGEX_BODY_RE = re.compile(
+    r"(?:[^/\\\[\n]+|\\.|\[(?:[^\]\\\n]+|\\.)*\]?)*(/[A-Za-z]*)?"
+)
+CSS_TOKEN_RE = _token_re("'\"/", rf"{_STRINGS}|/(?!\*)", _BLOCK_COMMENT)
+# ... for SCSS/Less, with // line comments ('://' as in url(http://...)
+# is not one)
+CSS_LINE_TOKEN_RE = _token_re(
+    "'\"/",
+    rf"{_STRINGS}|(?<=:)//|/(?![*/])",
+    _BLOCK_COMMENT + r"|(?P<lc>//[^\n]*)",
+)
+JS_WORD_TAIL_RE = re.compile(r"[\w$]+$")
+JS_REGEX_KEYWORDS = frozenset(
+    "return typeof instanceof in of new delete void throw case do else "
+    "yield await".split()
+)
+HTML_SPECIAL_RE = re.compile(r"<!--|\{#|<(script|style)\b", re.IGNORECASE)
+HTML_CLOSE_RE = {
+    "script": re.compile(r"</script\s*>", re.IGNORECASE),
+    "style": re.compile(r"</style\s*>", re.IGNORECASE),
+}
+
+# One entry per regular file found by CodeAggregator._walk_tree().
+# 'parts' is the path relative to root_dir, split into components.
+FileEntry = namedtuple("FileEntry", "path parts name stem suffix stat")
+
+
+class FileCache:
+    """On-disk cache of finished file blocks (a small sqlite3 table).
+
+    Entries are keyed by path and validated against size, mtime and an
+    options hash, so a warm run only needs one stat() per file. A row also
+    keeps the file's content hash for exact dedupe, valid while size and
+    mtime match (a file hashed but never rendered gets a row without a
+    block). When the cache grows past max_bytes the least recently used
+    blocks are dropped.
+    """
+
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.db = None
+        self.run = 0
+        self.hits = 0
+        self.misses = 0
+        self._used = []
+        self._digests = {}  # key -> (size, mtime_ns, digest) seen this run
+
+    def _connect(self):
+        db = sqlite3.connect(str(self.path))
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS blocks (key TEXT PRIMARY KEY, "
+            "size INTEGER, mtime_ns INTEGER, opts TEXT, used INTEGER, "
+            "nbytes INTEGER, block TEXT, digest BLOB)"
+        )
+        columns = [row[1] for row in db.execute("PRAGMA table_info(blocks)")]
+        if "digest" not in columns:  # cache written before digests were kept
+            db.execute("ALTER TABLE blocks ADD COLUMN digest BLOB")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER)")
+        row = db.execute("SELECT v FROM meta WHERE k = 'run'").fetchone()
+        self.run = (row[0] if row else 0) + 1
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (self.run,))
+        return db
+
+    def load(self):
+        try:
+            self.db = self._connect()
+        except sqlite3.DatabaseError as e:
+            app.logger.warning(f"Cache unreadable ({e}), starting empty.")
+            try:
+                self.path.unlink()
+                self.db = self._connect()
+            except Exception as e:
+                app.logger.warning(f"Cache disabled ({e}).")
+                self.db = None
+        return self
+
+    def get(self, key, size, mtime_ns, opts):
+        row = None
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT block FROM blocks "
+                "WHERE key = ? AND size = ? AND mtime_ns = ? AND opts = ?",
+                (key, size, mtime_ns, opts),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.append((self.run, key))
+        return row[0]
+
+    def put(self, key, size, mtime_ns, opts, block):
+        if self.db is None:
+            return
+        digest = self._digests.get(key)
+        if digest is not None and digest[:2] != (size, mtime_ns):
+            digest = None
+        self.db.execute(
+            "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, size, mtime_ns, opts, self.run, len(block), block,
+             digest and digest[2]),
+        )
+
+    def get_digest(self, key, size, mtime_ns):
+        """Content hash stored for key at this size and mtime, or None."""
+        row = None
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT digest FROM blocks "
+                "WHERE key = ? AND size = ? AND mtime_ns = ?",
+                (key, size, mtime_ns),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        self._digests[key] = (size, mtime_ns, row[0])
+        self._used.append((self.run, key))
+        return row[0]
+
+    def put_digest(self, key, size, mtime_ns, digest):
+        if self.db is None:
+            return
+        self._digests[key] = (size, mtime_ns, digest)
+        updated = self.db.execute(
+            "UPDATE blocks SET digest = ?, used = ? "
+            "WHERE key = ? AND size = ? AND mtime_ns = ?",
+            (digest, self.run, key, size, mtime_ns),
+        )
+        if not updated.rowcount:
+            self.db.execute(
+                "INSERT OR REPLACE INTO blocks "
+                "VALUES (?, ?, ?, NULL, ?, 0, NULL, ?)",
+                (key, size, mtime_ns, self.run, digest),
+            )
+
+    def _evict(self):
+        total = self.db.execute(
+            "SELECT COALESCE(SUM(nbytes), 0) FROM blocks"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, nbytes in self.db.execute(
+            "SELECT key, nbytes FROM blocks ORDER BY used"
+        ).fetchall():
+            doomed.append((key,))
+            total -= nbytes
+            if total <= self.max_bytes:
+                break
+        self.db.executemany("DELETE FROM blocks WHERE key = ?", doomed)
+        app.logger.info(f"Cache evicted {len(doomed)} blocks.")
+
+    def save(self):
+        if self.db is None:
+            return
+        try:
+            self.db.executemany(
+                "UPDATE blocks SET used = ? WHERE key = ?", self._used
+            )
+            self._evict()
+            self.db.commit()
+        except sqlite3.Error as e:
+            app.logger.warning(f"Cache not saved ({e}).")
+        finally:
+            self.db.close()
+            self.db = None
+            self._used = []
+            self._digests = {}
+        app.logger.info(
+            f"Cache saved: {self.path} ({self.hits} hits, {self.misses} misses)"
+        )
+
+
+def _count_breaks(buf) -> int:
+    """Line breaks in UTF-8 bytes, with '\r\n' counted once."""
+    count = buf.count(b"\n")
+    for brk in BYTE_LINE_BREAKS[1:]:
+        if brk in buf:  # rare; a membership test is cheaper than count()
+            count += buf.count(brk)
+    if b"\r" in buf:
+        count -= buf.count(b"\r\n")
+    return count
+
+
+def _count_lines(get, start, end, step=1024 * 1024) -> int:
+    """Lines splitlines() would find in bytes [start, end) of a file.
+
+    get(a, b) returns bytes a..b. Work is done in 'step' slices (step >= 2);
+    breaks that straddle a slice edge (at most 3 bytes long) are fixed up
+    by recounting a 4-byte window around each edge.
+    """
+    if end <= start:
+        return 0
+    count = 0
+    for a in range(start, end, step):
+        count += _count_breaks(get(a, min(a + step, end)))
+        if a > start:
+            window = get(a - 2, min(a + 2, end))
+            count += (
+                _count_breaks(window)
+                - _count_breaks(window[:2])
+                - _count_breaks(window[2:])
+            )
+    tail = get(max(start, end - 3), end)
+    if not any(tail.endswith(b) for b in BYTE_LINE_BREAKS):
+        count += 1  # last line has no line break
+    return count
+
+
+class BoundedReader:
+    """Read a file as line batches, lazily and up to a byte ceiling.
+
+    Blocks are read in binary and cut after their last '\n' (or '\r'), so
+    decoding never splits a character; '\r\n' and '\r' become '\n' like
+    text-mode reads. Consumers that stop early can ask remaining_lines()
+    for what they skipped, counted on an mmap without decoding.
+    """
+
+    def __init__(self, path, max_bytes=MAX_FILE_BYTES):
+        self.fh = open(path, "rb")
+        self.size = os.fstat(self.fh.fileno()).st_size
+        self.limit = min(self.size, max_bytes) if max_bytes else self.size
+        self.head = self.fh.read(min(SNIFF_BYTES, self.limit))
+        self.pos = len(self.head)  # bytes read so far
+        self.undecoded = 0  # offset of the first byte not yet yielded
+
+    @property
+    def clipped(self) -> bool:
+        return self.size > self.limit
+
+    def is_binary(self) -> bool:
+        return b"\0" in self.head
+
+    def _decode(self, data):
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        return data.decode("utf-8", errors="replace")
+
+    def batches(self):
+        pending = [self.head]
+        self.head = b""
+        while True:
+            want = min(READ_BLOCK_BYTES, self.limit - self.pos)
+            chunk = self.fh.read(want) if want > 0 else b""
+            self.pos += len(chunk)
+            if not chunk:
+                data = b"".join(pending)
+                self.undecoded += len(data)
+                if data:
+                    yield self._decode(data).splitlines(keepends=True)
+                return
+            # Cut after a line break; a '\r' only if its '\n' can't follow
+            cut = chunk.rfind(b"\n") + 1 or chunk.rfind(b"\r", 0, len(chunk) - 1) + 1
+            if not cut:
+                pending.append(chunk)  # one long line so far
+                continue
+            pending.append(chunk[:cut])
+            data = b"".join(pending)
+            pending = [chunk[cut:]]
+            self.undecoded += len(data)
+            yield self._decode(data).splitlines(keepends=True)
+
+    def remaining_lines(self) -> int:
+        """Lines from the first unyielded byte up to the ceiling."""
+        start, end = self.undecoded, self.limit
+        if end <= start:
+            return 0
+        try:
+            with mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _count_lines(lambda a, b: mm[a:b], start, end)
+        except (OSError, ValueError):  # e.g. files that can't be mapped
+
+            def get(a, b):
+                self.fh.seek(a)
+                return self.fh.read(b - a)
+
+            return _count_lines(get, start, end)
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RunStats:
+    """perf_counter_ns time and line/char counters per pipeline stage.
+
+    Each rendered file gets its own instance, which is returned along with
+    its block (so it survives pool workers) and merged into the run's.
+    Stage times are exclusive: a lazy stage isn't charged for the time its
+    upstream stages spend producing the batches it pulls.
+    """
+
+    def __init__(self, top_n=10):
+        self.ns = {}
+        self.lines_out = {}
+        self.chars_out = {}
+        self.lines_dropped = {}
+        self.counts = {}
+        self.top_n = top_n
+        self.slowest = []  # min-heap of (ns, path)
+        self.order = []  # stage names in pipeline order
+        self._charged = 0
+
+    def add(self, stage, ns):
+        self.ns[stage] = self.ns.get(stage, 0) + ns
+        self._charged += ns
+
+    def count(self, key, n=1):
+        self.counts[key] = self.counts.get(key, 0) + n
+
+    def timed(self, stage, batches):
+        """Pass batches through, charging their production to stage."""
+        self.order.append(stage)
+        return self._timed(stage, iter(batches))
+
+    def _timed(self, stage, it):
+        clock = time.perf_counter_ns
+        while True:
+            t0 = clock()
+            upstream = self._charged
+            batch = next(it, None)
+            self.add(stage, clock() - t0 - (self._charged - upstream))
+            if batch is None:
+                return
+            n = len(batch)
+            chars = sum(map(len, batch))
+            if isinstance(batch, JoinedLines):
+                chars += n  # the implied newlines
+            self.lines_out[stage] = self.lines_out.get(stage, 0) + n
+            self.chars_out[stage] = self.chars_out.get(stage, 0) + chars
+            yield batch
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """Charge the enclosed block to stage (minus nested stages)."""
+        t0 = time.perf_counter_ns()
+        upstream = self._charged
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter_ns() - t0 - (self._charged - upstream))
+
+    def finish_file(self, path, ns):
+        """Close out one file's stats: lines dropped and total time."""
+        out = self.lines_out
+        for prev, stage in zip(self.order, self.order[1:]):
+            dropped = out.get(prev, 0) - out.get(stage, 0)
+            if dropped > 0:
+                self.lines_dropped[stage] = dropped
+        self.ns["render"] = ns
+        self.slowest = [(ns, str(path))]
+
+    def merge(self, other):
+        for mine, theirs in (
+            (self.ns, other.ns),
+            (self.lines_out, other.lines_out),
+            (self.chars_out, other.chars_out),
+            (self.lines_dropped, other.lines_dropped),
+            (self.counts, other.counts),
+        ):
+            for key, value in theirs.items():
+                mine[key] = mine.get(key, 0) + value
+        for item in other.slowest:
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def report(self, wall_ns):
+        stages = {}
+        for stage in self.ns:
+            stages[stage] = {
+                "seconds": round(self.ns[stage] / 1e9, 6),
+                "lines_out": self.lines_out.get(stage),
+                "chars_out": self.chars_out.get(stage),
+                "lines_dropped": self.lines_dropped.get(stage),
+            }
+        return {
+            "wall_seconds": round(wall_ns / 1e9, 6),
+            "counts": dict(self.counts),
+            "stages": stages,
+            "slowest_files": [
+                {"path": path, "seconds": round(ns / 1e9, 6)}
+                for ns, path in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def summary(self, wall_ns):
+        """Plain-text table of the report, slowest stages first."""
+        rows = [f"{'stage':<16}{'seconds':>10}{'share':>8}{'lines out':>12}"
+                f"{'dropped':>10}"]
+        for stage, ns in sorted(self.ns.items(), key=lambda kv: -kv[1]):
+            if stage == "render":
+                continue
+            share = ns / wall_ns if wall_ns else 0
+            rows.append(
+                f"{stage:<16}{ns / 1e9:>10.3f}{share:>8.1%}"
+                f"{self.lines_out.get(stage, ''):>12}"
+                f"{self.lines_dropped.get(stage, ''):>10}"
+            )
+        rows.append(f"{'wall':<16}{wall_ns / 1e9:>10.3f}")
+        rows.append("(stage times are summed over workers)")
+        c = Counter(self.counts)
+        rows.append(
+            f"files: {c['rendered']} rendered, {c['cache_hits']} cached, "
+            f"{c['errors']} errors; {c['bytes_in'] / 1e6:.2f} MB in, "
+            f"{c['bytes_out'] / 1e6:.2f} MB out"
+        )
+        for ns, path in sorted(self.slowest, reverse=True):
+            rows.append(f"  {ns / 1e6:>9.1f} ms  {path}")
+        return "\n".join(rows)
+
+
+# Read once: os.umask() can only be read by setting it, which races threads
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def _temp_for(target):
+    """(fd, path) of a new temp file next to target, to os.replace() it
+    with. mkstemp() creates it 0600; it gets the mode open() would give
+    target, so replacing doesn't make outputs private."""
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(target) or ".",
+        prefix=os.path.basename(target),
+        suffix=".tmp",
+    )
+    if hasattr(os, "fchmod"):  # not on Windows, where mode bits don't apply
+        os.fchmod(fd, 0o666 & ~_UMASK)
+    return fd, tmp
+
+
+class ChunkWriter:
+    """Stream blocks to '{base}{ext}', or to '{base}_{idx}{ext}' chunks.
+
+    A new chunk starts when adding a block would push the current one past
+    split_at lines. Each file is written to a temp file next to it and
+    renamed into place once complete, so readers never see partial output.
+
+    With track=True, 'index' maps each finished chunk's idx to its file,
+    size and sha1 plus, for every tagged block in it, the byte offset,
+    length, header length (through the first line that isn't blank),
+    first line, line count and sha1 (see CodeAggregator._write_manifest).
+    """
+
+    def __init__(self, base, ext, split_at=0, track=False):
+        self.base = base
+        self.ext = ext
+        self.split_at = split_at
+        self.track = track
+        self.idx = 1
+        self.line_count = 0
+        self.written = []
+        self.index = {}
+        self._fh = None
+        self._tmp = None
+
+    def _target(self):
+        if self.split_at <= 0:
+            return f"{self.base}{self.ext}"
+        return f"{self.base}_{self.idx}{self.ext}"
+
+    def _open(self):
+        target = self._target()
+        fd, self._tmp = _temp_for(target)
+        self._fh = os.fdopen(fd, "wb")
+        self._size = self._newlines = 0
+        self._hash = hashlib.sha1() if self.track else None
+        self._blocks = []
+
+    def _put(self, block: str, tag):
+        data = block.encode("utf-8")
+        newlines = block.count("\n")
+        if self.track:
+            if tag is not None:
+                head = len(block[: block.find("\n", 1) + 1].encode("utf-8"))
+                self._blocks.append(
+                    (tag, self._size, len(data), head, self._newlines + 1,
+                     newlines, hashlib.sha1(data).hexdigest())
+                )
+            self._hash.update(data)
+        self._fh.write(data)
+        self._size += len(data)
+        self._newlines += newlines
+        self.line_count += newlines + 1
+
+    def _finish(self):
+        if self._fh is None:
+            return
+        self._fh.close()
+        target = self._target()
+        os.replace(self._tmp, target)
+        self.written.append(target)
+        if self.track:
+            self.index[self.idx] = (
+                target, self._size, self._hash.hexdigest(), self._blocks
+            )
+        if self.split_at > 0:
+            app.logger.info(f"Wrote {self.line_count} lines to {target}")
+            self.idx += 1
+        self._fh = self._tmp = None
+        self.line_count = 0
+
+    def write(self, block: str, tag=None):
+        count = block.count("\n") + 1
+        if self._fh is not None and self._starts_chunk(count):
+            self._finish()
+        if self._fh is None:
+            self._open()
+        self._put(block, tag)
+
+    def _starts_chunk(self, count):
+        return self.split_at > 0 and self.line_count + count > self.split_at
+
+    def plan(self, items):
+        """Group (tag, block) items into chunks exactly as write() would."""
+        chunks = []
+        self.line_count = 0
+        for item in items:
+            count = item[1].count("\n") + 1
+            if not chunks or self._starts_chunk(count):
+                chunks.append([])
+                self.line_count = 0
+            chunks[-1].append(item)
+            self.line_count += count
+        self.line_count = 0
+        return chunks or [[]]
+
+    def write_chunk(self, idx, items):
+        """Atomically rewrite chunk idx on its own (used by watch mode)."""
+        self.idx = idx
+        self._open()
+        for tag, block in items:
+            self._put(block, tag)
+        self._finish()
+
+    def close(self):
+        if self._fh is None and self.split_at <= 0 and not self.written:
+            self._open()  # unsplit output always exists, even if empty
+        self._finish()
+
+    def abort(self):
+        if self._fh is not None:
+            self._fh.close()
+            os.unlink(self._tmp)
+            self._fh = self._tmp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class Inotify:
+    """Minimal Linux inotify via ctypes: watch dirs, wait for any event.
+
+    Raises OSError where inotify isn't available, so callers can fall back
+    to polling.
+    """
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    # | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200 | 0x400
+
+    def __init__(self):
+        name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(name, use_errno=True) if name else None
+        if libc is None or not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = set()
+
+    def add(self, path):
+        path = os.fsencode(path)
+        if path in self._watched:
+            return
+        if self._libc.inotify_add_watch(self.fd, path, self.MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path!r}")
+        self._watched.add(path)
+
+    def wait(self, timeout):
+        """True if any event arrived within timeout seconds (drains them)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+# ----------------------
+# Git index / .gitignore
+# ----------------------
+# Used by CodeAggregator(source="git"); everything here reads the local
+# repository only, no remote or network access.
+
+GITLINK_MODE = 0o160000
+
+
+def find_git_dir(start: Path):
+    """Return (work_tree, git_dir) of the repo containing start, or None.
+
+    Follows 'gitdir: ...' files as used by worktrees and submodules.
+    """
+    for top in (start, *start.parents):
+        dot_git = top / ".git"
+        if dot_git.is_dir():
+            return top, dot_git
+        if dot_git.is_file():
+            try:
+                line = dot_git.read_text(encoding="utf-8").strip()
+            except OSError:
+                return None
+            if line.startswith("gitdir:"):
+                git_dir = Path(line[len("gitdir:"):].strip())
+                return top, git_dir if git_dir.is_absolute() else top / git_dir
+            return None
+    return None
+
+
+def read_git_index(index_path):
+    """Yield the tracked paths (str, repo-relative, '/'-separated) of a
+    .git/index file, in index order.
+
+    Understands index versions 2-4. Raises ValueError for anything it
+    doesn't (split or sparse indexes), so callers can ask git instead.
+    """
+    data = Path(index_path).read_bytes()
+    if len(data) < 12:
+        raise ValueError("truncated git index")
+    signature, version, count = struct.unpack_from(">4sLL", data)
+    if signature != b"DIRC" or version not in (2, 3, 4):
+        raise ValueError(f"unsupported git index (version {version})")
+
+    paths = []
+    pos, prev = 12, b""
+    for _ in range(count):
+        start = pos
+        mode = struct.unpack_from(">L", data, pos + 24)[0]
+        flags = struct.unpack_from(">H", data, pos + 60)[0]
+        pos += 62
+        if version >= 3 and flags & 0x4000:  # extended flags
+            pos += 2
+        if version == 4:
+            # Path is prefix-compressed against the previous entry
+            c = data[pos]
+            pos += 1
+            strip = c & 0x7F
+            while c & 0x80:
+                c = data[pos]
+                pos += 1
+                strip = ((strip + 1) << 7) | (c & 0x7F)
+            end = data.index(b"\0", pos)
+            name = prev[: len(prev) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            end = data.index(b"\0", pos)
+            name = data[pos:end]
+            # Entries are NUL-padded to a multiple of 8 bytes
+            pos = start + ((end - start + 8) & ~7)
+        prev = name
+        if mode == 0o040000:  # sparse directory entry
+            raise ValueError("sparse git index")
+        # Skip submodules and extra merge stages of conflicted paths
+        if mode != GITLINK_MODE and not (flags >> 12) & 3:
+            paths.append(os.fsdecode(name))
+
+    while pos + 8 <= len(data) - 20:
+        ext, size = struct.unpack_from(">4sL", data, pos)
+        if ext == b"link":
+            raise ValueError("split git index")
+        pos += 8 + size
+    return paths
+
+
+def _gitignore_regex(pattern: str) -> str:
+    """Translate one .gitignore pattern (no '!' or trailing '/') to a
+    regex matched against a '/'-separated path relative to the
+    .gitignore's directory."""
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                if i + 2 == n:
+                    out.append(".*")
+                    i += 2
+                    continue
+                if pattern[i + 2] == "/":
+                    out.append("(?:.*/)?")
+                    i += 3
+                    continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            close = pattern.find("]", i + 2)
+            if close < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : close]
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                out.append("[" + body + "]")
+                i = close
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ("" if anchored else "(?:.*/)?") + "".join(out)
+
+
+class GitIgnore:
+    """Compiled .gitignore matcher.
+
+    Rules are added per directory (repo-relative parts) from .gitignore
+    files as the walk enters them. Deeper files override shallower ones
+    and, within a file, the last matching rule wins.
+    """
+
+    def __init__(self):
+        self._levels = {}  # dir parts -> [(regex, negate, dir_only)]
+
+    def add_file(self, dir_parts: tuple, path):
+        try:
+            lines = Path(path).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return
+        rules = []
+        for line in lines.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            # Trailing spaces are dropped unless escaped
+            stripped = line.rstrip(" ")
+            if stripped.endswith("\\") and len(stripped) < len(line):
+                stripped += " "
+            line = stripped
+            negate = line.startswith("!")
+            if negate or line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            regex = re.compile(_gitignore_regex(line), re.DOTALL)
+            rules.append((regex.fullmatch, negate, dir_only))
+        if rules:
+            self._levels.setdefault(dir_parts, []).extend(rules)
+
+    def ignored(self, parts: tuple, is_dir: bool) -> bool:
+        for depth in range(len(parts) - 1, -1, -1):
+            rules = self._levels.get(parts[:depth])
+            if not rules:
+                continue
+            rel = "/".join(parts[depth:])
+            for match, negate, dir_only in reversed(rules):
+                if (is_dir or not dir_only) and match(rel):
+                    return not negate
+        return False
+
+
+# ----------------------
+# Comment lexers
+# ----------------------
+# Single pass over the text, linear time. Strings, template literals and
+# regex literals are skipped whole, so "//" or "#" inside them survive.
+# An unterminated block comment is left as-is, and so is the rest of a
+# line whose regex literal is never closed.
+
+
+def _glue(text, start, end):
+    """Space to put back for a comment at text[start:end] that separated
+    two tokens (e.g. 'a/**/b'); empty otherwise."""
+    before = text[start - 1 : start]
+    after = text[end : end + 1]
+    if before and after and not before.isspace() and not after.isspace():
+        return " "
+    return ""
+
+
+def _js_regex_allowed(prev: str) -> bool:
+    """Can a "/" after token 'prev' start a regex literal?"""
+    if not prev:
+        return True
+    if prev in JS_REGEX_KEYWORDS:
+        return True
+    if prev == "++" or prev == "--":
+        return False  # postfix: 'a++ / 2' divides
+    return prev[-1] in "([{,;:=!&|?+-*%<>~^/"
+
+
+def _trim_back(text, start, floor):
+    """Move start left over spaces/tabs, so 'x = 1;  // c' drops them too."""
+    while start > floor and text[start - 1] in " \t":
+        start -= 1
+    return start
+
+
+def _lex_js(text: str, brackets: bool = False) -> list:
+    """(kind, start, end) for JS comments ("//", "/*") and, with
+    brackets=True, for code brackets outside strings, templates and
+    regexes ("(", ")", "{", "}"). Stops at an unterminated comment.
+
+    Without brackets only comments are tokens (braces are counted inside
+    a template's ${ } alone), which is what strip_js_comments needs.
+    """
+    events = []
+    add = events.append
+    pos = 0
+    braces = []  # open '{' count inside each enclosing '${'
+    # Comment spans so far, for prev_token to step over; only a '/' needs
+    # the token before it, so comments don't look back themselves
+    starts, ends = [], []
+
+    def prev_token(at):
+        """Last significant token before 'at', for regex-vs-division."""
+        j, k = at, len(ends) - 1
+        while True:
+            floor = ends[k] if k >= 0 else 0
+            while j > floor and text[j - 1].isspace():
+                j -= 1
+            if j > floor or k < 0:
+                break
+            j = starts[k]  # a comment separates tokens like a space
+            k -= 1
+        if j == 0:
+            return ""
+        c = text[j - 1]
+        if "a" <= c <= "z":  # maybe a keyword (other words end operands)
+            return JS_WORD_TAIL_RE.search(text, max(floor, j - 16), j).group()
+        if c == "+" or c == "-":
+            # 'a+++b' is 'a++ + b': a run ends in '++' when its length is even
+            i = j - 1
+            while i > floor and text[i - 1] == c:
+                i -= 1
+            if (j - i) % 2 == 0:
+                return c + c
+        return c
+
+    tokens = JS_TOKEN_BRACKETS_RE.match if brackets else JS_TOKEN_RE.match
+    in_template = JS_TOKEN_BRACES_RE.match
+    template_body = JS_TEMPLATE_RE.match
+    while True:
+        m = (tokens if brackets or not braces else in_template)(text, pos)
+        kind = m.lastgroup
+        if kind == "end" or kind == "open":
+            break  # an unterminated comment leaves the rest as-is
+        start = m.start(kind)
+
+        if kind == "lc" or kind == "bc":
+            pos = m.end()
+            starts.append(start)
+            ends.append(pos)
+            add(("//" if kind == "lc" else "/*", start, pos))
+            continue
+        if kind == "rb" and braces and braces[-1] == 0:
+            braces.pop()
+            kind = "tpl"  # the ${ } is closed: back in the template body
+        if kind == "tpl":
+            pos = template_body(text, start + 1).end()
+            if text.startswith("${", pos):
+                braces.append(0)
+                pos += 2
+            else:
+                pos += 1  # past the closing backtick
+        elif kind == "slash":
+            if _js_regex_allowed(prev_token(start)):
+                # A literal left open at the end of its line is not one;
+                # its line is skipped rather than rescanned from every '/'
+                pos = JS_REGEX_BODY_RE.match(text, start + 1).end()
+            else:
+                pos = start + 1
+        else:
+            if braces:
+                braces[-1] += kind == "lb"
+                braces[-1] -= kind == "rb"
+            if brackets:
+                add((m.group(kind), start, start + 1))
+            pos = start + 1
+    return events
+
+
+def strip_js_comments(text: str) -> str:
+    out = []  # kept slices; comments are the gaps between them
+    keep_from = 0
+    for kind, start, end in _lex_js(text):
+        if kind == "//":
+            out.append(text[keep_from : _trim_back(text, start, keep_from)])
+        else:
+            out.append(text[keep_from:start])
+            out.append(_glue(text, start, end))
+        keep_from = end
+    out.append(text[keep_from:])
+    return "".join(out)
+
+
+def strip_css_comments(text: str, line_comments: bool = False) -> str:
+    """Strip /* */ comments (and // comments for SCSS/Less)."""
+    out = []
+    keep_from = pos = 0
+    tokens = CSS_LINE_TOKEN_RE if line_comments else CSS_TOKEN_RE
+    find = text.find
+    block = -1  # next "/*" at or after pos, if known
+
+    while True:
+        # Plain CSS: most comments have no quote before them since the last
+        # token, so find them with str.find and leave the lexer the rest
+        if not line_comments and block < pos:
+            block = find("/*", pos)
+            if block < 0:
+                break
+        if (
+            not line_comments
+            and find("'", pos, block) < 0
+            and find('"', pos, block) < 0
+        ):
+            start, pos = block, find("*/", block + 2) + 2
+            if pos == 1:
+                break  # unterminated, as below
+            kind = "bc"
+        else:
+            m = tokens.match(text, pos)
+            kind = m.lastgroup
+            if kind == "end" or kind == "open":
+                break  # an unterminated comment keeps the rest as-is
+            start, pos = m.span(kind)
+        if kind == "bc":
+            out.append(text[keep_from:start])
+            out.append(_glue(text, start, pos))
+        else:
+            out.append(text[keep_from : _trim_back(text, start, keep_from)])
+        keep_from = pos
+
+    out.append(text[keep_from:])
+    return "".join(out)
+
+
+def strip_html_comments(text: str) -> str:
+    """Strip <!-- --> and Jinja {# #}; lex <script>/<style> bodies too."""
+    out = []
+    pos = 0
+
+    while True:
+        m = HTML_SPECIAL_RE.search(text, pos)
+        if not m:
+            out.append(text[pos:])
+            break
+        start = m.start()
+        out.append(text[pos:start])
+
+        tag = m.group(1)
+        if tag is None:
+            closer = "-->" if m.group() == "<!--" else "#}"
+            end = text.find(closer, m.end())
+            if end < 0:
+                out.append(text[start:])
+                break
+            pos = end + len(closer)
+            continue
+
+        tag = tag.lower()
+        gt = text.find(">", m.end())
+        if gt < 0:
+            out.append(text[start:])
+            break
+        close = HTML_CLOSE_RE[tag].search(text, gt + 1)
+        body_end = close.start() if close else len(text)
+        body = text[gt + 1 : body_end]
+        out.append(text[start : gt + 1])
+        out.append(strip_js_comments(body) if tag == "script" else strip_css_comments(body))
+        pos = body_end
+
+    return "".join(out)
+
+
+def strip_py_comments(text: str) -> str:
+    """Strip comments found by tokenize; comment-only lines are dropped.
+
+    If tokenize gives up part way (e.g. on a file cut by a line cap), lines
+    it never reached fall back to dropping lines that start with '#'.
+    """
+    lines = list(io.StringIO(text))
+    comments = {}  # row -> column where the comment starts
+    reached = 0
+
+    try:
+        readline = functools.partial(next, iter(lines), "")
+        for tok in tokenize.generate_tokens(readline):
+            reached = tok.end[0]
+            if tok.type == tokenize.COMMENT:
+                comments[tok.start[0]] = tok.start[1]
+    except (tokenize.TokenError, SyntaxError):
+        pass
+
+    out = []
+    for row, line in enumerate(lines, 1):
+        col = comments.get(row)
+        if col is not None:
+            code = line[:col].rstrip()
+            if code:
+                out.append(code + line[len(_chomp(line)) :])
+        elif row > reached and line.lstrip().startswith("#"):
+            continue
+        else:
+            out.append(line)
+
+    return "".join(out)
+
+
+# extension -> comment stripper; other types are left untouched
+COMMENT_STRIPPERS = {
+    ".py": strip_py_comments,
+    ".js": strip_js_comments,
+    ".mjs": strip_js_comments,
+    ".cjs": strip_js_comments,
+    ".css": strip_css_comments,
+    ".scss": functools.partial(strip_css_comments, line_comments=True),
+    ".less": functools.partial(strip_css_comments, line_comments=True),
+    ".html": strip_html_comments,
+    ".htm": strip_html_comments,
+}
+
+
+# parent tag -> child tag capped at HTML_TRUNCATE_ITEMS
+HTML_CAPPED_CHILDREN = {"ul": "li", "ol": "li", "tbody": "tr", "select": "option"}
+HTML_COLLAPSED_TAGS = frozenset(("nav", "header", "footer", "aside"))
+HTML_VOID_TAGS = frozenset(
+    "area base br col embed hr img input link meta param source track wbr".split()
+)
+
+
+class HTMLStubParser(HTMLParser):
+    """Single-pass HTML stubber over html.parser events (no tree).
+
+    Kept markup is copied through as written; script/style bodies are
+    replaced, capped lists lose their extra items and nav/header/footer/
+    aside are emptied, each leaving a marker behind like the bs4 engine.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.out = []
+        self.stack = []  # open tag names
+        self.counts = []  # direct capped children seen, per open tag
+        self.hide_at = None  # stack depth whose close ends hiding
+
+    def stub(self, content: str) -> str:
+        self.feed(content)
+        self.close()
+        return "".join(self.out)
+
+    def _emit(self, text):
+        if self.hide_at is None:
+            self.out.append(text)
+
+    def _push(self, tag):
+        self.stack.append(tag)
+        self.counts.append(0)
+
+    def _pop(self):
+        """Close the innermost open tag, ending hiding and capping."""
+        depth = len(self.stack)
+        tag = self.stack.pop()
+        count = self.counts.pop()
+        if self.hide_at == depth:
+            self.hide_at = None
+            if tag in HTML_COLLAPSED_TAGS:
+                self.out.append(f"<!-- ... Full '{tag}' omitted ... -->")
+        child = HTML_CAPPED_CHILDREN.get(tag)
+        if child and count > HTML_TRUNCATE_ITEMS:
+            self._emit(
+                f"<!-- ... {count - HTML_TRUNCATE_ITEMS} "
+                f"more '{child}' omitted ... -->"
+            )
+        return tag
+
+    def handle_starttag(self, tag, attrs):
+        # <li> closes an unclosed sibling <li> (same for tr/option)
+        if (
+            len(self.stack) > 1
+            and self.stack[-1] == tag
+            and HTML_CAPPED_CHILDREN.get(self.stack[-2]) == tag
+        ):
+            self._pop()
+
+        capped = bool(self.stack) and HTML_CAPPED_CHILDREN.get(self.stack[-1]) == tag
+        if capped:
+            self.counts[-1] += 1
+            if self.counts[-1] > HTML_TRUNCATE_ITEMS and self.hide_at is None:
+                self.hide_at = len(self.stack) + 1
+
+        self._emit(self.get_starttag_text())
+        if tag in HTML_VOID_TAGS:
+            if capped and self.hide_at == len(self.stack) + 1:
+                self.hide_at = None
+            return
+        self._push(tag)
+        if tag in HTML_COLLAPSED_TAGS and self.hide_at is None:
+            self.hide_at = len(self.stack)
+
+    def handle_startendtag(self, tag, attrs):
+        self._emit(self.get_starttag_text())
+
+    def _close_top(self):
+        visible = self.hide_at is None
+        collapsed = self.hide_at == len(self.stack)
+        tag = self._pop()
+        if visible or (collapsed and tag in HTML_COLLAPSED_TAGS):
+            self.out.append(f"</{tag}>")
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            self._emit(f"</{tag}>")  # stray end tag: keep as written
+            return
+        while self.stack[-1] != tag:
+            self._pop()  # implicitly closed; no end tag in the source
+        self._close_top()
+
+    def handle_data(self, data):
+        if self.stack and self.stack[-1] in ("script", "style") and data.strip():
+            data = f"// ... Inline {self.stack[-1]} omitted ..."
+        self._emit(data)
+
+    def handle_entityref(self, name):
+        self._emit(f"&{name};")
+
+    def handle_charref(self, name):
+        self._emit(f"&#{name};")
+
+    def handle_comment(self, data):
+        self._emit(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self._emit(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self._emit(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self._emit(f"<![{data}]>")
+
+
+# Lines as ast numbers them (only \r\n, \r and \n end a line)
+PY_LINE_RE = re.compile(r"[^\r\n]*(?:\r\n?|\n)|[^\r\n]+")
+PY_DEFS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+PY_BODY_OMITTED = "... # Body omitted"
+
+
+def _py_defs(stmts):
+    """Defs/classes in a statement list, in order, including those nested
+    in if/try/with/for/while blocks (but not inside other defs)."""
+    for node in stmts:
+        if isinstance(node, PY_DEFS):
+            yield node
+            continue
+        for field in ("body", "orelse", "finalbody", "handlers", "cases"):
+            inner = getattr(node, field, None)
+            if isinstance(inner, list):
+                yield from _py_defs(inner)
+
+
+def _py_docstring_line(node):
+    doc = ast.get_docstring(node)
+    if not doc or not doc.strip():
+        return None
+    return doc.strip().splitlines()[0]
+
+
+def outline_py(content: str) -> str:
+    """Python outline from the AST: decorators, signatures, class bodies
+    and first docstring lines are kept; function bodies become '...'."""
+    lines = PY_LINE_RE.findall(content)
+    tree = ast.parse(content)
+    out = []
+
+    def block(stmts, start, end):
+        """Emit lines[start:end], replacing each def in stmts."""
+        for node in _py_defs(stmts):
+            first = min([d.lineno for d in node.decorator_list] + [node.lineno])
+            out.extend(lines[start : first - 1])
+            definition(node, first - 1)
+            start = node.end_lineno
+        out.extend(lines[start:end])
+
+    def definition(node, first):
+        head = node.body[0]
+        # Header: decorators and signature, up to the first body statement
+        out.extend(lines[first : head.lineno - 1])
+        prefix = lines[head.lineno - 1][: head.col_offset]
+        inline = bool(prefix.strip())  # 'class E(Exception): pass'
+        if inline:
+            out.append(prefix.rstrip() + "\n")
+            indent = " " * (node.col_offset + 4)
+        else:
+            indent = prefix
+
+        doc = _py_docstring_line(node)
+        if doc is not None:
+            out.append(f'{indent}"""{doc}"""\n')
+
+        body = node.body[1:] if doc is not None else node.body
+        if not isinstance(node, ast.ClassDef):
+            out.append(f"{indent}{PY_BODY_OMITTED}\n")
+        elif inline or not body:
+            if doc is None:
+                out.append(f"{indent}...\n")
+        else:
+            start = node.body[0].end_lineno if doc is not None else head.lineno - 1
+            block(body, start, node.end_lineno)
+            if not out[-1].endswith(("\n", "\r")):
+                out[-1] += "\n"
+
+    block(tree.body, 0, len(lines))
+    return "".join(out)
+
+
+JS_SIG_RE = re.compile(
+    r"(\s*)(?:class\s+\w+|function\s*\w*\s*\(.*\)\s*\{|"
+    r"(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?\(.*\)\s*=>\s*\{|"
+    r"\w+\s*:\s*(?:async\s*)?function\s*\(.*\)\s*\{|"
+    r"(?:get|set)\s+\w+\(.*\)\s*\{|"
+    r"(?:async\s+)?\w+\s*\(.*\)\s*\{)"
+)
+JS_NOT_SIG_RE = re.compile(r"\s*(?:class|if|for|while|switch|catch|with)\b")
+
+
+def outline_js(content: str) -> str:
+    """JS outline: function and method bodies become a placeholder, with
+    braces matched by _lex_js so strings, regexes and templates can't
+    unbalance them. Class bodies are kept so their methods show."""
+    pairs = {}
+    parens, braces, stack = [], [], []
+    for kind, start, _ in _lex_js(content, brackets=True):
+        if kind == "(" or kind == "{":
+            (parens if kind == "(" else braces).append(start)
+            stack.append(start)
+        elif kind == ")" or kind == "}":
+            opener = "(" if kind == ")" else "{"
+            if stack and content[stack[-1]] == opener:
+                pairs[stack.pop()] = start
+
+    def body_span(line_start, line_end):
+        """(open, close) of the function body a signature line starts."""
+        i = bisect.bisect_left(parens, line_start)
+        if i == len(parens) or parens[i] >= line_end or parens[i] not in pairs:
+            return None
+        close_paren = pairs[parens[i]]
+        j = bisect.bisect_right(braces, close_paren)
+        if j == len(braces) or braces[j] not in pairs:
+            return None
+        open_brace = braces[j]
+        if content[close_paren + 1 : open_brace].strip() not in ("", "=>"):
+            return None
+        return open_brace, pairs[open_brace]
+
+    out = []
+    pos, n = 0, len(content)
+    while pos < n:
+        eol = content.find("\n", pos)
+        line_end = n if eol < 0 else eol + 1
+        m = JS_SIG_RE.match(content, pos, line_end)
+        span = None
+        if m and not JS_NOT_SIG_RE.match(content, pos, line_end):
+            span = body_span(pos, line_end)
+        if span is None or span[1] < line_end:
+            out.append(content[pos:line_end])  # not a body, or a one-liner
+            pos = line_end
+            continue
+
+        open_brace, close_brace = span
+        indent = m.group(1).lstrip("\r\n")
+        eol = content.find("\n", close_brace)
+        pos = n if eol < 0 else eol + 1
+        out.append(content[m.start() : open_brace + 1].rstrip() + "\n")
+        out.append(f"{indent}  // ... Body omitted\n")
+        out.append(indent + content[close_brace:pos].rstrip("\r\n") + "\n")
+    return "".join(out)
+
+
+class JoinedLines(list):
+    """A pipeline batch of bare lines, each implicitly followed by a newline.
+
+    Stages that stand in for a newline join emit these, so no per-line
+    string is built just to put the line break back.
+    """
+
+
+def _chomp(line: str) -> str:
+    """Strip one trailing line break, as splitlines() would."""
+    if line.endswith("\r\n"):
+        return line[:-2]
+    if line and line[-1] in LINE_BREAKS:
+        return line[:-1]
+    return line
+
+
+# Per-process aggregator used by process pool workers (set by
+# _init_worker); thread pools map the aggregator's own bound method, so
+# aggregators rendering at once in one process don't share it
+_worker_aggregator = None
+
+
+def _init_worker(aggregator):
+    global _worker_aggregator
+    _worker_aggregator = aggregator
+
+
+def _render_in_worker(job):
+    return _worker_aggregator._render_job(job)
+
 
 class CodeAggregator:
     def __init__(
@@ -34,6 +1461,7 @@ class CodeAggregator:
         root_dir=".",
         output_filename="project_directory_full_code.txt",
         compaction_level="whitespace",  # 'none', 'whitespace', 'stubs'
+        html_stubs="stdlib",  # 'stdlib', 'bs4'
         comments=False,
         include_dirtree=True,
         include_description=True,
@@ -41,15 +1469,30 @@ class CodeAggregator:
         exclude_files=None,
         include_files=None,
         ignore_dirs=None,
+        source="walk",  # 'walk', 'git'
+        git_untracked=False,
         description_text="",
         print_only=None,
         split_at=8400,
         max_lines_per_file=None,
         truncate_lines=None,
+        use_cache=True,
+        cache_file=None,
+        cache_max_bytes=CACHE_MAX_BYTES,
+        workers=1,
+        worker_pool="auto",  # 'auto', 'process', 'thread'
+        max_file_bytes=MAX_FILE_BYTES,
+        dedupe=None,  # None, 'exact', 'compacted'
+        instrument=True,
+        report_file=None,
+        report_top=10,
+        manifest=True,
+        manifest_file=None,
     ):
         self.root_dir = Path(root_dir)
         self.output_filename = output_filename
         self.compaction_level = compaction_level
+        self.html_stubs = html_stubs
         self.comments = comments
         self.include_dirtree = include_dirtree
         self.include_description = include_description
@@ -70,6 +1513,11 @@ class CodeAggregator:
             int(max_lines_per_file) if max_lines_per_file else None
         )
         self.truncate_lines = int(truncate_lines) if truncate_lines else None
+        # 0/None => read whole files
+        self.max_file_bytes = int(max_file_bytes) if max_file_bytes else 0
+        # Identical files are emitted once; later copies reference the first
+        self.dedupe = dedupe if dedupe in ("exact", "compacted") else None
+        self._hash_memo = {}  # (path, size, mtime_ns) -> sha1 digest
 
         # Normalize extensions (case-insensitive, starts with ".")
         self.included_extensions = set(
@@ -77,14 +1525,15 @@ class CodeAggregator:
             for ext in (included_extensions or [])
         )
 
-        # Warn if HTML stubs requested but bs4 missing
+        # Warn if bs4 HTML stubs requested but bs4 missing
         if (
             self.compaction_level == "stubs"
+            and self.html_stubs == "bs4"
             and ".html" in self.included_extensions
             and BeautifulSoup is None
         ):
             app.logger.warning(
-                "HTML stubs enabled, but 'beautifulsoup4' not installed. "
+                "bs4 HTML stubs enabled, but 'beautifulsoup4' not installed. "
                 "HTML files won't be compacted."
             )
 
@@ -119,6 +1568,61 @@ class CodeAggregator:
 
         self.ignore_dirs = set(ignore_dirs) if ignore_dirs else set()
 
+        # Ignore entries as root-relative parts, so 'static/libs' can be
+        # matched while walking without resolving anything per file.
+        self._ignore_parts = set()
+        for d in self.ignore_dirs:
+            d_path = Path(d)
+            if d_path.is_absolute():
+                try:
+                    d_path = d_path.resolve().relative_to(self.root_dir.resolve())
+                except ValueError:
+                    continue
+            if d_path.parts:
+                self._ignore_parts.add(d_path.parts)
+
+        # source='git' lists files from the git index instead of walking;
+        # git_untracked adds untracked files that .gitignore doesn't exclude
+        self.source = source
+        self.git_untracked = git_untracked
+
+        # Cached result of _walk_tree(); reset at the start of aggregate()
+        self._file_index = None
+        # content hash -> stub text, or None while the hash was seen only
+        # once; reset at the start of aggregate()
+        self._stub_memo = {}
+
+        # Persistent block cache (see FileCache); None when bypassed
+        self.use_cache = use_cache
+        if cache_file is None:
+            cache_file = f"{os.path.splitext(self.output_filename)[0]}.cache.db"
+        self.cache_file = Path(cache_file)
+        self.cache_max_bytes = cache_max_bytes
+        self._cache = None
+        self._cache_opts = self._options_hash()
+
+        # workers: 1 => serial, 0/None => one per CPU
+        self.workers = int(workers) if workers else (os.cpu_count() or 1)
+        if self.workers < 1:
+            self.workers = 1
+        self.worker_pool = worker_pool
+
+        # Per-stage timings (see RunStats); report_file defaults next to
+        # the output as '<base>.report.json'
+        self.instrument = instrument
+        if report_file is None:
+            report_file = f"{os.path.splitext(self.output_filename)[0]}.report.json"
+        self.report_file = Path(report_file)
+        self.report_top = report_top
+        self._stats = None
+
+        # Byte-offset index of every block in the output chunks, written
+        # as '<base>.manifest.json' unless manifest_file says otherwise
+        self.manifest = manifest
+        if manifest_file is None:
+            manifest_file = f"{os.path.splitext(self.output_filename)[0]}.manifest.json"
+        self.manifest_file = Path(manifest_file)
+
         app.logger.info(
             "Initialized CodeAggregator with: "
             f"compaction_level={self.compaction_level}, "
@@ -127,8 +1631,40 @@ class CodeAggregator:
             f"included_extensions={self.included_extensions or '<ALL>'}, "
             f"split_at={self.split_at or 'OFF'}, "
             f"max_lines_per_file={self.max_lines_per_file or '∞'}, "
-            f"truncate_lines={self.truncate_lines or '—'}"
+            f"truncate_lines={self.truncate_lines or '—'}, "
+            f"cache={self.cache_file if self.use_cache else 'OFF'}, "
+            f"source={self.source}, "
+            f"workers={self.workers}"
+        )
+
+    def __getstate__(self):
+        # Pool workers only need the options, not the index or the cache
+        state = self.__dict__.copy()
+        state["_file_index"] = None
+        state["_cache"] = None
+        state["_stub_memo"] = {}
+        state["_stats"] = None
+        state["_hash_memo"] = {}
+        return state
+
+    def _options_hash(self) -> str:
+        """Hash of everything besides the file itself that shapes a block."""
+        try:
+            source = Path(__file__).read_bytes()
+        except OSError:
+            source = b""
+        opts = json.dumps(
+            [
+                self.compaction_level,
+                self.html_stubs,
+                self.comments,
+                self.max_lines_per_file,
+                self.truncate_lines,
+                self.max_file_bytes,
+                BeautifulSoup is not None,
+            ]
         )
+        return hashlib.sha1(source + opts.encode("utf-8")).hexdigest()
 
     def _parse_file_entry(self, file_entry):
         """Parse 'filename|start-end' or 'filename|N'."""
@@ -153,111 +1689,652 @@ class CodeAggregator:
             return file_entry, None
 
     def should_ignore_directory(self, file_path: Path) -> bool:
-        for d in self.ignore_dirs:
-            d_path = (self.root_dir / d).resolve()
+        try:
+            parts = file_path.resolve().relative_to(self.root_dir.resolve()).parts
+        except ValueError:
+            return False
+        except Exception as e:
+            app.logger.warning(f"Resolve failed: {file_path} due to {e}")
+            return False
+        return any(parts[:i] in self._ignore_parts for i in range(1, len(parts)))
+
+    def _is_ignored_dir(self, name: str, parts: tuple) -> bool:
+        return name in self.ignore_dirs or parts in self._ignore_parts
+
+    def _walk_tree(self):
+        """Index root_dir once and return (files, dirs).
+
+        'files' is a list of FileEntry sorted like
+        sorted(root_dir.rglob("*")); 'dirs' maps each indexed directory's
+        parts to its children as (name, is_dir, is_file) tuples, or None
+        if it couldn't be listed. With source='git' only the files git
+        knows about are indexed (see _git_tree), else the whole tree is
+        walked (see _scan_tree).
+        """
+        if self._file_index is not None:
+            return self._file_index
+
+        t0 = time.perf_counter_ns()
+        index = self._git_tree() if self.source == "git" else None
+        files, dirs = index or self._scan_tree()
+
+        # The git index is already in path order, so this is near-linear
+        files.sort(key=lambda e: e.parts)
+        self._file_index = (files, dirs)
+        if self._stats is not None:
+            self._stats.add("walk", time.perf_counter_ns() - t0)
+        app.logger.info(
+            f"Indexed {len(files)} files in {len(dirs)} directories."
+        )
+        return self._file_index
+
+    def _scan_tree(self):
+        """Walk root_dir with os.scandir, pruning ignored directories
+        before they are entered."""
+        files, dirs = [], {}
+        stack = [(str(self.root_dir), ())]
+
+        while stack:
+            dir_path, dir_parts = stack.pop()
             try:
-                if d_path in file_path.resolve().parents:
-                    return True
-            except Exception as e:
-                app.logger.warning(f"Resolve failed: {file_path} due to {e}")
-        return False
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                dirs[dir_parts] = None
+                continue
+
+            children = []
+            for entry in entries:
+                name = entry.name
+                parts = dir_parts + (name,)
+                try:
+                    is_dir = entry.is_dir()
+                    is_file = not is_dir and entry.is_file()
+                except OSError:
+                    is_dir = is_file = False
+
+                if is_dir:
+                    if self._is_ignored_dir(name, parts):
+                        continue
+                    children.append((name, True, False))
+                    # Like rglob, don't follow directory symlinks
+                    if not entry.is_symlink():
+                        stack.append((entry.path, parts))
+                    continue
+
+                children.append((name, False, is_file))
+                if is_file:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    path = Path(entry.path)
+                    files.append(
+                        FileEntry(path, parts, name, path.stem, path.suffix, st)
+                    )
+
+            dirs[dir_parts] = children
+
+        return files, dirs
+
+    def _git_tree(self):
+        """Index the files tracked in root_dir's git repository, without
+        entering untracked or ignored directories.
+
+        .git/index is parsed directly when possible, else 'git ls-files'
+        is run. None (after a warning) if root_dir isn't in a work tree.
+        """
+        root = self.root_dir.resolve()
+        found = find_git_dir(root)
+        if found is None:
+            app.logger.warning(f"{self.root_dir} is not in a git work tree; walking it.")
+            return None
+        top, git_dir = found
+        prefix = root.relative_to(top).parts
+
+        try:
+            paths = []
+            for rel in read_git_index(git_dir / "index"):
+                parts = tuple(rel.split("/"))
+                if parts[: len(prefix)] == prefix and len(parts) > len(prefix):
+                    paths.append(parts[len(prefix):])
+            if self.git_untracked:
+                paths += self._git_untracked(top, git_dir, prefix, set(paths))
+        except (OSError, ValueError) as e:
+            app.logger.debug(f"Git index not read directly ({e}), using git ls-files.")
+            cmd = ["git", "-C", str(root), "ls-files", "-z", "--cached"]
+            if self.git_untracked:
+                cmd += ["--others", "--exclude-standard"]
+            try:
+                out = subprocess.run(cmd, capture_output=True, check=True).stdout
+            except (OSError, subprocess.CalledProcessError) as e:
+                app.logger.warning(f"git ls-files failed ({e}); walking {self.root_dir}.")
+                return None
+            # Conflicted paths are listed once per stage
+            paths = list(dict.fromkeys(
+                tuple(rel.split("/")) for rel in os.fsdecode(out).split("\0") if rel
+            ))
+
+        return self._index_paths(paths)
+
+    def _git_untracked(self, top, git_dir, prefix, tracked):
+        """Root-relative parts of untracked files not excluded by
+        .gitignore or .git/info/exclude. Ignored directories and nested
+        repositories are never entered."""
+        ignore = GitIgnore()
+        ignore.add_file((), git_dir / "info" / "exclude")
+        for depth in range(len(prefix)):
+            ignore.add_file(prefix[:depth], top.joinpath(*prefix[:depth], ".gitignore"))
+
+        found = []
+        stack = [(self.root_dir, ())]
+        while stack:
+            dir_path, dir_parts = stack.pop()
+            ignore.add_file(prefix + dir_parts, dir_path / ".gitignore")
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                parts = dir_parts + (entry.name,)
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if parts in tracked or ignore.ignored(prefix + parts, is_dir):
+                    continue
+                if not is_dir:
+                    found.append(parts)
+                elif entry.name != ".git" and not os.path.lexists(
+                    os.path.join(entry.path, ".git")
+                ):
+                    stack.append((Path(entry.path), parts))
+        return found
+
+    def _index_paths(self, paths):
+        """Build (files, dirs) from root-relative parts, keeping regular
+        files outside ignore_dirs."""
+        files, dirs = [], {(): []}
+        dir_ok = {(): True}
+
+        def allowed(dir_parts):
+            ok = dir_ok.get(dir_parts)
+            if ok is None:
+                ok = dir_ok[dir_parts] = allowed(dir_parts[:-1]) and not (
+                    self._is_ignored_dir(dir_parts[-1], dir_parts)
+                )
+            return ok
+
+        for parts in paths:
+            if not allowed(parts[:-1]):
+                continue
+            path = self.root_dir.joinpath(*parts)
+            try:
+                st = path.stat()
+            except OSError:  # deleted from the work tree
+                continue
+            if not S_ISREG(st.st_mode):
+                continue
+            for depth in range(1, len(parts)):
+                if parts[:depth] not in dirs:
+                    dirs[parts[:depth]] = []
+                    dirs[parts[: depth - 1]].append((parts[depth - 1], True, False))
+            dirs[parts[:-1]].append((parts[-1], False, True))
+            files.append(FileEntry(path, parts, parts[-1], path.stem, path.suffix, st))
+        return files, dirs
 
     def _truncate_by_lines(self, text: str, limit: int, note: str) -> str:
         """Truncate to 'limit' lines."""
         if limit is None or limit <= 0:
             return text
-        lines = text.splitlines(keepends=True)
-        if len(lines) <= limit:
-            return text
-        omitted = len(lines) - limit
-        suffix = f"\n... (truncated, {omitted} more lines omitted; {note})"
-        return "".join(lines[:limit]) + suffix
+        batches = self._iter_truncate([text.splitlines(keepends=True)], limit, note)
+        return self._join_batches(batches)
+
+    def append_file_content(self, content_list, file_path: Path, stat=None):
+        """Read file, compact, and append (reusing cached blocks)."""
+        content_list.extend(self._render_jobs([(file_path, stat)]))
+
+    def _make_executor(self):
+        pool = self.worker_pool
+        if pool == "auto":
+            # The stub passes are CPU-bound
+            pool = "process" if self.compaction_level == "stubs" else "thread"
+        if pool == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self,),
+            )
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def _render_jobs(self, jobs):
+        """Render (file_path, stat) jobs into a list of blocks, in order."""
+        return list(self._iter_blocks(jobs))
+
+    def _iter_blocks(self, jobs, duplicates=None):
+        """Yield one rendered block per (file_path, stat) job, in order.
+
+        Jobs are handled in batches so only a bounded number of finished
+        blocks are held in memory when running on a pool. Paths in
+        'duplicates' (see _find_duplicates; computed from jobs if None)
+        get a reference block instead of being rendered.
+        """
+        jobs = list(jobs)
+        if duplicates is None:
+            duplicates = self._find_duplicates(jobs)
+        executor = None
+        batch_size = self.workers * 32 if self.workers > 1 else 1
+        try:
+            it = iter(jobs)
+            while True:
+                batch = list(itertools.islice(it, batch_size))
+                if not batch:
+                    break
+                todo = [job for job in batch if job[0] not in duplicates]
+                if executor is None and self.workers > 1 and len(todo) > 1:
+                    executor = self._make_executor()
+                rendered = iter(self._render_batch(todo, executor))
+                for file_path, _ in batch:
+                    if file_path in duplicates:
+                        if self._stats is not None:
+                            self._stats.count("duplicates")
+                        yield self._reference_block(
+                            file_path, f"identical to {duplicates[file_path]}"
+                        )
+                    else:
+                        yield next(rendered)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _reference_block(self, file_path, note):
+        return f"\n[-] This file: {file_path} | Contents:\n({note})\n\n" + "=" * 80 + "\n"
+
+    def _find_duplicates(self, jobs):
+        """Map each later copy of a file to the first job with the same bytes.
+
+        Only files sharing a size are hashed. Sliced files (line ranges)
+        and files under DEDUPE_MIN_BYTES are always rendered.
+        """
+        if not self.dedupe:
+            return {}
+        by_size = {}
+        for file_path, stat in jobs:
+            if stat is None or stat.st_size < DEDUPE_MIN_BYTES:
+                continue
+            if file_path.name.lower() in self.file_line_ranges:
+                continue
+            by_size.setdefault(stat.st_size, []).append((file_path, stat))
+
+        duplicates = {}
+        for group in by_size.values():
+            if len(group) < 2:
+                continue
+            first_with = {}
+            for file_path, stat in group:
+                digest = self._content_hash(file_path, stat)
+                if digest is None:
+                    continue
+                first = first_with.setdefault(digest, file_path)
+                if first != file_path:
+                    duplicates[file_path] = first
+        return duplicates
+
+    def _content_hash(self, file_path, stat):
+        """Streamed sha1 of a file, memoised by (path, size, mtime) for the
+        run and kept in the FileCache across runs."""
+        key = (file_path, stat.st_size, stat.st_mtime_ns)
+        digest = self._hash_memo.get(key)
+        if digest is not None:
+            return digest
+        cache = self._cache
+        if cache is not None:
+            digest = cache.get_digest(str(file_path), *key[1:])
+        if digest is None:
+            h = hashlib.sha1()
+            try:
+                with open(file_path, "rb") as fh:
+                    for block in iter(lambda: fh.read(READ_BLOCK_BYTES), b""):
+                        h.update(block)
+            except OSError:
+                return None
+            digest = h.digest()
+            if cache is not None:
+                cache.put_digest(str(file_path), *key[1:], digest)
+        self._hash_memo[key] = digest
+        return digest
+
+    def _fold_compacted(self, jobs, blocks, duplicates):
+        """With dedupe='compacted', replace blocks whose rendered body
+        matches an earlier one's (e.g. files differing only in comments
+        or whitespace) with a reference."""
+        if self.dedupe != "compacted":
+            yield from blocks
+            return
+        first_with = {}
+        for (file_path, _), block in zip(jobs, blocks):
+            body = block.split("\n", 2)[2]
+            if file_path not in duplicates and len(body) >= DEDUPE_MIN_BYTES:
+                digest = hashlib.sha1(body.encode("utf-8", "surrogatepass")).digest()
+                first = first_with.setdefault(digest, file_path)
+                if first != file_path:
+                    if self._stats is not None:
+                        self._stats.count("near_duplicates")
+                    block = self._reference_block(
+                        file_path, f"identical after compaction to {first}"
+                    )
+            yield block
+
+    def _render_job(self, job):
+        file_path, line_range = job
+        return self._render_file(file_path, line_range)
+
+    def _render_batch(self, jobs, executor=None):
+        blocks = [None] * len(jobs)
+        pending = []
+        stats = self._stats
+
+        for i, (file_path, stat) in enumerate(jobs):
+            if stats is not None and stat is not None:
+                stats.count("bytes_in", stat.st_size)
+            line_range = self.file_line_ranges.get(file_path.name.lower())
+            key = opts = st = None
+            if self._cache is not None:
+                try:
+                    st = stat or file_path.stat()
+                except OSError:
+                    st = None
+                key = str(file_path)
+                opts = f"{self._cache_opts}:{line_range}"
+                if st is not None:
+                    blocks[i] = self._cache.get(
+                        key, st.st_size, st.st_mtime_ns, opts
+                    )
+            if blocks[i] is None:
+                pending.append((i, file_path, line_range, key, opts, st))
+            elif stats is not None:
+                stats.count("cache_hits")
+
+        work = [(file_path, line_range) for _, file_path, line_range, *_ in pending]
+        if executor is not None and len(work) > 1:
+            chunksize = max(1, len(work) // (self.workers * 4))
+            if isinstance(executor, ProcessPoolExecutor):
+                render = _render_in_worker
+            else:
+                render = self._render_job
+            results = executor.map(render, work, chunksize=chunksize)
+        else:
+            results = (self._render_file(fp, lr) for fp, lr in work)
 
-    def append_file_content(self, content_list, file_path: Path):
-        """Read file, compact, and append."""
-        line_range = self.file_line_ranges.get(file_path.name.lower())
+        for (i, _, _, key, opts, st), (block, ok, file_stats) in zip(
+            pending, results
+        ):
+            if ok and st is not None and self._cache is not None:
+                self._cache.put(key, st.st_size, st.st_mtime_ns, opts, block)
+            if stats is not None and file_stats is not None:
+                stats.merge(file_stats)
+                stats.count("rendered" if ok else "errors")
+            blocks[i] = block
+
+        return blocks
+
+    def _render_file(self, file_path: Path, line_range):
+        """Return (block, ok, stats) for one file; ok is False on read
+        errors and stats is its RunStats (None when not instrumenting).
+
+        The file is streamed through the stages below as batches of lines.
+        Concatenated, a stage's batches give exactly
+        text.splitlines(keepends=True) of its whole-text equivalent.
+        """
+        extension = file_path.suffix.lower()
+        t0 = time.perf_counter_ns()
+        stats = RunStats() if self.instrument else None
+
+        def stage(name, batches):
+            return batches if stats is None else stats.timed(name, batches)
 
         try:
-            all_lines = file_path.read_text(
-                encoding="utf-8", errors="replace"
-            ).splitlines(keepends=True)
-
-            # Apply per-file slice
-            if line_range:
-                start, end = line_range
-                snippet = all_lines[start - 1 : end]
-                file_content = "".join(snippet)
-                range_info = f" (lines {start}-{end})"
-                if end < len(all_lines):
-                    omitted = len(all_lines) - end
-                    file_content += f"\n... (remaining {omitted} lines omitted)"
-            else:
-                file_content = "".join(all_lines)
-                range_info = ""
-
-            # Early hard cap
-            if self.max_lines_per_file:
-                file_content = self._truncate_by_lines(
-                    file_content,
-                    self.max_lines_per_file,
-                    note="early cap: max_lines_per_file",
-                )
+            with BoundedReader(file_path, self.max_file_bytes) as reader:
+                if reader.is_binary():
+                    header = f"\n[-] This file: {file_path} | Contents:\n"
+                    file_content = f"Binary file omitted ({reader.size} bytes)\n"
+                    if stats is not None:
+                        stats.count("binary")
+                        stats.finish_file(file_path, time.perf_counter_ns() - t0)
+                    return header + file_content + "\n" + "=" * 80 + "\n", True, stats
+
+                batches = stage("read", reader.batches())
+                # The first stage that stops early counts the rest via mmap
+                count_rest = reader.remaining_lines
+
+                # Apply per-file slice
+                if line_range:
+                    start, end = line_range
+                    batches = stage(
+                        "range", self._iter_range(batches, start, end, count_rest)
+                    )
+                    range_info = f" (lines {start}-{end})"
+                    count_rest = None
+                else:
+                    range_info = ""
+
+                # Early hard cap: lines past it are only counted
+                if self.max_lines_per_file:
+                    batches = stage(
+                        "truncate_early",
+                        self._iter_truncate(
+                            batches,
+                            self.max_lines_per_file,
+                            note="early cap: max_lines_per_file",
+                            count_rest=count_rest,
+                        ),
+                    )
 
+                batches = list(batches)
+                clipped_note = ""
+                if reader.clipped:
+                    clipped_note = (
+                        f"\n... (only the first {reader.limit} of {reader.size} "
+                        f"bytes read; max_file_bytes={self.max_file_bytes})"
+                    )
             header = f"\n[-] This file: {file_path}{range_info} | Contents:\n"
 
         except Exception as e:
             header = f"\n[-] This file: {file_path} | Contents:\n"
             file_content = f"Error reading file: {e}\n"
-            content_list.append(header + file_content + "\n" + "=" * 80 + "\n")
-            return
+            if stats is not None:
+                stats.finish_file(file_path, time.perf_counter_ns() - t0)
+            return header + file_content + "\n" + "=" * 80 + "\n", False, stats
 
         # Compaction / comment removal
         if self.compaction_level == "stubs":
-            file_content = self._create_stubs(file_content, file_path.suffix.lower())
+            batches = stage("stubs", self._iter_stubs(batches, extension))
 
         if not self.comments:
-            file_content = self.remove_comments(file_content, file_path.suffix.lower())
+            batches = stage(
+                "comments", self._iter_remove_comments(batches, extension)
+            )
 
         if self.compaction_level == "whitespace":
-            file_content = self._compact_whitespace(file_content)
+            batches = stage("compact", self._iter_compact(batches))
 
         # Post-mode truncation
         if self.compaction_level in ("none", "whitespace") and self.truncate_lines:
-            file_content = self._truncate_by_lines(
-                file_content,
-                self.truncate_lines,
-                note=f"post cap: truncate_lines={self.truncate_lines}",
+            batches = stage(
+                "truncate_post",
+                self._iter_truncate(
+                    batches,
+                    self.truncate_lines,
+                    note=f"post cap: truncate_lines={self.truncate_lines}",
+                ),
             )
 
-        content_list.append(header + file_content + "\n" + "=" * 80 + "\n")
+        file_content = self._join_batches(batches) + clipped_note
+        block = header + file_content + "\n" + "=" * 80 + "\n"
+        if stats is not None:
+            stats.finish_file(file_path, time.perf_counter_ns() - t0)
+        return block, True, stats
+
+    # ----------------------
+    # Line pipeline stages
+    # ----------------------
+
+    def _batch_text(self, batch) -> str:
+        if isinstance(batch, JoinedLines):
+            return "\n".join(batch) + "\n" if batch else ""
+        return "".join(batch)
+
+    def _join_batches(self, batches) -> str:
+        return "".join([self._batch_text(batch) for batch in batches])
+
+    def _slice_batch(self, batch, start, stop=None):
+        part = batch[start:stop]
+        return JoinedLines(part) if isinstance(batch, JoinedLines) else part
+
+    def _iter_joined(self, batches):
+        """Finish a stage that stands in for a newline join.
+
+        Its JoinedLines batches imply a line break after every line, but
+        a joined text has none after its very last line.
+        """
+        held = None
+        for batch in batches:
+            if not batch:
+                continue
+            if held is not None:
+                batch.insert(0, held)
+            held = batch.pop()
+            if batch:
+                yield batch
+        if held:
+            yield [held]
+
+    def _iter_with_suffix(self, batches, suffix):
+        """Yield batches, then append the text returned by suffix()."""
+        held = None  # last line seen, with its line break
+        for batch in batches:
+            if not batch:
+                continue
+            if held is not None:
+                yield [held]
+            held = batch.pop()
+            if isinstance(batch, JoinedLines):
+                held += "\n"
+            if batch:
+                yield batch
+        tail = suffix()
+        if held is not None:
+            if _chomp(held) != held:
+                yield [held]
+            else:
+                tail = held + tail
+        if tail:
+            yield tail.splitlines(keepends=True)
+
+    def _iter_range(self, batches, start, end, count_rest=None):
+        """Lines start..end (1-based); count_rest(), if given, counts the
+        lines after the batches pulled so far, so reading stops at 'end'."""
+        total = 0
+
+        def sliced():
+            nonlocal total
+            if start < 1 or end < 0:
+                # Odd ranges: keep Python's slice semantics exactly
+                all_lines = self._join_batches(batches).splitlines(keepends=True)
+                total = len(all_lines)
+                yield all_lines[start - 1 : end]
+                return
+            for batch in batches:
+                first, total = total, total + len(batch)
+                if first < end and total >= start:
+                    yield self._slice_batch(
+                        batch, max(start - 1 - first, 0), end - first
+                    )
+                if total >= end and count_rest is not None:
+                    total += count_rest()
+                    return
 
-    def _compact_whitespace(self, content: str) -> str:
-        return "\n".join(line.rstrip() for line in content.splitlines() if line.strip())
+        def note():
+            if end < total:
+                return f"\n... (remaining {total - end} lines omitted)"
+            return ""
 
-    def remove_comments(self, content: str, extension: str) -> str:
-        if extension == ".py":
-            return "\n".join(
-                line
-                for line in content.splitlines()
-                if not line.lstrip().startswith("#")
-            )
+        return self._iter_with_suffix(sliced(), note)
 
-        if extension == ".js":
-            no_block = re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL)
-            return "\n".join(line.split("//", 1)[0] for line in no_block.splitlines())
+    def _iter_truncate(self, batches, limit, note, count_rest=None):
+        """Keep the first 'limit' lines, then a note on how many were cut;
+        with count_rest() (see _iter_range) reading stops at the limit."""
+        if limit is None or limit <= 0:
+            return batches
+        kept = omitted = 0
+
+        def head():
+            nonlocal kept, omitted
+            for batch in batches:
+                room = limit - kept
+                if room >= len(batch):
+                    kept += len(batch)
+                    yield batch
+                else:
+                    if room > 0:
+                        kept = limit
+                        yield self._slice_batch(batch, 0, room)
+                    omitted += len(batch) - room
+                    if count_rest is not None:
+                        omitted += count_rest()
+                        return
+
+        def suffix():
+            if omitted:
+                return f"\n... (truncated, {omitted} more lines omitted; {note})"
+            return ""
+
+        return self._iter_with_suffix(head(), suffix)
+
+    def _iter_stubs(self, batches, extension):
+        text = self._join_batches(batches)
+        yield self._create_stubs(text, extension).splitlines(keepends=True)
+
+    def _iter_compact(self, batches):
+        return self._iter_joined(
+            JoinedLines([line.rstrip() for line in batch if line.strip()])
+            for batch in batches
+        )
 
-        if extension == ".html":
-            return content  # keep as-is for now
+    def _iter_remove_comments(self, batches, extension):
+        stripper = COMMENT_STRIPPERS.get(extension)
+        if stripper is None:
+            return batches
 
-        if extension == ".css":
-            return re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL)
+        def stripped():
+            text = stripper(self._join_batches(batches))
+            yield text.splitlines(keepends=True)
 
-        temp = re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL)
-        return "\n".join(
-            line.split("#", 1)[0].split("//", 1)[0] for line in temp.splitlines()
-        )
+        return stripped()
+
+    def _compact_whitespace(self, content: str) -> str:
+        batches = [content.splitlines(keepends=True)]
+        return self._join_batches(self._iter_compact(batches))
+
+    def remove_comments(self, content: str, extension: str) -> str:
+        stripper = COMMENT_STRIPPERS.get(extension)
+        return content if stripper is None else stripper(content)
 
     def _create_stubs(self, content: str, extension: str) -> str:
+        # Vendored or copied files repeat; a text's stub is kept once its
+        # hash comes round again, so unique files hold no memory
+        key = (
+            extension,
+            hashlib.sha1(content.encode("utf-8", "surrogatepass")).digest(),
+        )
+        stub = self._stub_memo.get(key)
+        if stub is None:
+            stub = self._create_stubs_for(content, extension)
+            self._stub_memo[key] = stub if key in self._stub_memo else None
+        return stub
+
+    def _create_stubs_for(self, content: str, extension: str) -> str:
         if extension == ".py":
             return self._create_stubs_py(content)
         if extension == ".js":
@@ -298,6 +2375,15 @@ class CodeAggregator:
             return content
 
     def _create_stubs_html(self, content: str) -> str:
+        if self.html_stubs != "bs4":
+            try:
+                return HTMLStubParser().stub(content)
+            except Exception as e:
+                app.logger.warning(f"HTML parse failed ({e}), returning raw.")
+                return content
+        return self._create_stubs_html_bs4(content)
+
+    def _create_stubs_html_bs4(self, content: str) -> str:
         if BeautifulSoup is None:
             return content
 
@@ -338,6 +2424,14 @@ class CodeAggregator:
             return content
 
     def _create_stubs_py(self, content: str) -> str:
+        try:
+            return outline_py(content)
+        except (SyntaxError, ValueError) as e:
+            # Expected for files cut by max_lines_per_file; not worth a warning
+            app.logger.debug(f"Python parse failed ({e}), using indentation stubs.")
+            return self._create_stubs_py_indent(content)
+
+    def _create_stubs_py_indent(self, content: str) -> str:
         lines = content.splitlines()
         output, block_stack = [], []
 
@@ -359,115 +2453,106 @@ class CodeAggregator:
                 if stripped.startswith(("def ", "class ", "async def ")):
                     block_stack.append(indentation)
                     output.append(
-                        f"{' ' * (indentation + 4)}... # Body omitted"
+                        f"{' ' * (indentation + 4)}{PY_BODY_OMITTED}"
                     )
 
         return "\n".join(output)
 
     def _create_stubs_js(self, content: str) -> str:
-        lines = content.splitlines(keepends=True)
-        output = []
-
-        sig = re.compile(
-            r"^(\s*)(?:class\s+\w+|function\s*\w*\s*\(.*\)\s*\{|"
-            r"(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?\(.*\)\s*=>\s*\{|"
-            r"\w+\s*:\s*(?:async\s*)?function\s*\(.*\)\s*\{|"
-            r"(?:get|set)\s+\w+\(.*\)\s*\{|"
-            r"(?:async\s+)?\w+\s*\(.*\)\s*\{)"
-        )
-
-        in_block, brace_level, indent = False, 0, ""
-
-        for line in lines:
-            if not in_block:
-                m = sig.match(line)
-                if m:
-                    output.append(line)
-                    indent = m.group(1) or ""
-                    brace_level = line.count("{") - line.count("}")
-                    if brace_level > 0:
-                        in_block = True
-                        output.append(f"{indent}  // ... Body omitted\n")
-                else:
-                    output.append(line)
-            else:
-                brace_level += line.count("{")
-                brace_level -= line.count("}")
-                if brace_level <= 0:
-                    in_block = False
-                    output.append(f"{indent}}}\n")
-
-        return "".join(output)
+        return outline_js(content)
 
     def _generate_dirtree(self) -> str:
         """Generate directory tree text."""
         app.logger.info("Generating directory tree...")
+        _, dirs = self._walk_tree()
         tree_lines = [f"{self.root_dir.name}/"]
         dir_count = 0
         file_count = 0
 
-        def recurse_path(directory: Path, prefix: str = ""):
+        def recurse_path(dir_parts: tuple, prefix: str = ""):
             nonlocal dir_count, file_count
-            items = []
-
-            try:
-                for item in directory.iterdir():
-                    if item.name in self.ignore_dirs:
-                        continue
-                    if item.is_file() and (
-                        item.name.lower() in self.exclude_files
-                        or item.stem.lower() in self.exclude_files
-                    ):
-                        continue
-                    items.append(item)
-            except PermissionError:
+            children = dirs.get(dir_parts, [])
+            if children is None:
                 tree_lines.append(f"{prefix}└── [Permission Denied]")
                 return
 
+            items = []
+            for name, is_dir, is_file in children:
+                if name in self.ignore_dirs:
+                    continue
+                if is_file and self.exclude_files and (
+                    name.lower() in self.exclude_files
+                    or Path(name).stem.lower() in self.exclude_files
+                ):
+                    continue
+                items.append((name, is_dir, is_file))
+
             # dirs first, then files
-            items.sort(key=lambda x: (x.is_file(), x.name.lower()))
+            items.sort(key=lambda x: (x[2], x[0].lower()))
 
             pointers = ["├── "] * (len(items) - 1) + ["└── "]
-            for pointer, path in zip(pointers, items):
-                tree_lines.append(f"{prefix}{pointer}{path.name}")
-                if path.is_dir():
+            for pointer, (name, is_dir, _) in zip(pointers, items):
+                tree_lines.append(f"{prefix}{pointer}{name}")
+                if is_dir:
                     dir_count += 1
                     extension = "│   " if pointer == "├── " else "    "
-                    recurse_path(path, prefix=prefix + extension)
+                    recurse_path(dir_parts + (name,), prefix=prefix + extension)
                 else:
                     file_count += 1
 
-        recurse_path(self.root_dir)
+        recurse_path(())
         tree_lines.append(f"\n{dir_count} directories, {file_count} files")
         return "\n".join(tree_lines)
 
+    def _match_print_only(self, entry: FileEntry, pattern: str) -> bool:
+        """Match like root_dir.rglob(pattern) would."""
+        pat_parts = Path(pattern).parts
+        if not pat_parts or len(pat_parts) > len(entry.parts):
+            return False
+        tail = entry.parts[-len(pat_parts):]
+        return all(fnmatch.fnmatchcase(n, p) for n, p in zip(tail, pat_parts))
+
     def aggregate_files(self):
-        contents = []
+        """Return the rendered block of every selected file, in order."""
+        return self._render_jobs(self._collect_jobs())
+
+    def _collect_jobs(self):
+        """Select files to aggregate as (file_path, stat) jobs."""
+        jobs = []
         current_file = Path(__file__).resolve()
+        cache_file = self.cache_file.resolve()
+        report_file = self.report_file.resolve()
+        manifest_file = self.manifest_file.resolve()
+        base, ext = self._output_base()
+        output_dir = Path(base).resolve().parent
+        output_re = re.compile(
+            re.escape(os.path.basename(base)) + r"(?:_\d+)?" + re.escape(ext)
+        )
+        files, _ = self._walk_tree()
 
         # print_only short-circuit
         if self.print_only:
             app.logger.info("print_only enabled.")
             for name in self.print_only:
-                for fp in self.root_dir.rglob(name):
-                    if fp.is_file() and not self.should_ignore_directory(fp.resolve()):
-                        app.logger.info(f"Printing file: {fp}")
-                        self.append_file_content(contents, fp)
-            return contents
+                for entry in files:
+                    if self._match_print_only(entry, name):
+                        app.logger.debug(f"Printing file: {entry.path}")
+                        jobs.append((entry.path, entry.stat))
+            return jobs
 
         processed_files = set()
 
-        for file in sorted(self.root_dir.rglob("*")):
-            if (
-                not file.is_file()
-                or file.resolve() == current_file
-                or self.should_ignore_directory(file.resolve())
-            ):
+        for entry in files:
+            own = (current_file, cache_file, report_file, manifest_file)
+            if entry.name in (p.name for p in own) and entry.path.resolve() in own:
+                continue
+            # Our own output chunks (matters when every extension is included)
+            if output_re.fullmatch(entry.name) and entry.path.parent.resolve() == output_dir:
                 continue
 
-            name_lower = file.name.lower()
-            stem_lower = file.stem.lower()
-            ext_lower = file.suffix.lower()
+            name_lower = entry.name.lower()
+            stem_lower = entry.stem.lower()
+            ext_lower = entry.suffix.lower()
 
             is_explicitly_included = name_lower in self.include_files_lower
             is_excluded = (
@@ -480,28 +2565,227 @@ class CodeAggregator:
                 should_include = True
 
             if should_include and not is_excluded:
-                app.logger.info(f"Including file: {file}")
-                self.append_file_content(contents, file)
+                app.logger.debug(f"Including file: {entry.path}")
+                jobs.append((entry.path, entry.stat))
                 processed_files.add(name_lower)
 
         # Force-include any include_files not processed
-        for name in self.include_files:
-            name_lower = name.lower()
-            if name_lower in processed_files:
-                continue
-            for fp in self.root_dir.rglob("*"):
-                if (
-                    fp.is_file()
-                    and fp.name.lower() == name_lower
-                    and not self.should_ignore_directory(fp.resolve())
-                ):
-                    app.logger.info(f"Force-including file: {fp}")
-                    self.append_file_content(contents, fp)
+        missing = [
+            name.lower()
+            for name in self.include_files
+            if name.lower() not in processed_files
+        ]
+        if missing:
+            by_name = {}
+            for entry in files:
+                by_name.setdefault(entry.name.lower(), []).append(entry)
+            for name_lower in missing:
+                if name_lower in processed_files:
+                    continue
+                for entry in by_name.get(name_lower, []):
+                    app.logger.debug(f"Force-including file: {entry.path}")
+                    jobs.append((entry.path, entry.stat))
                     processed_files.add(name_lower)
 
-        return contents
+        return jobs
 
     def aggregate(self):
+        # Re-walk on every run; the index is shared by dirtree and files
+        self._file_index = None
+        self._stub_memo = {}
+        wall_t0 = time.perf_counter_ns()
+        stats = self._stats = RunStats(self.report_top) if self.instrument else None
+
+        def measure(stage):
+            return stats.measure(stage) if stats else contextlib.nullcontext()
+
+        with measure("dirtree"):
+            header = self._build_header()
+        base, ext = self._output_base()
+
+        with measure("select"):
+            jobs = self._collect_jobs()
+
+        if self.use_cache:
+            with measure("cache"):
+                self._cache = FileCache(self.cache_file, self.cache_max_bytes).load()
+        try:
+            with ChunkWriter(base, ext, self.split_at, self.manifest) as writer:
+                writer.write(header)
+                clock = time.perf_counter_ns
+                duplicates = self._find_duplicates(jobs)
+                blocks = self._fold_compacted(
+                    jobs, self._iter_blocks(jobs, duplicates), duplicates
+                )
+                for (path, _), block in zip(jobs, blocks):
+                    t0 = clock()
+                    writer.write(block, path)
+                    if stats is not None:
+                        stats.add("write", clock() - t0)
+        finally:
+            if self._cache is not None:
+                with measure("cache"):
+                    self._cache.save()
+                self._cache = None
+
+        if self.split_at <= 0:
+            app.logger.info(f"Aggregation complete: {writer.written[0]}")
+        if self.manifest:
+            with measure("manifest"):
+                self._write_manifest(writer, jobs)
+
+        if stats is not None:
+            self._write_report(stats, writer.written, time.perf_counter_ns() - wall_t0)
+        self._stats = None
+
+    def watch(self, interval=1.0, debounce=0.3, use_inotify=True, max_cycles=None):
+        """Aggregate, then keep the output current until interrupted.
+
+        Changes are noticed through inotify where available, else by
+        re-walking every 'interval' seconds; bursts are debounced until the
+        tree has been quiet for 'debounce' seconds. Each cycle re-renders
+        only added/changed files, drops deleted ones, and rewrites only the
+        chunks whose content changed (plus the header if the tree did).
+        """
+        base, ext = self._output_base()
+        writer = ChunkWriter(base, ext, self.split_at, self.manifest)
+        notifier = None
+        if use_inotify:
+            try:
+                notifier = Inotify()
+            except OSError as e:
+                app.logger.info(f"inotify unavailable ({e}), polling instead.")
+
+        blocks = {}  # path -> block
+        seen = {}  # path -> (size, mtime_ns)
+        last_duplicates = {}
+        dirs = None
+        header = None
+        chunks = []
+        cycle = 0
+
+        def snapshot():
+            self._file_index = None
+            jobs = self._collect_jobs()
+            _, tree = self._walk_tree()
+            state = {path: (st.st_size, st.st_mtime_ns) for path, st in jobs}
+            return jobs, state, tree
+
+        def add_watches(tree):
+            nonlocal notifier
+            try:
+                for parts in tree:
+                    notifier.add(self.root_dir.joinpath(*parts))
+            except OSError as e:  # e.g. max_user_watches reached
+                notifier.close()
+                notifier = None
+                app.logger.warning(f"inotify watch failed ({e}), polling instead.")
+
+        def wait_for_change():
+            """Block until something may have changed; returns when it was
+            first noticed (before debouncing)."""
+            if notifier is None:
+                time.sleep(interval)
+                return time.perf_counter()
+            while not notifier.wait(interval):
+                pass
+            noticed = time.perf_counter()
+            while notifier.wait(debounce):  # debounce the burst
+                pass
+            return noticed
+
+        if self.use_cache:
+            self._cache = FileCache(self.cache_file, self.cache_max_bytes).load()
+        try:
+            while max_cycles is None or cycle < max_cycles:
+                if cycle:
+                    detected = wait_for_change()
+                else:
+                    detected = time.perf_counter()
+                self._stub_memo = {}
+                jobs, state, tree = snapshot()
+                if notifier is None and cycle and (state != seen or tree != dirs):
+                    # Polling saw a change: settle until two walks agree
+                    while True:
+                        time.sleep(debounce)
+                        jobs2, state2, tree2 = snapshot()
+                        if state2 == state and tree2 == tree:
+                            break
+                        jobs, state, tree = jobs2, state2, tree2
+                if notifier is not None:
+                    add_watches(tree)
+
+                duplicates = self._find_duplicates(jobs)
+                changed = [
+                    (path, st)
+                    for path, st in jobs
+                    if seen.get(path) != state[path]
+                    or duplicates.get(path) != last_duplicates.get(path)
+                ]
+                deleted = [path for path in seen if path not in state]
+                if cycle and not changed and not deleted and tree == dirs:
+                    continue
+                cycle += 1
+
+                for path in deleted:
+                    blocks.pop(path, None)
+                for (path, _), block in zip(
+                    changed, self._iter_blocks(changed, duplicates)
+                ):
+                    blocks[path] = block
+                last_duplicates = duplicates
+                if header is None or tree != dirs:
+                    header = self._build_header()
+                added = sum(1 for path, _ in changed if path not in seen)
+                seen, dirs = state, tree
+
+                # Rewrite only chunks whose blocks differ from last cycle
+                ordered = self._fold_compacted(
+                    jobs, [blocks[p] for p, _ in jobs], duplicates
+                )
+                new_chunks = writer.plan(
+                    [(None, header), *zip((p for p, _ in jobs), ordered)]
+                )
+                rewritten = 0
+                for idx, chunk in enumerate(new_chunks, 1):
+                    if idx > len(chunks) or chunk != chunks[idx - 1]:
+                        writer.write_chunk(idx, chunk)
+                        rewritten += 1
+                if self.split_at > 0:
+                    for idx in range(len(new_chunks) + 1, len(chunks) + 1):
+                        writer.index.pop(idx, None)
+                        try:
+                            os.remove(f"{base}_{idx}{ext}")
+                        except OSError:
+                            pass
+                chunks = new_chunks
+                if self.manifest and rewritten:
+                    self._write_manifest(writer, jobs)
+                if self._cache is not None:
+                    self._cache.save()
+
+                took = (time.perf_counter() - detected) * 1000
+                lag = ""
+                if changed and cycle > 1:
+                    newest = max(st.st_mtime_ns for _, st in changed) / 1e9
+                    lag = f", {(time.time() - newest) * 1000:.0f} ms after last save"
+                app.logger.info(
+                    f"Watch cycle {cycle}: {added} added, "
+                    f"{len(changed) - added} changed, {len(deleted)} deleted; "
+                    f"rewrote {rewritten}/{len(new_chunks)} chunks "
+                    f"in {took:.0f} ms{lag}"
+                )
+        except KeyboardInterrupt:
+            app.logger.info("Watch stopped.")
+        finally:
+            if notifier is not None:
+                notifier.close()
+            if self._cache is not None:
+                self._cache.save()
+                self._cache = None
+
+    def _build_header(self) -> str:
+        """Timestamp, description and dirtree block at the top of chunk 1."""
         header_parts = []
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         header_parts.append(f"Aggregated on: {ts}\n{'=' * 80}\n")
@@ -516,46 +2800,172 @@ class CodeAggregator:
             header_parts.append(
                 f"Project Directory Tree:\n{tree_str}\n{'=' * 80}\n"
             )
+        return "".join(header_parts)
 
-        contents = self.aggregate_files()
-        contents.insert(0, "".join(header_parts))
-
+    def _output_base(self):
         base, ext = os.path.splitext(self.output_filename)
         if not ext:
             ext = ".txt"
-
-        # No split
-        if self.split_at <= 0:
-            target = f"{base}{ext}"
-            Path(target).write_text("".join(contents), encoding="utf-8")
-            app.logger.info(f"Aggregation complete: {target}")
-            return
-
-        # Split into chunks
-        idx, line_count, buf = 1, 0, []
-
-        def flush():
-            nonlocal idx, buf, line_count
-            if not buf:
-                return
-            out = f"{base}_{idx}{ext}"
-            Path(out).write_text("".join(buf), encoding="utf-8")
-            app.logger.info(f"Wrote {line_count} lines to {out}")
-            idx += 1
-            buf.clear()
-            line_count = 0
-
-        for block in contents:
-            count = block.count("\n") + 1
-            if buf and line_count + count > self.split_at:
-                flush()
-            buf.append(block)
-            line_count += count
-
-        flush()
+        return base, ext
+
+    def _write_manifest(self, writer, jobs):
+        """Write the JSON manifest: one entry per chunk (file, bytes, sha1)
+        and per file block, so consumers can seek() straight to a file.
+
+        Each file entry has the chunk, the block's byte offset/length and
+        first line/line count in it, the byte range of just the (compacted)
+        contents, the sha1 of the block bytes and the source's size/mtime.
+        """
+        stats_by_path = dict(jobs)
+        footer_bytes = len("\n" + "=" * 80 + "\n")
+        chunks, files = [], []
+        for idx in sorted(writer.index):
+            target, size, digest, blocks = writer.index[idx]
+            chunk = os.path.basename(target)
+            chunks.append({"file": chunk, "bytes": size, "sha1": digest})
+            for path, offset, length, head, line, lines, block_digest in blocks:
+                st = stats_by_path.get(path)
+                files.append(
+                    {
+                        "path": str(path),
+                        "chunk": chunk,
+                        "offset": offset,
+                        "length": length,
+                        "line": line,
+                        "lines": lines,
+                        "content_offset": offset + head,
+                        "content_length": length - head - footer_bytes,
+                        "sha1": block_digest,
+                        "size": st.st_size if st else None,
+                        "mtime_ns": st.st_mtime_ns if st else None,
+                    }
+                )
+        manifest = {
+            "version": 1,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "root_dir": str(self.root_dir),
+            "chunks": chunks,
+            "files": files,
+        }
+        target = str(self.manifest_file)
+        try:
+            fd, tmp = _temp_for(target)
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(manifest, fh, indent=1)
+            os.replace(tmp, target)
+        except OSError as e:
+            app.logger.warning(f"Manifest not written ({e}).")
+
+    def _write_report(self, stats, written, wall_ns):
+        """Write the JSON run report and log the summary table."""
+        for target in written:
+            try:
+                stats.count("bytes_out", os.path.getsize(target))
+            except OSError:
+                pass
+        report = stats.report(wall_ns)
+        report["timestamp"] = datetime.now().isoformat(timespec="seconds")
+        report["root_dir"] = str(self.root_dir)
+        report["outputs"] = written
+        report["options"] = {
+            "compaction_level": self.compaction_level,
+            "comments": self.comments,
+            "workers": self.workers,
+            "worker_pool": self.worker_pool,
+            "cache": self.use_cache,
+            "source": self.source,
+        }
+        try:
+            self.report_file.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        except OSError as e:
+            app.logger.warning(f"Run report not written ({e}).")
+        app.logger.info("Run summary:\n" + stats.summary(wall_ns))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Aggregate project source files into text output."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="files processed in parallel (1 = serial, 0 = one per CPU)",
+    )
+    parser.add_argument(
+        "--worker-pool",
+        choices=["auto", "process", "thread"],
+        default="auto",
+        help="pool type for --workers (auto: processes for stubs mode)",
+    )
+    parser.add_argument(
+        "--html-stubs",
+        choices=["stdlib", "bs4"],
+        default="stdlib",
+        help="HTML stub engine for stubs mode (bs4 needs beautifulsoup4)",
+    )
+    parser.add_argument(
+        "--max-file-bytes",
+        type=int,
+        default=MAX_FILE_BYTES,
+        help="read at most this many bytes per file (0 = no limit)",
+    )
+    parser.add_argument(
+        "--source",
+        choices=["walk", "git"],
+        default="walk",
+        help="walk the tree, or list files from the git index (.gitignore-aware)",
+    )
+    parser.add_argument(
+        "--untracked",
+        action="store_true",
+        help="with --source git, also include untracked files that aren't ignored",
+    )
+    parser.add_argument(
+        "--dedupe",
+        choices=["off", "exact", "compacted"],
+        default="off",
+        help="reference repeated files instead of inlining each copy",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep the output up to date as files change (Ctrl+C to stop)",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=1.0,
+        help="seconds between polls when inotify is unavailable",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.3,
+        help="quiet seconds to wait for before updating after a change",
+    )
+    parser.add_argument(
+        "--no-inotify",
+        action="store_true",
+        help="always poll file mtimes in --watch mode",
+    )
+    parser.add_argument(
+        "--no-report",
+        action="store_true",
+        help="skip per-stage timings and the JSON run report",
+    )
+    parser.add_argument(
+        "--no-manifest",
+        action="store_true",
+        help="skip the byte-offset manifest of the output chunks",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="bypass the persistent per-file block cache",
+    )
+    args = parser.parse_args()
+
     ignore_list = [
         ".cache",
         ".config",
@@ -587,9 +2997,28 @@ if __name__ == "__main__":
         exclude_files=['flask_app.py'],
         include_files=[],
         ignore_dirs=ignore_list,
+        source=args.source,
+        git_untracked=args.untracked,
         description_text="",
+        html_stubs=args.html_stubs,
+        max_file_bytes=args.max_file_bytes,
+        dedupe=None if args.dedupe == "off" else args.dedupe,
+        use_cache=not args.no_cache,
+        instrument=not args.no_report,
+        manifest=not args.no_manifest,
+        workers=args.workers,
+        worker_pool=args.worker_pool,
     )
 
+    if args.watch:
+        app.logger.info("Starting watch mode.")
+        aggregator.watch(
+            interval=args.watch_interval,
+            debounce=args.debounce,
+            use_inotify=not args.no_inotify,
+        )
+        raise SystemExit(0)
+
     app.logger.info("Starting aggregation process.")
     aggregator.aggregate()
     app.logger.info(
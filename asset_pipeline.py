@@ -0,0 +1,239 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import time
+
+from flask import Response, request, send_from_directory
+
+# Optional brotli variants:
+#   pip install brotli
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fingerprinted URLs never change content, so browsers may keep them forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Plain URLs may change under the same name: always revalidate (ETag)
+REVALIDATE = "no-cache"
+
+# Only text-like files are worth compressing; images/fonts already are
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+# Below this, compression headers cost more than they save
+MIN_COMPRESS_BYTES = 256
+# Keep a variant only if it's at most this fraction of the original
+MAX_COMPRESS_RATIO = 0.9
+# Replaced versions of a file kept at their fingerprinted URLs
+KEEP_OLD_VERSIONS = 16
+
+
+def encode_variants(data, mimetype, encodings=("gzip", "br")):
+    """{'identity': data} plus gzip/br variants worth sending.
+
+    br is skipped when brotli is not installed.
+    """
+    variants = {"identity": data}
+    if len(data) < MIN_COMPRESS_BYTES or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return variants
+    candidates = {}
+    if "gzip" in encodings:
+        # mtime=0 keeps gzip output (and so the ETag) reproducible
+        candidates["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+    if "br" in encodings and brotli is not None:
+        candidates["br"] = brotli.compress(data, quality=11)
+    for encoding, body in candidates.items():
+        if len(body) <= len(data) * MAX_COMPRESS_RATIO:
+            variants[encoding] = body
+    return variants
+
+
+def send_variants(variants, digest, mimetype, cache_control):
+    """Response for the current request: the best variant its
+    Accept-Encoding allows, or 304 if If-None-Match already has it.
+
+    Each encoding is its own representation, so gets its own strong ETag.
+    """
+    accepted = request.accept_encodings
+    encoding, best_q = "identity", 0
+    for candidate in ("br", "gzip"):
+        q = accepted[candidate]
+        if candidate in variants and q > best_q:
+            encoding, best_q = candidate, q
+    etag = digest if encoding == "identity" else f"{digest}-{encoding}"
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(variants[encoding], mimetype=mimetype, headers=headers)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    return response
+
+
+class Asset:
+    """One file under static/, with its fingerprint and encoded variants."""
+
+    def __init__(self, rel, path, data, stat=None):
+        self.rel = rel
+        self.path = path  # None for generated assets (e.g. bundles)
+        self.mtime_ns = stat.st_mtime_ns if stat else 0
+        self.size = stat.st_size if stat else len(data)
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(rel)
+        self.fingerprinted = f"{stem}.{self.digest}{ext}"
+        self.mimetype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        self.variants = encode_variants(data, self.mimetype)
+
+
+class AssetPipeline:
+    """Content-hash every file under static_dir at startup and serve them
+    from memory, precompressed, at fingerprinted URLs.
+
+    'css/demeza_base.css' is also served at
+    '/static/css/demeza_base.<hash>.css' with Cache-Control: immutable.
+    The plain URL keeps working but must revalidate. Templates get
+    asset_url() for the fingerprinted form.
+    """
+
+    def __init__(
+        self,
+        static_dir,
+        url_prefix="/static",
+        auto_reload=False,
+        keep_old_versions=KEEP_OLD_VERSIONS,
+    ):
+        self.static_dir = os.path.abspath(static_dir)
+        self.url_prefix = url_prefix.rstrip("/")
+        # Re-stat files on lookup and rebuild changed ones (dev mode)
+        self.auto_reload = auto_reload
+        self.keep_old_versions = keep_old_versions
+        self.assets = {}  # rel path -> Asset
+        self.by_name = {}  # rel or fingerprinted path -> Asset
+        self.old_versions = {}  # rel path -> replaced fingerprints, oldest first
+        # Bumped whenever a built asset is replaced (so its URL changes)
+        self.generation = 0
+
+    def build(self):
+        t0 = time.perf_counter()
+        self.assets, self.by_name, self.old_versions = {}, {}, {}
+        for dir_path, dir_names, file_names in os.walk(self.static_dir):
+            dir_names.sort()
+            for name in sorted(file_names):
+                path = os.path.join(dir_path, name)
+                rel = os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+                self._load(rel, path)
+
+        raw = sum(a.size for a in self.assets.values())
+        packed = sum(
+            len(a.variants.get("gzip", a.variants["identity"]))
+            for a in self.assets.values()
+        )
+        print(
+            f"[ASSETS] {len(self.assets)} files fingerprinted, "
+            f"{raw / 1024:.0f} KB -> {packed / 1024:.0f} KB gzip "
+            f"in {(time.perf_counter() - t0) * 1000:.0f} ms"
+            + ("" if brotli is not None else " (brotli not installed)")
+        )
+        return self
+
+    def _load(self, rel, path):
+        try:
+            with open(path, "rb") as fh:
+                stat = os.fstat(fh.fileno())
+                data = fh.read()
+        except OSError as e:
+            print(f"[ASSETS] Skipped {rel}: {e}")
+            return None
+        if rel in self.assets:
+            self.generation += 1
+        return self._register(Asset(rel, path, data, stat))
+
+    def add(self, rel, data):
+        """Register generated bytes as static/<rel>; returns the Asset.
+
+        Earlier versions stay reachable at their fingerprinted URLs (the
+        last keep_old_versions of them), since cached pages may still
+        link them.
+        """
+        return self._register(Asset(rel, None, data))
+
+    def _register(self, asset):
+        """Make asset the current static/<asset.rel>, keeping the version
+        it replaces at its fingerprinted URL."""
+        rel = asset.rel
+        old = self.assets.get(rel)
+        older = self.old_versions.setdefault(rel, [])
+        if asset.fingerprinted in older:
+            older.remove(asset.fingerprinted)  # current again
+        if old is not None and old.fingerprinted != asset.fingerprinted:
+            older.append(old.fingerprinted)
+            while len(older) > self.keep_old_versions:
+                self.by_name.pop(older.pop(0), None)
+        self.assets[rel] = asset
+        self.by_name[rel] = asset
+        self.by_name[asset.fingerprinted] = asset
+        return asset
+
+    def _fresh(self, asset):
+        """With auto_reload, rebuild asset if its file changed on disk."""
+        if not self.auto_reload or asset.path is None:
+            return asset
+        try:
+            stat = os.stat(asset.path)
+        except OSError:
+            return asset
+        if (stat.st_mtime_ns, stat.st_size) != (asset.mtime_ns, asset.size):
+            asset = self._load(asset.rel, asset.path) or asset
+        return asset
+
+    def refresh(self):
+        """With auto_reload, rebuild every changed asset; returns the
+        generation, so callers can tell if any asset URL changed."""
+        if self.auto_reload:
+            for asset in list(self.assets.values()):
+                self._fresh(asset)
+        return self.generation
+
+    def get(self, name):
+        """Current Asset for a plain or fingerprinted name, or None."""
+        asset = self.by_name.get(name)
+        return asset if asset is None else self._fresh(asset)
+
+    def url(self, rel):
+        """Fingerprinted URL of static/<rel>, or the plain one if unknown."""
+        rel = rel.lstrip("/")
+        asset = self.assets.get(rel)
+        if asset is None:
+            return f"{self.url_prefix}/{rel}"
+        return f"{self.url_prefix}/{self._fresh(asset).fingerprinted}"
+
+    def serve(self, filename):
+        """Response for GET /static/<filename>."""
+        asset = self.by_name.get(filename)
+        if asset is None:
+            # Files added after startup still work, just without extras
+            return send_from_directory(self.static_dir, filename)
+
+        immutable = filename != asset.rel
+        if not immutable:
+            asset = self._fresh(asset)
+        return send_variants(
+            asset.variants,
+            asset.digest,
+            asset.mimetype,
+            IMMUTABLE if immutable else REVALIDATE,
+        )
+
+    def init_app(self, app):
+        """Expose asset_url() to templates."""
+        app.jinja_env.globals["asset_url"] = self.url
+        return self
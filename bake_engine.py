@@ -0,0 +1,354 @@
+import os
+import re
+import hashlib
+import time
+from html import escape
+from html.parser import HTMLParser
+
+from flask import render_template
+
+from page_cache import template_files
+
+# Keep in sync with BakeManager in static/js/bake_manager.js
+BLOCKLIST = [
+    "simulator.js",
+    "bake_manager.js",
+    "index.js",
+    "index_boot.js",
+    "ua-parser.min.js",
+]
+REMOVABLES = [
+    ".controls",
+    ".back-home-btn",
+    "#exit-live-btn",
+    "#get-code-btn",
+    "#code-modal-overlay",
+    ".workspace-hint",
+    ".tile-remove-btn",
+    ".tile-add-btn",
+    'script[src*="reload"]',
+    'script[src*="googletagmanager"]',
+    'meta[name="demeza-perf"]',
+]
+# What the baked #device-frame and <body> get, as BakeManager sets them
+FRAME_STYLE = "width: 100%; min-height: 100vh; border: none; box-shadow: none; resize: none;"
+BODY_STYLE = {"padding": "0px", "margin": "0px"}
+
+VOID_TAGS = frozenset(
+    "area base br col embed hr img input link meta param source track wbr".split()
+)
+
+# tag, #id, .class and tag[attr="value"] with =, *=, ^= or $= (all
+# BakeManager needs)
+SELECTOR_RE = re.compile(
+    r'(?P<tag>[\w-]+)?(?:#(?P<id>[\w-]+))?(?:\.(?P<cls>[\w-]+))?'
+    r'(?:\[(?P<attr>[\w-]+)(?P<op>[*^$]?=)"(?P<val>[^"]*)"\])?'
+)
+
+
+class Node:
+    """Element in a parsed page. Text, comments and declarations are
+    kept as raw strings among 'children'."""
+
+    def __init__(self, tag, attrs, raw=None, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.raw = raw  # original start tag text; None once attrs change
+        self.parent = parent
+        self.children = []
+        self.closed = False  # an end tag was seen
+
+    def set_attr(self, name, value):
+        self.attrs[name] = value
+        self.raw = None
+
+    def classes(self):
+        return (self.attrs.get("class") or "").split()
+
+    def text(self):
+        return "".join(c for c in self.children if isinstance(c, str))
+
+    def iter(self):
+        for child in self.children:
+            if isinstance(child, Node):
+                yield child
+                yield from child.iter()
+
+    def select(self, selector):
+        m = SELECTOR_RE.fullmatch(selector)
+        if m is None:
+            raise ValueError(f"unsupported selector {selector!r}")
+        tag, id_, cls, attr, op, val = m.group("tag", "id", "cls", "attr", "op", "val")
+        for node in self.iter():
+            if tag and node.tag != tag:
+                continue
+            if id_ and node.attrs.get("id") != id_:
+                continue
+            if cls and cls not in node.classes():
+                continue
+            if attr:
+                have = node.attrs.get(attr)
+                if have is None or not {
+                    "=": have == val,
+                    "*=": val in have,
+                    "^=": have.startswith(val),
+                    "$=": have.endswith(val),
+                }[op]:
+                    continue
+            yield node
+
+    def find(self, selector):
+        return next(self.select(selector), None)
+
+    def remove(self):
+        if self.parent is not None:
+            self.parent.children.remove(self)
+            self.parent = None
+
+    def replace_with(self, node):
+        siblings = self.parent.children
+        siblings[siblings.index(self)] = node
+        node.parent, self.parent = self.parent, None
+
+    def insert_before(self, node, ref):
+        node.remove()
+        self.children.insert(self.children.index(ref), node)
+        node.parent = self
+
+    def serialize(self, out):
+        element = self.tag != "#document"
+        if not element:
+            pass
+        elif self.raw is not None:
+            out.append(self.raw)
+        else:
+            attrs = "".join(
+                f" {k}" if v is None else f' {k}="{escape(v)}"'
+                for k, v in self.attrs.items()
+            )
+            out.append(f"<{self.tag}{attrs}>")
+        for child in self.children:
+            if isinstance(child, Node):
+                child.serialize(out)
+            else:
+                out.append(child)
+        if element and (
+            self.closed or (self.raw is None and self.tag not in VOID_TAGS)
+        ):
+            out.append(f"</{self.tag}>")
+        return out
+
+
+class TreeBuilder(HTMLParser):
+    """Parse HTML into Nodes, keeping text and untouched tags verbatim."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.root = Node("#document", [])
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, attrs, self.get_starttag_text(), self._stack[-1])
+        self._stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        node = Node(tag, attrs, self.get_starttag_text(), self._stack[-1])
+        self._stack[-1].children.append(node)
+
+    def handle_endtag(self, tag):
+        # Close up to the matching open element; stray end tags are dropped
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].tag == tag:
+                self._stack[i].closed = True
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        self._stack[-1].children.append(data)
+
+    def handle_entityref(self, name):
+        self._stack[-1].children.append(f"&{name};")
+
+    def handle_charref(self, name):
+        self._stack[-1].children.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        self._stack[-1].children.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self._stack[-1].children.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self._stack[-1].children.append(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self._stack[-1].children.append(f"<![{data}]>")
+
+
+def parse_html(text):
+    builder = TreeBuilder()
+    builder.feed(text)
+    builder.close()
+    return builder.root
+
+
+def _merge_style(style, updates):
+    decls = {}
+    for part in (style or "").split(";"):
+        name, sep, value = part.partition(":")
+        if sep and name.strip():
+            decls[name.strip().lower()] = value.strip()
+    decls.update(updates)
+    return " ".join(f"{k}: {v};" for k, v in decls.items())
+
+
+def _is_local(url):
+    return url.startswith("/static/") or url.startswith("static/")
+
+
+class BakeEngine:
+    """Server-side BakeManager.generateFinalCode(): render a template and
+    turn it into one standalone HTML file, with local CSS/JS read from the
+    asset pipeline instead of fetched one by one.
+
+    Results are cached per template and reused while the content hashes of
+    every file they were built from (templates and inlined assets) match.
+    'optimizer' (e.g. bake_optimizer.optimize_html) post-processes bakes
+    made with optimize=True and returns (html, report).
+    """
+
+    def __init__(
+        self, app, assets, blocklist=BLOCKLIST, removables=REMOVABLES, optimizer=None
+    ):
+        self.app = app
+        self.assets = assets
+        self.blocklist = blocklist
+        self.removables = removables
+        self.optimizer = optimizer
+        self._cache = {}  # (template, optimize) -> (html, [(path, digest)])
+        self._digests = {}  # path -> ((mtime_ns, size), digest)
+
+    def _digest(self, path):
+        """Content hash of path, re-read only when its stat changes."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        memo = self._digests.get(path)
+        if memo is None or memo[0] != key:
+            with open(path, "rb") as fh:
+                memo = self._digests[path] = (key, hashlib.sha256(fh.read()).hexdigest())
+        return memo[1]
+
+    def bake(self, template, optimize=False):
+        """Return (html, cached) for template; call inside an app context."""
+        optimize = optimize and self.optimizer is not None
+        key = (template, optimize)
+        entry = self._cache.get(key)
+        if entry is not None and all(
+            self._digest(path) == digest for path, digest in entry[1]
+        ):
+            return entry[0], True
+
+        t0 = time.perf_counter()
+        files = template_files(self.app.jinja_env, template)
+        html, inlined = self.bake_html(render_template(template))
+        raw_size = len(html)
+        report = None
+        if optimize:
+            html, report = self.optimizer(html)
+        deps = [(path, self._digest(path)) for path in files + inlined]
+        self._cache[key] = (html, deps)
+        print(
+            f"[BAKE] {template}: {len(inlined)} assets inlined, "
+            + (f"{raw_size / 1024:.0f} KB -> " if optimize else "")
+            + f"{len(html) / 1024:.0f} KB in {(time.perf_counter() - t0) * 1000:.0f} ms"
+        )
+        for asset, before, after in report or ():
+            print(f"[BAKE]   {asset}: {before} -> {after} bytes (-{before - after})")
+        return html, False
+
+    def _read_asset(self, url):
+        """(rel, text) of a /static/ URL, fingerprinted or not."""
+        name = url.split("?", 1)[0].split("#", 1)[0]
+        name = name[len("/static/"):] if name.startswith("/") else name[len("static/"):]
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        return asset, asset.variants["identity"].decode("utf-8", errors="replace")
+
+    def bake_html(self, page):
+        """Bake rendered page HTML; returns (html, paths of inlined files)."""
+        doc = parse_html(page)
+        html = doc.find("html") or doc
+        body = html.find("body")
+        inlined = []
+
+        # Unwrap #device-frame from the simulator
+        wrapper = html.find(".simulator-wrapper")
+        frame = html.find("#device-frame")
+        if wrapper is not None and frame is not None:
+            wrapper.parent.insert_before(frame, wrapper)
+            wrapper.remove()
+            frame.set_attr("style", FRAME_STYLE)
+
+        # Editor-only elements
+        for selector in self.removables:
+            for node in list(html.select(selector)):
+                node.remove()
+
+        if body is not None:
+            classes = [c for c in body.classes() if c != "rotate-blocked"]
+            for cls in ("view-live", "is-native-mobile"):
+                if cls not in classes:
+                    classes.append(cls)
+            body.set_attr("class", " ".join(classes))
+            body.set_attr("style", _merge_style(body.attrs.get("style"), BODY_STYLE))
+
+        # Inline local stylesheets
+        for link in list(html.select('link[rel="stylesheet"]')):
+            href = link.attrs.get("href") or ""
+            found = _is_local(href) and self._read_asset(href)
+            if not found:
+                continue
+            asset, css = found
+            style = Node("style", [])
+            style.children.append(
+                f"\n/* Inlined: /static/{asset.rel} */\n"
+                + css.replace("</style", "<\\/style")
+                + "\n"
+            )
+            link.replace_with(style)
+            inlined.append(asset.path)
+
+        # Drop GA / blocklisted scripts, inline local ones
+        for script in list(html.select("script")):
+            code = script.text()
+            if "gtag(" in code or "googletagmanager" in code:
+                script.remove()
+                continue
+            src = script.attrs.get("src")
+            if not src:
+                continue
+            found = _is_local(src) and self._read_asset(src)
+            # Match the blocklist against the plain name, not the fingerprint
+            name = f"/static/{found[0].rel}" if found else src
+            if any(blocked in name for blocked in self.blocklist):
+                script.remove()
+                continue
+            if not found:
+                continue
+            asset, js = found
+            inline = Node("script", [])
+            inline.children.append(
+                f"\n// Inlined: /static/{asset.rel}\n"
+                + js.replace("</script", "<\\/script")
+                + "\n"
+            )
+            script.replace_with(inline)
+            inlined.append(asset.path)
+
+        return "<!DOCTYPE html>\n" + "".join(html.serialize([])), inlined
@@ -0,0 +1,415 @@
+import re
+
+from bake_engine import parse_html, Node
+
+# Classes JS toggles on baked pages; rules using them always survive
+STATE_CLASSES = frozenset(["view-live", "is-native-mobile", "rotate-blocked"])
+# At-rules whose blocks hold style rules to shake; others are kept whole
+SHAKEABLE_AT_RULES = ("@media", "@supports", "@container", "@layer")
+# Whitespace inside these is significant
+PRESERVE_WS_TAGS = frozenset(["pre", "textarea", "script", "style"])
+# Whitespace-only text directly inside these never renders
+BLOCK_PARENTS = frozenset(
+    ["#document", "html", "head", "ul", "ol", "table", "thead", "tbody", "tr", "select"]
+)
+
+JS_REGEX_KEYWORDS = frozenset(
+    "return typeof instanceof in of new delete void throw case do else "
+    "yield await".split()
+)
+# After one of these a newline can't end a statement, so it can go
+JS_OPEN_CHARS = "{([,;=:?&|*%<>!~^"
+# Before one of these a newline can go (ASI works the same without it)
+JS_CLOSE_CHARS = ")]},;.?:"
+
+WORD_RE = re.compile(r"[\w-]+")
+CSS_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'', re.S)
+CSS_TOKEN_RE = re.compile(r'/\*.*?\*/|"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|[{};]', re.S)
+CSS_CLASS_RE = re.compile(r"\.((?:[\w-]|\\.)+)")
+CSS_ID_RE = re.compile(r"#((?:[\w-]|\\.)+)")
+CSS_TAG_RE = re.compile(r"(?:^|[\s>+~(,])([a-zA-Z][\w-]*)")
+CSS_ATTR_RE = re.compile(r"\[[^\]]*\]")
+CSS_PSEUDO_FN_RE = re.compile(r"::?[\w-]+\(")
+CSS_PSEUDO_RE = re.compile(r"::?[\w-]+")
+INLINED_RE = re.compile(r"Inlined: (\S+?)(?: \*/)?\n")
+
+
+# ----------------------
+# JS
+# ----------------------
+
+
+def _js_word(c):
+    return c.isalnum() or c in "_$\\" or c > "\x7f"
+
+
+def _skip_js_string(text, i):
+    """End of the string literal starting at text[i]."""
+    quote, n = text[i], len(text)
+    i += 1
+    while i < n and text[i] != quote and text[i] != "\n":
+        i += 2 if text[i] == "\\" else 1
+    return i + 1
+
+
+def _skip_js_template(text, i):
+    """End of the template literal starting at text[i] ('`')."""
+    n = len(text)
+    i += 1
+    while i < n:
+        c = text[i]
+        if c == "\\":
+            i += 2
+        elif c == "`":
+            return i + 1
+        elif c == "$" and text.startswith("${", i):
+            i = _skip_js_code(text, i + 2)
+        else:
+            i += 1
+    return n
+
+
+def _skip_js_code(text, i):
+    """End of a '${...}' expression body starting at text[i]."""
+    depth, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c in "'\"":
+            i = _skip_js_string(text, i)
+            continue
+        if c == "`":
+            i = _skip_js_template(text, i)
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            if depth == 0:
+                return i + 1
+            depth -= 1
+        i += 1
+    return n
+
+
+def _skip_js_regex(text, i):
+    """End of the regex literal starting at text[i] ('/'), or None."""
+    n = len(text)
+    j, in_class = i + 1, False
+    while j < n:
+        c = text[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == "\n":
+            return None
+        if c == "[":
+            in_class = True
+        elif c == "]":
+            in_class = False
+        elif c == "/" and not in_class:
+            j += 1
+            while j < n and _js_word(text[j]):
+                j += 1
+            return j
+        j += 1
+    return None
+
+
+def minify_js(text):
+    """Drop comments and redundant whitespace from JS.
+
+    Strings, templates and regex literals are copied verbatim. Newlines
+    are kept wherever ASI might depend on them.
+    """
+    out = []
+    last = ""  # last significant character written
+    word = ""  # last identifier written, for regex-vs-division
+    gap = ""  # pending whitespace: "", " " or "\n"
+    i, n = 0, len(text)
+
+    while i < n:
+        c = text[i]
+        if c.isspace():
+            j = i
+            while j < n and text[j].isspace():
+                j += 1
+            gap = "\n" if "\n" in text[i:j] or gap == "\n" else " "
+            i = j
+            continue
+        if text.startswith("//", i):
+            j = text.find("\n", i)
+            i = n if j < 0 else j
+            gap = gap or " "
+            continue
+        if text.startswith("/*", i):
+            j = text.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            gap = "\n" if "\n" in text[i:j] or gap == "\n" else (gap or " ")
+            i = j
+            continue
+
+        if c in "'\"":
+            end = _skip_js_string(text, i)
+        elif c == "`":
+            end = _skip_js_template(text, i)
+        elif c == "/" and (not last or last in "(,=:[!&|?{};~+-*%<>^" or word in JS_REGEX_KEYWORDS):
+            end = _skip_js_regex(text, i) or i + 1
+        elif _js_word(c):
+            end = i + 1
+            while end < n and _js_word(text[end]):
+                end += 1
+        else:
+            end = i + 1
+        token = text[i:end]
+
+        if gap and last:
+            first = token[0]
+            if gap == "\n" and not (last in JS_OPEN_CHARS or first in JS_CLOSE_CHARS):
+                out.append("\n")
+            elif (
+                (_js_word(last) and _js_word(first))
+                or (last in "+-" and first in "+-")
+                or (last.isdigit() and first == ".")
+            ):
+                out.append(" ")
+        out.append(token)
+        gap = ""
+        last = token[-1]
+        word = token if _js_word(c) else ""
+        i = end
+
+    return "".join(out)
+
+
+# ----------------------
+# CSS
+# ----------------------
+
+
+def _squeeze(text, tight):
+    """Collapse whitespace outside strings; drop it next to 'tight' chars."""
+    parts, pos = [], 0
+    for m in CSS_STRING_RE.finditer(text):
+        parts.append((text[pos:m.start()], False))
+        parts.append((m.group(), True))
+        pos = m.end()
+    parts.append((text[pos:], False))
+    out = []
+    for chunk, is_string in parts:
+        if not is_string:
+            chunk = re.sub(r"\s+", " ", chunk)
+            chunk = re.sub(rf"\s*([{re.escape(tight)}])\s*", r"\1", chunk)
+        out.append(chunk)
+    return "".join(out).strip()
+
+
+def _css_items(text):
+    """Split CSS into (prelude, body) items; body is None for statements
+    like @import. Comments are dropped."""
+    items, depth, start, body_start, prelude = [], 0, 0, 0, ""
+    clean = []
+    for m in CSS_TOKEN_RE.finditer(text):
+        tok = m.group()
+        if tok.startswith("/*"):
+            clean.append((m.start(), m.end()))
+    if clean:
+        pieces, pos = [], 0
+        for a, b in clean:
+            pieces.append(text[pos:a])
+            pieces.append(" ")
+            pos = b
+        pieces.append(text[pos:])
+        text = "".join(pieces)
+
+    for m in CSS_TOKEN_RE.finditer(text):
+        tok = m.group()
+        if tok[0] in "\"'":
+            continue
+        if tok == "{":
+            if depth == 0:
+                prelude = text[start:m.start()].strip()
+                body_start = m.end()
+            depth += 1
+        elif tok == "}":
+            depth -= 1
+            if depth == 0:
+                items.append((prelude, text[body_start:m.start()]))
+                start = m.end()
+            depth = max(depth, 0)
+        elif tok == ";" and depth == 0:
+            statement = text[start:m.start()].strip()
+            if statement:
+                items.append((statement, None))
+            start = m.end()
+    return items
+
+
+def _strip_functional_pseudos(selector):
+    """Remove ':not(...)', ':is(...)' etc. with their arguments; what they
+    contain is negated or optional, so never required for a match."""
+    while True:
+        m = CSS_PSEUDO_FN_RE.search(selector)
+        if m is None:
+            return selector
+        depth, j = 1, m.end()
+        while j < len(selector) and depth:
+            depth += {"(": 1, ")": -1}.get(selector[j], 0)
+            j += 1
+        selector = selector[:m.start()] + selector[j:]
+
+
+def _unescape(name):
+    return re.sub(r"\\(.)", r"\1", name)
+
+
+class UsageIndex:
+    """Classes, ids and tags a page can use: its markup, plus every word
+    in its scripts and inline handlers (JS may add them at runtime)."""
+
+    def __init__(self, doc):
+        self.classes = set(STATE_CLASSES)
+        self.ids = set()
+        self.tags = {"html", "head", "body"}
+        words, self.prefixes = set(), set()
+        for node in doc.iter():
+            self.tags.add(node.tag)
+            self.classes.update(node.classes())
+            if node.attrs.get("id"):
+                self.ids.add(node.attrs["id"])
+            for name, value in node.attrs.items():
+                if name.startswith("on") and value:
+                    words.update(WORD_RE.findall(value))
+            if node.tag == "script":
+                code = node.text()
+                words.update(WORD_RE.findall(code))
+                # 'tile-' + kind: keep every class with that prefix
+                self.prefixes.update(re.findall(r"['\"`]([\w-]+-)['\"`]", code))
+        self.classes |= words
+        self.ids |= words
+        self.tags |= {w.lower() for w in words}
+
+    def has_class(self, name):
+        return name in self.classes or any(name.startswith(p) for p in self.prefixes)
+
+    def can_match(self, selector):
+        if "|" in selector or "&" in selector:
+            return True  # namespaces, nesting: keep
+        sel = CSS_ATTR_RE.sub("", _strip_functional_pseudos(selector))
+        sel = CSS_PSEUDO_RE.sub("", sel)
+        if not all(self.has_class(_unescape(c)) for c in CSS_CLASS_RE.findall(sel)):
+            return False
+        if not all(_unescape(i) in self.ids for i in CSS_ID_RE.findall(sel)):
+            return False
+        sel = CSS_ID_RE.sub("", CSS_CLASS_RE.sub("", sel))
+        return all(tag.lower() in self.tags for tag in CSS_TAG_RE.findall(sel))
+
+
+def _split_selectors(prelude):
+    out, depth, start = [], 0, 0
+    for i, c in enumerate(prelude):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            out.append(prelude[start:i])
+            start = i + 1
+    out.append(prelude[start:])
+    return [s.strip() for s in out if s.strip()]
+
+
+def optimize_css(text, usage=None):
+    """Minify CSS and, given a UsageIndex, drop rules that can't match."""
+    out = []
+    for prelude, body in _css_items(text):
+        if body is None:
+            out.append(_squeeze(prelude, ",:") + ";")
+        elif prelude.startswith("@"):
+            head = _squeeze(prelude, ",")
+            if prelude.lower().startswith(SHAKEABLE_AT_RULES) and "{" in body:
+                inner = optimize_css(body, usage)
+                if inner:
+                    out.append(f"{head}{{{inner}}}")
+            else:  # @font-face, @keyframes, ...
+                out.append(f"{head}{{{_minify_block(body)}}}")
+        elif "{" in body:  # nested rules: keep whole
+            out.append(f"{_squeeze(prelude, ',>~')}{{{_minify_block(body)}}}")
+        else:
+            selectors = _split_selectors(prelude)
+            if usage is not None:
+                selectors = [s for s in selectors if usage.can_match(s)]
+            decls = _squeeze(body, ":;,!").rstrip(";")
+            if selectors and decls:
+                out.append(f"{_squeeze(','.join(selectors), ',>~')}{{{decls}}}")
+    return "".join(out)
+
+
+def _minify_block(body):
+    if "{" not in body:
+        return _squeeze(body, ":;,!").rstrip(";")
+    return "".join(
+        f"{_squeeze(p, ',')}{{{_minify_block(b)}}}" if b is not None else f"{_squeeze(p, ':')};"
+        for p, b in _css_items(body)
+    )
+
+
+# ----------------------
+# HTML
+# ----------------------
+
+
+def _minify_markup(node):
+    kept = []
+    for child in node.children:
+        if isinstance(child, Node):
+            if child.tag not in PRESERVE_WS_TAGS:
+                _minify_markup(child)
+            kept.append(child)
+        elif child.startswith("<!--"):
+            if child.startswith("<!--[if"):
+                kept.append(child)
+        elif child.strip() or node.tag not in BLOCK_PARENTS:
+            kept.append(re.sub(r"\s+", " ", child))
+    # Drop whitespace-only text at the edges of <html>/<head>/<body>
+    if node.tag in ("html", "head", "body"):
+        while kept and isinstance(kept[0], str) and not kept[0].strip():
+            kept.pop(0)
+        while kept and isinstance(kept[-1], str) and not kept[-1].strip():
+            kept.pop()
+    node.children = kept
+
+
+def optimize_html(page, shake=True):
+    """Tree-shake and minify a baked page's CSS, JS and markup.
+
+    Returns (html, report) where report lists (asset, before, after) byte
+    sizes for every inline <style>/<script> and for the markup itself.
+    """
+    doc = parse_html(page)
+    usage = UsageIndex(doc) if shake else None
+    report = []
+    asset_before = asset_after = 0
+    for node in list(doc.iter()):
+        if node.tag not in ("style", "script") or node.attrs.get("src"):
+            continue
+        if node.tag == "script" and node.attrs.get("type") not in (
+            None, "", "text/javascript", "module", "application/javascript"
+        ):
+            continue
+        code = node.text()
+        label = INLINED_RE.search(code)
+        label = label.group(1) if label else f"inline <{node.tag}>"
+        new = optimize_css(code, usage) if node.tag == "style" else minify_js(code)
+        node.children = [new]
+        before, after = len(code.encode("utf-8")), len(new.encode("utf-8"))
+        report.append((label, before, after))
+        asset_before += before
+        asset_after += after
+
+    _minify_markup(doc)
+    html = "".join(doc.serialize([]))
+    if not html.lstrip().lower().startswith("<!doctype"):
+        html = "<!DOCTYPE html>" + html
+    total_before = len(page.encode("utf-8"))
+    total_after = len(html.encode("utf-8"))
+    report.append(("markup", total_before - asset_before, total_after - asset_after))
+    return html, report
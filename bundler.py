@@ -0,0 +1,160 @@
+import os
+import json
+
+from bake_engine import BLOCKLIST, Node, parse_html
+
+# Base64 digits of source map VLQs
+VLQ_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def _vlq(value):
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    out = ""
+    while True:
+        digit, value = value & 31, value >> 5
+        out += VLQ_DIGITS[digit | (32 if value else 0)]
+        if not value:
+            return out
+
+
+def build_bundle(kind, name, sources):
+    """Concatenate (url, text) sources into one bundle.
+
+    Returns (code, source_map): every bundle line maps back to its line in
+    the original file (source map v3). JS files are separated by a lone
+    ';' line, so each file's IIFE stays a statement of its own.
+    """
+    pieces, mappings = [], []
+    prev_src = prev_line = 0
+    for idx, (_, text) in enumerate(sources):
+        if not text.endswith("\n"):
+            text += "\n"
+        pieces.append(text)
+        for line in range(text.count("\n")):
+            mappings.append("A" + _vlq(idx - prev_src) + _vlq(line - prev_line) + "A")
+            prev_src, prev_line = idx, line
+        if kind == "js":
+            pieces.append(";\n")
+            mappings.append("")
+    source_map = {
+        "version": 3,
+        "file": name,
+        "sources": [url for url, _ in sources],
+        "names": [],
+        "mappings": ";".join(mappings),
+    }
+    return "".join(pieces), source_map
+
+
+class Bundler:
+    """Swap each run of adjacent local <script src> / stylesheet <link>
+    tags in a rendered page for one bundle served by the asset pipeline.
+
+    Bundles are named after the template ('js/classic.bundle.js', next to
+    their sources so relative url()s keep resolving), rebuilt
+    only when a source's content hash changes, and come with a source
+    map. Files in 'exclude' (by default BakeManager's blocklist, which the
+    in-browser baker matches by file name) are never bundled.
+    """
+
+    def __init__(self, assets, exclude=BLOCKLIST):
+        self.assets = assets
+        self.exclude = exclude
+        self._built = {}  # (rel, source digests) -> bundle Asset
+
+    def _local_asset(self, url):
+        if not url.startswith("/static/"):
+            return None
+        return self.assets.get(url[len("/static/"):].split("?", 1)[0])
+
+    def _member(self, node):
+        """(kind, Asset) if node can join a bundle, else None."""
+        if node.tag == "script":
+            if set(node.attrs) - {"src", "type"} or node.attrs.get("type") not in (
+                None, "text/javascript"
+            ):
+                return None  # async/defer/module/... keep their own tag
+            kind, url = "js", node.attrs.get("src") or ""
+        elif node.tag == "link":
+            rel = (node.attrs.get("rel") or "").lower()
+            if rel != "stylesheet" or set(node.attrs) - {"rel", "href", "type"}:
+                return None
+            kind, url = "css", node.attrs.get("href") or ""
+        else:
+            return None
+        asset = self._local_asset(url)
+        if asset is None or asset.path is None:
+            return None
+        if any(blocked in asset.rel for blocked in self.exclude):
+            return None
+        return kind, asset
+
+    def _runs(self, parent):
+        """Yield lists of adjacent same-kind members among parent's children
+        (only whitespace and comments may sit between them)."""
+        run, kind = [], None
+        for child in parent.children:
+            if isinstance(child, str):
+                if not child.strip() or child.startswith("<!--"):
+                    continue
+                member = None
+            else:
+                member = self._member(child)
+            if member is None or member[0] != kind:
+                if len(run) > 1:
+                    yield kind, run
+                run, kind = [], member[0] if member else None
+            if member is not None:
+                run.append((child, member[1]))
+        if len(run) > 1:
+            yield kind, run
+
+    def _bundle(self, rel, kind, members):
+        key = (rel, tuple(asset.digest for asset in members))
+        asset = self._built.get(key)
+        if asset is not None:
+            return asset
+        sources = [
+            (f"/static/{a.rel}", a.variants["identity"].decode("utf-8", errors="replace"))
+            for a in members
+        ]
+        code, source_map = build_bundle(kind, os.path.basename(rel), sources)
+        map_asset = self.assets.add(f"{rel}.map", json.dumps(source_map).encode("utf-8"))
+        map_name = os.path.basename(map_asset.fingerprinted)
+        if kind == "js":
+            code += f"//# sourceMappingURL={map_name}\n"
+        else:
+            code += f"/*# sourceMappingURL={map_name} */\n"
+        asset = self._built[key] = self.assets.add(rel, code.encode("utf-8"))
+        print(
+            f"[BUNDLE] {rel}: {len(members)} files, {asset.size / 1024:.0f} KB "
+            f"-> {asset.fingerprinted}"
+        )
+        return asset
+
+    def apply(self, template, html):
+        """Return the rendered page html with its bundles swapped in."""
+        doc = parse_html(html)
+        stem = os.path.splitext(template)[0]
+        counts = {}
+        for parent in [doc, *doc.iter()]:
+            for kind, run in list(self._runs(parent)):
+                n = counts[kind] = counts.get(kind, 0) + 1
+                rel = f"{kind}/{stem}{'' if n == 1 else f'-{n}'}.bundle.{kind}"
+                self._bundle(rel, kind, [asset for _, asset in run])
+                url = self.assets.url(rel)
+                if kind == "js":
+                    tag = Node("script", [("src", url)])
+                else:
+                    tag = Node("link", [("rel", "stylesheet"), ("href", url)])
+                run[0][0].replace_with(tag)
+                for node, _ in run[1:]:
+                    # Drop the indentation before it too
+                    siblings = node.parent.children
+                    i = siblings.index(node)
+                    if i and isinstance(siblings[i - 1], str) and not siblings[i - 1].strip():
+                        del siblings[i - 1]
+                    node.remove()
+        if not counts:
+            return html
+        return "".join(doc.serialize([]))
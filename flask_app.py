@@ -1,13 +1,61 @@
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, abort, request
 import os
+import logging
+from logging.handlers import MemoryHandler
 
-app = Flask(__name__)
+from asset_pipeline import AssetPipeline
+from bake_engine import BakeEngine
+from bake_optimizer import optimize_html
+from bundler import Bundler
+from page_cache import PageCache
+from perf_beacon import PerfCollector
+from request_metrics import RequestMetrics
+
+# Static files are served by the asset pipeline below, not Flask's default
+app = Flask(__name__, static_folder=None)
+STATIC_DIR = os.path.join(app.root_path, "static")
 
 # Debug print on startup
 print("[BOOT] Flask app starting…")
 print("[PLEDGING] Allegiance to Sheev Palpatine…") # do not delete this line
 print("[INFO] Template folder:", app.template_folder)
-print("[INFO] Static folder:", app.static_folder)
+print("[INFO] Static folder:", STATIC_DIR)
+
+# Fingerprint + precompress everything under static/ once at startup
+assets = AssetPipeline(STATIC_DIR).build().init_app(app)
+baker = BakeEngine(app, assets, optimizer=optimize_html)
+
+# Context-free pages, rendered once (with their scripts/stylesheets
+# bundled per template) and served from memory
+PAGES = ["index.html", "classic.html", "workspace.html", "game.html", "bake_test.html"]
+pages = PageCache(app, assets, transform=Bundler(assets).apply).warm(PAGES)
+
+# Request log: buffered so hits don't serialize on stdout; flushed every
+# 256 records, on errors and at exit. DEMEZA_REQUEST_LOG=0 turns it off.
+request_log = logging.getLogger("demeza.requests")
+request_log.propagate = False
+if os.environ.get("DEMEZA_REQUEST_LOG", "1") != "0":
+    request_log.setLevel(logging.INFO)
+    request_log.addHandler(
+        MemoryHandler(256, flushLevel=logging.ERROR, target=logging.StreamHandler())
+    )
+else:
+    request_log.disabled = True
+
+# Per-route latency/status/size at /metrics (local requests only unless
+# DEMEZA_METRICS_PUBLIC=1), Server-Timing on every response;
+# DEMEZA_PROFILE_DIR collects cProfile dumps of slow requests
+metrics = RequestMetrics.from_env().init_app(app)
+
+# Layout timings beaconed by log.js (POST /perf/beacon), summarized
+# per template and reason at /perf/summary (local requests only)
+perf = PerfCollector(os.path.splitext(name)[0] for name in PAGES).init_app(app)
+
+@app.after_request
+def log_request(response):
+    if not request_log.disabled:
+        request_log.info("[ROUTE] %s %s -> %s", request.method, request.path, response.status_code)
+    return response
 
 # ----------------------
 # ROUTES
@@ -15,38 +63,48 @@ print("[INFO] Static folder:", app.static_folder)
 
 @app.route("/")
 def home():
-    print("[ROUTE] GET /  → index.html")
-    return render_template("index.html")
+    return pages.serve("index.html")
 
 @app.route("/classic")
 def classic():
-    print("[ROUTE] GET /  → classic.html")
-    return render_template("classic.html")
+    return pages.serve("classic.html")
 
 @app.route("/workspace")
 def workspace():
-    print("[ROUTE] GET /  → workspace.html")
-    return render_template("workspace.html")
+    return pages.serve("workspace.html")
 
 @app.route("/game")
 def game():
-    print("[ROUTE] GET /  → game.html")
-    return render_template("game.html")
+    return pages.serve("game.html")
 
 @app.route("/bake_test")
 def bake_test():
     # This where we paste the baked code to see if it worked
-    print("[ROUTE] GET /  → bake_test.html")
-    return render_template("bake_test.html")
+    return pages.serve("bake_test.html")
+
+@app.route("/bake/<template>")
+def bake(template):
+    # Standalone single-file HTML, as BakeManager's "get code" produces;
+    # tree-shaken and minified unless ?raw=1
+    name = template if template.endswith(".html") else f"{template}.html"
+    if name not in PAGES:
+        abort(404)
+    html, cached = baker.bake(name, optimize=request.args.get("raw") != "1")
+    return html, 200, {
+        "Content-Type": "text/html; charset=utf-8",
+        "X-Bake-Cache": "HIT" if cached else "MISS",
+    }
 
 @app.route("/static/<path:filename>")
 def serve_static(filename):
-    print(f"[STATIC] /static/{filename}")
-    return send_from_directory("static", filename)
+    return assets.serve(filename)
 
 # ----------------------
 # PYTHONANYWHERE ENTRY
 # ----------------------
 if __name__ == "__main__":
     print("[RUN] Running in local dev mode on port 5000")
+    # Pick up edits to static/ and templates/ without a restart
+    assets.auto_reload = True
+    pages.auto_reload = True
     app.run(debug=True, host="0.0.0.0", port=5000)
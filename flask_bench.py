@@ -0,0 +1,298 @@
+"""Load-test and latency benchmark for every flask_app.py route.
+
+Each route is driven by --concurrency threads for --duration seconds,
+twice: cold (no validators, full body every time) and warm (the ETag
+sent back as If-None-Match, so a 304). By default requests call the app
+in-process as a pure WSGI app; --server runs it under werkzeug's
+threaded server on 127.0.0.1 and goes through real sockets.
+
+Usage:
+    python flask_bench.py                          # default routes, in-process
+    python flask_bench.py --server -c 8 -d 5 --json after.json
+    python flask_bench.py --route /classic --route /static/css/demeza_base.css
+    python flask_bench.py --json after.json --baseline before.json
+    python flask_bench.py --request-log            # with the request log on
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import http.client
+from pathlib import Path
+
+# Asset picked for the default /static/<fingerprinted> route
+DEFAULT_ASSET = "css/demeza_base.css"
+DEFAULT_ROUTES = [
+    "/", "/classic", "/workspace", "/game", "/bake_test", "/bake/classic",
+    f"/static/{DEFAULT_ASSET}",
+]
+PHASES = ("cold", "warm")
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank q-percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# ----------------------
+# Clients: one per worker thread
+# ----------------------
+
+class WsgiClient:
+    """Calls the WSGI app directly, as a server would."""
+
+    def __init__(self, app, accept_encoding):
+        from werkzeug.test import EnvironBuilder
+
+        self.app = app
+        self.base = EnvironBuilder(
+            path="/", headers={"Accept-Encoding": accept_encoding}
+        ).get_environ()
+
+    def get(self, path, headers=None):
+        """(status, etag, body bytes)."""
+        environ = dict(self.base)
+        environ["PATH_INFO"] = path
+        environ["wsgi.input"] = io.BytesIO()
+        for name, value in (headers or {}).items():
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+        status_headers = []
+
+        def start_response(status, headers, exc_info=None):
+            status_headers[:] = [status, headers]
+
+        app_iter = self.app(environ, start_response)
+        try:
+            size = sum(len(chunk) for chunk in app_iter)
+        finally:
+            close = getattr(app_iter, "close", None)
+            if close is not None:
+                close()
+        status, response_headers = status_headers
+        etag = next((v for k, v in response_headers if k.lower() == "etag"), None)
+        return int(status.split(None, 1)[0]), etag, size
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    """Keep-alive HTTP/1.1 connection to the local server."""
+
+    def __init__(self, port, accept_encoding):
+        self.port = port
+        self.accept_encoding = accept_encoding
+        self.conn = None
+
+    def get(self, path, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        self.conn.request(
+            "GET", path, headers={"Accept-Encoding": self.accept_encoding, **(headers or {})}
+        )
+        response = self.conn.getresponse()
+        size = len(response.read())
+        if response.will_close:
+            self.close()
+        return response.status, response.getheader("ETag"), size
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def start_server(app):
+    """Serve app on 127.0.0.1 in a daemon thread; returns the server."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class Handler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ----------------------
+# Driving a route
+# ----------------------
+
+def drive(make_client, path, phase, concurrency, duration, warmup):
+    """Run one route/phase; returns its result dict."""
+    probe = make_client()
+    status, etag, _ = probe.get(path)
+    probe.close()
+    if status != 200:
+        return {"error": f"HTTP {status}"}
+    headers = {"If-None-Match": etag} if phase == "warm" and etag else {}
+    expected = 304 if headers else 200
+
+    start = threading.Barrier(concurrency + 1)
+    results = []  # (latencies, bytes, errors) per worker
+
+    def worker():
+        client = make_client()
+        latencies, nbytes, errors = [], 0, 0
+        try:
+            for _ in range(warmup):
+                client.get(path, headers)
+            start.wait()
+            deadline = time.perf_counter() + duration
+            while True:
+                t0 = time.perf_counter()
+                if t0 >= deadline:
+                    break
+                try:
+                    status, _, size = client.get(path, headers)
+                except (OSError, http.client.HTTPException):
+                    client.close()
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - t0)
+                nbytes += size
+                if status != expected:
+                    errors += 1
+        finally:
+            client.close()
+            results.append((latencies, nbytes, errors))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies = sorted(x for r in results for x in r[0])
+    ms = lambda s: round(s * 1000, 3) if s is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": sum(r[2] for r in results),
+        "req_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "mb_per_s": round(sum(r[1] for r in results) / elapsed / 1e6, 2) if elapsed else 0,
+        "status": expected,
+    }
+
+
+def compare(routes, baseline, max_slowdown):
+    """Print req/s and p99 ratios against a baseline; True if all within limit."""
+    ok = True
+    print(f"\n{'route':<48}{'phase':<6}{'base r/s':>10}{'now r/s':>10}"
+          f"{'base p99':>10}{'now p99':>10}")
+    for key, now in routes.items():
+        base = baseline.get("routes", {}).get(key)
+        if not base or "error" in base or "error" in now or not now["req_per_s"]:
+            continue
+        path, phase = key.rsplit(" ", 1)
+        flag = ""
+        if base["req_per_s"] / now["req_per_s"] > max_slowdown:
+            ok = False
+            flag = "  REGRESSION"
+        print(f"{path:<48}{phase:<6}{base['req_per_s']:>10.0f}{now['req_per_s']:>10.0f}"
+              f"{base['p99_ms']:>10.2f}{now['p99_ms']:>10.2f}{flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--route", action="append", dest="routes",
+                        help="path to drive (repeatable; default: every page, "
+                             "/bake/classic and one plain and one fingerprinted asset)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("-d", "--duration", type=float, default=2.0,
+                        help="seconds per route and phase")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="untimed requests per worker before each run")
+    parser.add_argument("--phase", choices=PHASES, action="append", dest="phases",
+                        help="cold and/or warm (default: both)")
+    parser.add_argument("--server", action="store_true",
+                        help="go through a local threaded HTTP server")
+    parser.add_argument("--accept-encoding", default="gzip")
+    parser.add_argument("--request-log", action="store_true",
+                        help="keep the per-request log on (DEMEZA_REQUEST_LOG=1)")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=1.25,
+                        help="fail when a route's req/s drops by this factor")
+    args = parser.parse_args(argv)
+
+    os.environ["DEMEZA_REQUEST_LOG"] = "1" if args.request_log else "0"
+    import flask_app
+
+    paths = args.routes or DEFAULT_ROUTES + [
+        flask_app.assets.url(DEFAULT_ASSET)
+    ]
+    phases = args.phases or list(PHASES)
+    server = None
+    if args.server:
+        server = start_server(flask_app.app)
+        make_client = lambda: HttpClient(server.server_port, args.accept_encoding)
+    else:
+        make_client = lambda: WsgiClient(flask_app.app, args.accept_encoding)
+
+    routes = {}
+    print(f"{'route':<48}{'phase':<6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'errors':>8}")
+    try:
+        for path in paths:
+            for phase in phases:
+                r = routes[f"{path} {phase}"] = drive(
+                    make_client, path, phase, args.concurrency, args.duration,
+                    args.warmup,
+                )
+                if "error" in r:
+                    print(f"{path:<48}{phase:<6}  {r['error']}")
+                    continue
+                print(f"{path:<48}{phase:<6}{r['req_per_s']:>9.0f}{r['p50_ms']:>9.3f}"
+                      f"{r['p95_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['errors']:>8}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    params = {
+        "mode": "server" if args.server else "wsgi",
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "accept_encoding": args.accept_encoding,
+        "request_log": args.request_log,
+    }
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "routes": routes,
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"wrote {args.json}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("params") != params:
+            print("warning: baseline was recorded with different parameters")
+        if not compare(routes, baseline, args.max_slowdown):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
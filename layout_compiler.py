@@ -0,0 +1,467 @@
+"""Headless layout compiler: tile-spec JSON -> baked single-file pages.
+
+A spec is a JSON object:
+
+    {
+      "name": "acme",                  # output file stem (default: file stem)
+      "title": "Acme | Home",          # optional <title>
+      "template": "classic",           # optional: classic / workspace / game
+      "rows": [                        # or "tiles": [...] in editor order
+        [{"preset": "Logo"}],
+        [{"items": [{"heading": "Join"}, {"input": "Email"}, {"button": "GO"}]}],
+        [{"type": "workspace"}]
+      ]
+    }
+
+Tile types are normal (default), ghost, stretch, workspace and game; a
+tile takes either "items" (one-key objects: title, heading, text, input,
+button, textarea, image, slider, file, html) or a "preset" named like the
+editor's Add Tile menu. The README rules apply: at most three tiles per
+desktop row, stretch/workspace/game tiles take a whole row, and tiles
+after a workspace/game tile are dropped. In "rows" form a lone normal tile
+is centered between ghost tiles and other short rows are padded with
+ghosts; in "tiles" form a normal tile may ask for "center": true.
+
+The page is rendered through the matching Jinja template with the spec's
+tiles in #mainGrid, then baked like BakeManager.generateFinalCode().
+
+Usage:
+    python layout_compiler.py specs/ -o dist/pages -j 8
+    python layout_compiler.py acme.json beta.json -o out --optimize
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from html import escape
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Flask, render_template
+
+from asset_pipeline import AssetPipeline
+from bake_engine import BakeEngine, parse_html
+from bake_optimizer import optimize_html
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TEMPLATES = {
+    "classic": "classic.html",
+    "workspace": "workspace.html",
+    "game": "game.html",
+}
+TILE_TYPES = ("normal", "ghost", "stretch", "workspace", "game")
+# Tiles that take a whole desktop row
+WIDE_TYPES = ("stretch", "workspace", "game")
+ROW_WIDTH = 3
+ITEM_KINDS = (
+    "title", "heading", "text", "input", "button",
+    "textarea", "image", "slider", "file", "html",
+)
+SLIDER_DEFAULTS = {"min": 0, "max": 100, "step": 1, "value": 50}
+
+# The editor's Add Tile menu (TileTemplates in classic.html)
+PRESETS = {
+    "Mail List": {
+        "items": [{"heading": "Join Mailing List"}, {"input": "Enter your email"},
+                  {"button": "SUBMIT"}],
+    },
+    "Logo": {"type": "stretch", "items": [{"title": "LOGO"}]},
+    "Settings Smooth": {
+        "items": [{"heading": "Settings Smooth"}, {"slider": {}}],
+    },
+    "Settings Snap": {
+        "classes": ["tile-snap-logic"],
+        "items": [
+            {"heading": "Settings Snap"},
+            {"html": '<img src="https://placehold.co/64x64/2EC4B6/ffffff?text=0" '
+                     'class="snap-target-img" style="width:64px; height:64px; '
+                     'border-radius:0; object-fit:cover;" alt="Snap preview">'},
+            {"slider": {"min": 0, "max": 2, "step": 1, "value": 0}},
+        ],
+    },
+    "Textarea Input": {
+        "type": "stretch", "items": [{"heading": "Textarea Input"}, {"textarea": ""}],
+    },
+    "File Upload": {"items": [{"heading": "Upload File"}, {"file": "CHOOSE FILE"}]},
+}
+
+
+class SpecError(ValueError):
+    """A tile spec that breaks the layout rules."""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _slider(value, where):
+    """Slider settings with defaults filled in."""
+    if value is None:
+        value = {}
+    if not isinstance(value, dict):
+        raise SpecError(
+            f"{where}: a slider takes an object of {', '.join(SLIDER_DEFAULTS)}"
+        )
+    for key, setting in value.items():
+        if key not in SLIDER_DEFAULTS:
+            raise SpecError(f"{where}: unknown slider setting {key!r}")
+        if not _is_number(setting):
+            raise SpecError(f"{where}: slider {key} must be a number")
+    return {**SLIDER_DEFAULTS, **value}
+
+
+def _tile(raw, where):
+    """Normalize one spec tile into {type, classes, items, center}."""
+    if not isinstance(raw, dict):
+        raise SpecError(f"{where}: a tile must be an object")
+    preset = raw.get("preset")
+    if preset is not None:
+        if not isinstance(preset, str) or preset not in PRESETS:
+            raise SpecError(f"{where}: unknown preset {preset!r}")
+        raw = {**PRESETS[preset], **{k: v for k, v in raw.items() if k != "preset"}}
+    kind = raw.get("type", "normal")
+    if not isinstance(kind, str) or kind not in TILE_TYPES:
+        raise SpecError(f"{where}: unknown tile type {kind!r}")
+    classes = raw.get("classes") or []
+    if not isinstance(classes, list) or not all(
+        isinstance(c, str) and c and not any(ch.isspace() for ch in c)
+        for c in classes
+    ):
+        raise SpecError(f"{where}: classes must be a list of class names")
+    entries = raw.get("items") or []
+    if not isinstance(entries, list):
+        raise SpecError(f"{where}: items must be a list")
+
+    items = []
+    for n, entry in enumerate(entries):
+        at = f"{where}, item {n + 1}"
+        if not isinstance(entry, dict) or len(entry) != 1:
+            raise SpecError(f"{at}: use one {{kind: value}} pair")
+        (item_kind, value), = entry.items()
+        if item_kind not in ITEM_KINDS:
+            raise SpecError(f"{at}: unknown item {item_kind!r}")
+        if item_kind == "slider":
+            value = _slider(value, at)
+        elif not isinstance(value, str):
+            raise SpecError(f"{at}: a {item_kind} takes a string")
+        items.append({
+            "kind": item_kind,
+            "value": value,
+            "snap": "tile-snap-logic" in classes,
+        })
+    if kind in ("normal", "stretch") and not items:
+        raise SpecError(f"{where}: a {kind} tile needs items or a preset")
+    return {
+        "type": kind,
+        "classes": list(classes),
+        "items": items,
+        "center": bool(raw.get("center")),
+    }
+
+
+GHOST = {"type": "ghost", "classes": [], "items": [], "center": False}
+
+
+def plan_tiles(spec):
+    """Validate spec's tiles against the layout rules.
+
+    Returns (template file, tiles in grid order, warnings).
+    """
+    warnings = []
+    if "rows" in spec:
+        tiles = []
+        rows = spec["rows"]
+        if not isinstance(rows, list) or not all(isinstance(r, list) for r in rows):
+            raise SpecError("rows must be a list of lists of tiles")
+        for r, row in enumerate(rows):
+            row = [_tile(t, f"row {r + 1}, tile {c + 1}") for c, t in enumerate(row)]
+            width = sum(ROW_WIDTH if t["type"] in WIDE_TYPES else 1 for t in row)
+            if width > ROW_WIDTH:
+                raise SpecError(
+                    f"row {r + 1}: {width} columns (max {ROW_WIDTH} tiles per row)"
+                )
+            if len(row) == 1 and row[0]["type"] == "normal":
+                row = [GHOST, row[0], GHOST]
+            elif r < len(rows) - 1:
+                # Ghosts keep the next row from flowing up into the gap
+                row += [GHOST] * (ROW_WIDTH - width)
+            tiles.extend(row)
+    else:
+        tiles = []
+        raw_tiles = spec.get("tiles") or []
+        if not isinstance(raw_tiles, list):
+            raise SpecError("tiles must be a list")
+        for n, raw in enumerate(raw_tiles):
+            tile = _tile(raw, f"tile {n + 1}")
+            if tile["center"]:
+                # The leading ghost is what has to start the row
+                tiles.extend([{**GHOST, "center": True}, {**tile, "center": False}, GHOST])
+            else:
+                tiles.append(tile)
+
+    # Walk the desktop rows
+    col, grid, main = 0, [], None
+    for n, tile in enumerate(tiles):
+        if tile["type"] in WIDE_TYPES:
+            if col:
+                raise SpecError(
+                    f"tile {n + 1}: a {tile['type']} tile must start a row "
+                    f"(row has {col} tile{'s' if col > 1 else ''}; pad it with ghosts)"
+                )
+            grid.append(tile)
+            if tile["type"] in ("workspace", "game"):
+                main = tile["type"]
+                if n + 1 < len(tiles):
+                    warnings.append(
+                        f"{len(tiles) - n - 1} tiles after the {main} tile are ignored"
+                    )
+                break
+            continue
+        if tile["center"] and col:
+            raise SpecError(f"tile {n + 1}: a centered tile must start a row")
+        grid.append(tile)
+        col = (col + 1) % ROW_WIDTH
+    if not grid:
+        raise SpecError("spec has no tiles")
+    if all(t["type"] == "ghost" for t in grid):
+        raise SpecError("spec has only ghost tiles")
+
+    template = spec.get("template") or main or "classic"
+    if not isinstance(template, str) or template not in TEMPLATES:
+        raise SpecError(f"unknown template {template!r}")
+    if main is not None and template != main:
+        raise SpecError(f"a {main} tile needs the {main} template, not {template}")
+    return TEMPLATES[template], grid, warnings
+
+
+class LayoutCompiler:
+    """Compile tile specs into baked pages.
+
+    Keeps the parsed Jinja templates, the fingerprinted assets and each
+    template's rendered page in memory, so one instance compiles any
+    number of specs without touching the templates or static/ again.
+    """
+
+    def __init__(self, assets=None, optimize=False):
+        self.app = Flask(
+            "layout_compiler",
+            root_path=HERE,
+            template_folder="templates",
+            static_folder=None,
+        )
+        if assets is None:
+            assets = AssetPipeline(os.path.join(HERE, "static")).build()
+        self.assets = assets.init_app(self.app)
+        self.baker = BakeEngine(self.app, self.assets)
+        self.optimize = optimize
+        self._pages = {}  # template file -> rendered page html
+        self._tiles = self.app.jinja_env.get_template("tiles.html")
+
+    def _page(self, template):
+        html = self._pages.get(template)
+        if html is None:
+            with self.app.app_context():
+                html = self._pages[template] = render_template(template)
+        return html
+
+    def compile(self, spec):
+        """Return (html, warnings) for spec (a dict)."""
+        template, tiles, warnings = plan_tiles(spec)
+        doc = parse_html(self._page(template))
+        grid = doc.find("#mainGrid")
+        if grid is None:
+            raise SpecError(f"{template} has no #mainGrid")
+        # Keep the indentation before the grid's closing tag
+        tail = grid.children[-1:] if grid.children and isinstance(grid.children[-1], str) else []
+        grid.children = parse_html(self._tiles.render(tiles=tiles).rstrip()).children + tail
+        for child in grid.children:
+            if not isinstance(child, str):
+                child.parent = grid
+
+        title = spec.get("title")
+        if title is not None and not isinstance(title, str):
+            raise SpecError("title must be a string")
+        if title is not None:
+            node = doc.find("title")
+            if node is not None:
+                node.children = [escape(title)]
+
+        html, _ = self.baker.bake_html("".join(doc.serialize([])))
+        if self.optimize:
+            html, _ = optimize_html(html)
+        return html, warnings
+
+
+def _is_name(name):
+    return isinstance(name, str) and name != ""
+
+
+def load_specs(paths):
+    """(name, spec) pairs from JSON files and directories of them, and the
+    number of files and specs that could not be loaded (each is printed
+    and skipped).
+
+    A file holds one spec object (named after the file unless it has a
+    "name") or a list of specs that each have a "name".
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names.sort()
+                files.extend(
+                    os.path.join(dir_path, name)
+                    for name in sorted(file_names)
+                    if name.endswith(".json")
+                )
+        else:
+            files.append(path)
+
+    specs, failed = [], 0
+    for path in files:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            print(f"[COMPILE] {path}: {e}")
+            failed += 1
+            continue
+        if isinstance(data, dict):
+            name = data.get("name", os.path.splitext(os.path.basename(path))[0])
+            if not _is_name(name):
+                print(f"[COMPILE] {path}: \"name\" must be a non-empty string")
+                failed += 1
+                continue
+            specs.append((name, data))
+            continue
+        if not isinstance(data, list):
+            print(f"[COMPILE] {path}: expected a spec object or a list of them")
+            failed += 1
+            continue
+        for n, spec in enumerate(data):
+            if not isinstance(spec, dict) or not _is_name(spec.get("name")):
+                print(f"[COMPILE] {path}: spec {n + 1} needs a name")
+                failed += 1
+                continue
+            specs.append((spec["name"], spec))
+    return specs, failed
+
+
+# Per-process compiler used by pool workers (set by _init_worker)
+_worker_compiler = None
+
+
+def _init_worker(assets, optimize):
+    global _worker_compiler
+    _worker_compiler = LayoutCompiler(assets, optimize)
+
+
+def _compile_in_worker(job):
+    """Compile and write one spec; returns (name, bytes, warnings, error)."""
+    name, spec, out_path = job
+    try:
+        html, warnings = _worker_compiler.compile(spec)
+        data = html.encode("utf-8")
+        tmp = f"{out_path}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, out_path)
+    except SpecError as e:
+        return name, 0, [], str(e)
+    except Exception as e:
+        # Counted as this spec failing; the rest of the batch carries on
+        return name, 0, [], f"{type(e).__name__}: {e}"
+    return name, len(data), warnings, None
+
+
+def compile_all(specs, out_dir, workers=None, optimize=False):
+    """Compile (name, spec) pairs into out_dir/<name>.html.
+
+    Returns the number of failed specs.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs, failed, seen = [], 0, set()
+    for name, spec in specs:
+        if (
+            not _is_name(name)
+            or os.path.basename(name) != name
+            or name in (".", "..")
+        ):
+            print(f"[COMPILE] {name!r}: invalid page name")
+            failed += 1
+            continue
+        if name in seen:
+            print(f"[COMPILE] {name}: duplicate page name")
+            failed += 1
+            continue
+        if not isinstance(spec, dict):
+            print(f"[COMPILE] {name}: a spec must be an object")
+            failed += 1
+            continue
+        seen.add(name)
+        jobs.append((name, spec, os.path.join(out_dir, f"{name}.html")))
+
+    t0 = time.perf_counter()
+    assets = AssetPipeline(os.path.join(HERE, "static")).build()
+    workers = min(workers or os.cpu_count() or 1, len(jobs) or 1)
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(assets, optimize),
+        )
+        # Big chunks: each job is small, and results stream back in order
+        results = pool.map(
+            _compile_in_worker, jobs, chunksize=max(1, len(jobs) // (workers * 8))
+        )
+    else:
+        pool = None
+        _init_worker(assets, optimize)
+        results = map(_compile_in_worker, jobs)
+
+    total = compiled = 0
+    try:
+        for name, size, warnings, error in results:
+            if error is not None:
+                print(f"[COMPILE] {name}: {error}")
+                failed += 1
+                continue
+            total += size
+            compiled += 1
+            for warning in warnings:
+                print(f"[COMPILE] {name}: warning: {warning}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    print(
+        f"[COMPILE] {compiled} pages, "
+        f"{total / 1024:.0f} KB -> {out_dir} in "
+        f"{time.perf_counter() - t0:.1f} s ({workers} workers)"
+        + (f", {failed} failed" if failed else "")
+    )
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("specs", nargs="+", help="spec files or directories of them")
+    parser.add_argument("-o", "--out", default="compiled", help="output directory")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None,
+        help="worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--optimize", action="store_true",
+        help="tree-shake and minify each page (as /bake/<template>)",
+    )
+    args = parser.parse_args(argv)
+    specs, failed = load_specs(args.specs)
+    failed += compile_all(specs, args.out, args.workers, args.optimize)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
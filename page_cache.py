@@ -0,0 +1,106 @@
+import os
+import hashlib
+import time
+
+from flask import render_template
+from jinja2 import meta
+
+from asset_pipeline import encode_variants, send_variants
+
+# Pages link fingerprinted assets, so they must be revalidated (cheap: 304)
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+def template_files(env, name):
+    """Files of a template and everything it includes/extends."""
+    files, todo, seen = [], [name], set()
+    while todo:
+        current = todo.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        source, filename, _ = env.loader.get_source(env, current)
+        files.append(filename)
+        todo.extend(
+            ref for ref in meta.find_referenced_templates(env.parse(source)) if ref
+        )
+    return files
+
+
+def _mtimes(files):
+    stamps = []
+    for path in files:
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return stamps
+
+
+class Page:
+    """A rendered template: encoded body, variants and source mtimes."""
+
+    def __init__(self, body, files, generation):
+        data = body.encode("utf-8")
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        self.variants = encode_variants(data, "text/html")
+        self.files = files
+        self.mtimes = _mtimes(files)
+        self.generation = generation
+
+
+class PageCache:
+    """Render each context-free template once and serve it from memory,
+    precompressed, with a strong ETag and 304s for If-None-Match.
+
+    With auto_reload (dev mode) a page is re-rendered when any of its
+    template files changes, or when an asset it may link gets a new
+    fingerprint. 'transform' (e.g. Bundler.apply) rewrites each freshly
+    rendered page as transform(name, html).
+    """
+
+    def __init__(self, app, assets, auto_reload=False, transform=None):
+        self.app = app
+        self.assets = assets
+        self.auto_reload = auto_reload
+        self.transform = transform
+        self.pages = {}  # template name -> Page
+
+    def _render(self, name):
+        files = template_files(self.app.jinja_env, name)
+        body = render_template(name)
+        if self.transform is not None:
+            body = self.transform(name, body)
+        page = Page(body, files, self.assets.generation)
+        self.pages[name] = page
+        return page
+
+    def warm(self, names):
+        """Prerender names at startup."""
+        t0 = time.perf_counter()
+        with self.app.app_context():
+            for name in names:
+                self._render(name)
+        print(
+            f"[PAGES] {len(names)} pages prerendered in "
+            f"{(time.perf_counter() - t0) * 1000:.0f} ms"
+        )
+        return self
+
+    def get(self, name):
+        page = self.pages.get(name)
+        if page is None:
+            return self._render(name)
+        if self.auto_reload and (
+            _mtimes(page.files) != page.mtimes
+            or self.assets.refresh() != page.generation
+        ):
+            return self._render(name)
+        return page
+
+    def serve(self, name):
+        """Response for a GET of the page rendered from template name."""
+        page = self.get(name)
+        return send_variants(
+            page.variants, page.digest, "text/html", PAGE_CACHE_CONTROL
+        )
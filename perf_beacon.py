@@ -0,0 +1,159 @@
+import json
+import math
+import threading
+from collections import deque
+
+from flask import abort, jsonify, request
+
+# A beacon bigger than this is not from log.js (it sends <= 50 samples)
+MAX_BEACON_BYTES = 16 * 1024
+# Samples kept per (template, kind, reason); percentiles use the latest
+RESERVOIR = 2048
+# The kinds log.js sends (WorkspaceSystem fits, LayoutBus notifies); with
+# MAX_REASONS they bound the table at templates x KINDS x MAX_REASONS
+KINDS = frozenset({"fit", "notify"})
+# Distinct reasons kept per template and kind; later ones are dropped
+MAX_REASONS = 64
+MAX_REASON_CHARS = 64
+LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+
+def _percentile(sorted_values, q):
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class ReasonStats:
+    """Latest durations and the event count for one kind/reason."""
+
+    __slots__ = ("durations", "samples", "events")
+
+    def __init__(self):
+        self.durations = deque(maxlen=RESERVOIR)
+        self.samples = 0  # every duration ever received
+        self.events = 0  # counts sent as totals (e.g. LayoutBus notifies)
+
+    def summary(self):
+        out = {"samples": self.samples, "events": self.events}
+        if self.durations:
+            values = sorted(self.durations)
+            out.update(
+                p50_ms=_percentile(values, 50),
+                p90_ms=_percentile(values, 90),
+                p99_ms=_percentile(values, 99),
+                max_ms=values[-1],
+            )
+        return out
+
+
+class PerfCollector:
+    """Collect layout timings beaconed by log.js and summarize them.
+
+    POST /perf/beacon takes log.js's batches: {"template", "samples":
+    [[kind, reason, ms], ...], "counts": [[kind, reason, n], ...]}.
+    GET /perf/summary (loopback only) returns per-template, per-kind,
+    per-reason percentiles of the latest RESERVOIR durations; ?template=
+    narrows it to one page.
+    """
+
+    def __init__(self, templates):
+        self.templates = frozenset(templates)
+        self.stats = {}  # (template, kind, reason) -> ReasonStats
+        self._reasons = {}  # (template, kind) -> distinct reasons seen
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.add_url_rule(
+            "/perf/beacon", "perf_beacon", self.beacon, methods=["POST"]
+        )
+        app.add_url_rule("/perf/summary", "perf_summary", self.summary_view)
+        return self
+
+    def _entry(self, template, kind, reason):
+        key = (template, kind, reason)
+        stats = self.stats.get(key)
+        if stats is None:
+            seen = self._reasons.get((template, kind), 0)
+            if seen >= MAX_REASONS:
+                return None
+            self._reasons[(template, kind)] = seen + 1
+            stats = self.stats[key] = ReasonStats()
+        return stats
+
+    def add(self, batch):
+        """Fold one decoded beacon in; returns False if it is malformed."""
+        if not isinstance(batch, dict):
+            return False
+        template = batch.get("template")
+        if not isinstance(template, str) or template not in self.templates:
+            return False
+        samples, counts = batch.get("samples", []), batch.get("counts", [])
+        if not isinstance(samples, list) or not isinstance(counts, list):
+            return False
+        rows = []
+        # Durations are finite numbers; counts are whole numbers (json.loads
+        # also yields NaN and Infinity, which would break the summary)
+        checks = ((samples, "ms", (int, float)), (counts, "n", int))
+        for kind_rows, field, number in checks:
+            for row in kind_rows:
+                if (
+                    not isinstance(row, list)
+                    or len(row) != 3
+                    or not isinstance(row[0], str)
+                    or row[0] not in KINDS
+                    or not isinstance(row[1], str)
+                    or isinstance(row[2], bool)
+                    or not isinstance(row[2], number)
+                    or (isinstance(row[2], float) and not math.isfinite(row[2]))
+                    or row[2] < 0
+                ):
+                    return False
+                rows.append((field, row[0], row[1][:MAX_REASON_CHARS], row[2]))
+        with self._lock:
+            for field, kind, reason, value in rows:
+                stats = self._entry(template, kind, reason)
+                if stats is None:
+                    continue
+                if field == "ms":
+                    stats.durations.append(value)
+                    stats.samples += 1
+                else:
+                    stats.events += value
+        return True
+
+    def summary(self, template=None):
+        with self._lock:
+            items = [
+                (key, stats.summary())
+                for key, stats in self.stats.items()
+                if template is None or key[0] == template
+            ]
+        out = {}
+        for (tmpl, kind, reason), summary in sorted(items):
+            out.setdefault(tmpl, {}).setdefault(kind, {})[reason] = summary
+        return out
+
+    # ----------------------
+    # Views
+    # ----------------------
+
+    def beacon(self):
+        if (request.content_length or 0) > MAX_BEACON_BYTES:
+            abort(413)
+        data = request.get_data(cache=False)
+        if len(data) > MAX_BEACON_BYTES:
+            abort(413)
+        try:
+            batch = json.loads(data)
+        except ValueError:
+            abort(400)
+        if not self.add(batch):
+            abort(400)
+        return "", 204
+
+    def summary_view(self):
+        if request.remote_addr not in LOCAL_ADDRS:
+            abort(403)
+        response = jsonify(self.summary(request.args.get("template")))
+        response.headers["Cache-Control"] = "no-store"
+        return response
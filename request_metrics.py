@@ -0,0 +1,352 @@
+import os
+import re
+import time
+import random
+import weakref
+import cProfile
+import threading
+from bisect import bisect_left
+
+from flask import request
+from werkzeug.wsgi import ClosingIterator
+
+from perf_beacon import LOCAL_ADDRS
+
+# Latency histogram bucket bounds, seconds (Prometheus 'le' labels)
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+# Route label for requests no URL rule matched (404s, /metrics itself)
+UNMATCHED = "<unmatched>"
+# A route's p99 is only trusted as a slow threshold after this many hits
+MIN_P99_SAMPLES = 100
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RouteStats:
+    """Counters for one (route, method), owned by one thread."""
+
+    __slots__ = ("buckets", "count", "seconds", "render_seconds", "bytes", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.render_seconds = 0.0
+        self.bytes = 0
+        self.statuses = {}  # status code -> count
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.seconds += other.seconds
+        self.render_seconds += other.render_seconds
+        self.bytes += other.bytes
+        for status, n in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + n
+
+    def quantile_bound(self, q):
+        """Upper bucket bound holding the q-quantile, or None if +Inf."""
+        rank, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+
+def _merge_into(total, shard):
+    for key, stats in list(shard.items()):
+        into = total.get(key)
+        if into is None:
+            into = total[key] = RouteStats()
+        into.merge(stats)
+
+
+def _label(value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return value.replace("\n", "\\n")
+
+
+def _slug(route):
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+class _ThreadToken:
+    """Lives in a thread's local storage, so it dies with the thread."""
+
+
+class _Body:
+    """Body iterable that counts the bytes actually sent."""
+
+    def __init__(self, app_iter, sent):
+        self.app_iter = app_iter
+        self.sent = sent
+
+    def __iter__(self):
+        for chunk in self.app_iter:
+            self.sent[0] += len(chunk)
+            yield chunk
+
+
+class RequestMetrics:
+    """WSGI middleware: per-route latency histograms, status codes and
+    response sizes, served in Prometheus text format at /metrics.
+
+    Each thread counts into its own RouteStats, so the request path takes
+    no lock; /metrics merges them. When a thread ends its counts are folded
+    into a shared total, so a server that starts a thread per request
+    keeps one set of counters per live thread, not per request. Responses get a Server-Timing header:
+    'render' is the view (before_request to after_request), 'io' the rest
+    of the app's time until headers go out (routing, request parsing,
+    encoding). Latency in the histogram runs until the body is closed.
+
+    With profile_dir set, a 'profile_sample' fraction of requests run
+    under cProfile; one slower than slow_ms (default: its route's current
+    p99) is dumped there as <time>-<pid>-<n>-<route>-<ms>ms.prof.
+
+    /metrics answers local clients only (like /perf/summary) unless
+    metrics_local_only is False.
+    """
+
+    def __init__(self, metrics_path="/metrics", profile_dir=None,
+                 profile_sample=0.01, slow_ms=None, max_profiles=200,
+                 metrics_local_only=True):
+        self.metrics_path = metrics_path
+        self.metrics_local_only = metrics_local_only
+        self.profile_dir = profile_dir
+        self.profile_sample = profile_sample
+        self.slow_ms = slow_ms
+        self.max_profiles = max_profiles
+        self.profiles_written = 0
+        self.app = None
+        self._local = threading.local()
+        # Live threads' {(route, method): RouteStats}, by id(); guarded by
+        # _shards_lock like _retired, the sum over threads that have ended
+        self._shards = {}
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configured by DEMEZA_PROFILE_DIR, DEMEZA_PROFILE_SAMPLE,
+        DEMEZA_SLOW_MS and DEMEZA_METRICS_PUBLIC (1: serve /metrics to
+        any client, e.g. a remote Prometheus)."""
+        slow_ms = os.environ.get("DEMEZA_SLOW_MS")
+        return cls(
+            profile_dir=os.environ.get("DEMEZA_PROFILE_DIR") or None,
+            profile_sample=float(os.environ.get("DEMEZA_PROFILE_SAMPLE", "0.01")),
+            slow_ms=float(slow_ms) if slow_ms else None,
+            metrics_local_only=os.environ.get("DEMEZA_METRICS_PUBLIC") != "1",
+        )
+
+    def init_app(self, app):
+        """Wrap app.wsgi_app and hook the view timing in."""
+        self.app = app.wsgi_app
+        app.wsgi_app = self
+
+        @app.before_request
+        def _start_render():
+            request.environ["demeza.render_start"] = time.perf_counter()
+
+        @app.after_request
+        def _end_render(response):
+            environ = request.environ
+            start = environ.get("demeza.render_start")
+            if start is not None:
+                environ["demeza.render"] = time.perf_counter() - start
+            if request.url_rule is not None:
+                environ["demeza.route"] = request.url_rule.rule
+            return response
+
+        return self
+
+    # ----------------------
+    # Recording
+    # ----------------------
+
+    def _stats(self, key):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            token = self._local.token = _ThreadToken()
+            with self._shards_lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(token, self._retire, shard)
+        stats = shard.get(key)
+        if stats is None:
+            stats = shard[key] = RouteStats()
+        return stats
+
+    def _record(self, environ, t0, status, sent, profiler):
+        seconds = time.perf_counter() - t0
+        key = (environ.get("demeza.route", UNMATCHED), environ.get("REQUEST_METHOD", "GET"))
+        stats = self._stats(key)
+        stats.buckets[bisect_left(BUCKETS, seconds)] += 1
+        stats.count += 1
+        stats.seconds += seconds
+        stats.render_seconds += environ.get("demeza.render", 0.0)
+        stats.bytes += sent[0]
+        stats.statuses[status[0]] = stats.statuses.get(status[0], 0) + 1
+        if profiler is not None:
+            self._maybe_dump(profiler, key, seconds)
+
+    def _retire(self, shard):
+        """Fold an ended thread's shard into the shared total."""
+        with self._shards_lock:
+            _merge_into(self._retired, shard)
+            del self._shards[id(shard)]
+
+    def merged(self):
+        """{(route, method): RouteStats} summed over every thread."""
+        total = {}
+        with self._shards_lock:
+            _merge_into(total, self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            _merge_into(total, shard)
+        return total
+
+    # ----------------------
+    # Slow-request profiles
+    # ----------------------
+
+    def _start_profile(self):
+        if (
+            self.profile_dir is None
+            or self.profiles_written >= self.max_profiles
+            or random.random() >= self.profile_sample
+        ):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this process
+            return None
+        return profiler
+
+    def _maybe_dump(self, profiler, key, seconds):
+        threshold = self.slow_ms
+        if threshold is None:
+            stats = self.merged().get(key)
+            if stats is None or stats.count < MIN_P99_SAMPLES:
+                return
+            bound = stats.quantile_bound(0.99)
+            if bound is None:
+                return
+            threshold = bound * 1000
+        ms = seconds * 1000
+        if ms < threshold:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.profiles_written}"
+            f"-{_slug(key[0])}-{ms:.0f}ms.prof"
+        )
+        profiler.dump_stats(os.path.join(self.profile_dir, name))
+        self.profiles_written += 1
+
+    # ----------------------
+    # WSGI
+    # ----------------------
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == self.metrics_path:
+            if self.metrics_local_only and environ.get("REMOTE_ADDR") not in LOCAL_ADDRS:
+                start_response("403 Forbidden", [
+                    ("Content-Type", "text/plain; charset=utf-8"),
+                    ("Content-Length", "9"),
+                ])
+                return [b"Forbidden"]
+            body = self.render().encode("utf-8")
+            start_response("200 OK", [
+                ("Content-Type", METRICS_CONTENT_TYPE),
+                ("Content-Length", str(len(body))),
+                ("Cache-Control", "no-store"),
+            ])
+            return [body]
+
+        t0 = time.perf_counter()
+        status = [0]
+        sent = [0]
+        counted = [False]
+
+        def timed_start_response(status_line, headers, exc_info=None):
+            status[0] = int(status_line.split(None, 1)[0])
+            total = time.perf_counter() - t0
+            render = environ.get("demeza.render", 0.0)
+            headers = list(headers)
+            headers.append((
+                "Server-Timing",
+                f"render;dur={render * 1000:.2f}, "
+                f"io;dur={max(total - render, 0) * 1000:.2f}",
+            ))
+            for name, value in headers:
+                if name.lower() == "content-length":
+                    sent[0] = int(value)
+                    counted[0] = True
+            return start_response(status_line, headers, exc_info)
+
+        profiler = self._start_profile()
+        try:
+            app_iter = self.app(environ, timed_start_response)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        if not counted[0]:
+            app_iter = ClosingIterator(
+                _Body(app_iter, sent), getattr(app_iter, "close", None)
+            )
+        return ClosingIterator(
+            app_iter, lambda: self._record(environ, t0, status, sent, profiler)
+        )
+
+    # ----------------------
+    # Prometheus text format
+    # ----------------------
+
+    def render(self):
+        stats = sorted(self.merged().items())
+        lines = [
+            "# HELP demeza_http_request_duration_seconds Request latency until the body is closed.",
+            "# TYPE demeza_http_request_duration_seconds histogram",
+        ]
+        for (route, method), s in stats:
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            seen = 0
+            for bound, n in zip((*BUCKETS, "+Inf"), s.buckets):
+                seen += n
+                lines.append(
+                    f'demeza_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {seen}'
+                )
+            lines.append(f"demeza_http_request_duration_seconds_sum{{{labels}}} {s.seconds:.6f}")
+            lines.append(f"demeza_http_request_duration_seconds_count{{{labels}}} {s.count}")
+
+        lines += [
+            "# HELP demeza_http_render_seconds_total Time spent in view functions.",
+            "# TYPE demeza_http_render_seconds_total counter",
+        ]
+        for (route, method), s in stats:
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            lines.append(f"demeza_http_render_seconds_total{{{labels}}} {s.render_seconds:.6f}")
+
+        lines += [
+            "# HELP demeza_http_requests_total Requests by status code.",
+            "# TYPE demeza_http_requests_total counter",
+        ]
+        for (route, method), s in stats:
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            for code, n in sorted(s.statuses.items()):
+                lines.append(f'demeza_http_requests_total{{{labels},status="{code}"}} {n}')
+
+        lines += [
+            "# HELP demeza_http_response_bytes_total Response body bytes sent.",
+            "# TYPE demeza_http_response_bytes_total counter",
+        ]
+        for (route, method), s in stats:
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            lines.append(f"demeza_http_response_bytes_total{{{labels}}} {s.bytes}")
+        return "\n".join(lines) + "\n"
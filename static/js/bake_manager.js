@@ -12,6 +12,11 @@
       'ua-parser.min.js'
       // Optional: keep if needed, but often bloat
     ],
+    // Script src with its asset fingerprint (name.<12 hex>.js) taken
+    // out, so the blocklist sees the plain file name
+    plainSrc(src) {
+      return src.split(/[?#]/)[0].replace(/\.[0-9a-f]{12}(\.[^./]+)$/, '$1');
+    },
     async generateFinalCode() {
       L.log('[BakeManager] Starting generation sequence...');
       // 1. Clone the current page state
@@ -45,7 +50,8 @@
         '.tile-remove-btn',     // Remove editor buttons (New)
         '.tile-add-btn',        // Remove add button tile (New)
         'script[src*="reload"]', // Generic live-reload
-        'script[src*="googletagmanager"]' // [NEW] Remove GA External
+        'script[src*="googletagmanager"]', // [NEW] Remove GA External
+        'meta[name="demeza-perf"]' // Layout timing beacon (needs the Flask app)
       ];
       removables.forEach(sel => {
         const els = clone.querySelectorAll(sel);
@@ -90,7 +96,8 @@
         // Handle external scripts
         if (src) {
           const isLocal = src.startsWith('/static/') || src.startsWith('static/');
-          const isBlocked = this.blocklist.some(blocked => src.includes(blocked));
+          const name = this.plainSrc(src);
+          const isBlocked = this.blocklist.some(blocked => name.includes(blocked));
           if (isBlocked) {
             L.log(`[BakeManager] Blocking script: ${src}`);
             script.remove();
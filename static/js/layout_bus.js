@@ -1,7 +1,8 @@
 (function () {
   'use strict';
   window.Demeza = window.Demeza || {};
-  const { log } = window.Demeza.Log || console;
+  const L = window.Demeza.Log || console;
+  const { log } = L;
 
   const LayoutBus = {
     _subs: [],
@@ -12,6 +13,7 @@
     },
     notify(reason) {
       log('[LayoutBus] notify', { reason, subs: this._subs.length });
+      const t0 = L.now ? L.now() : 0;
       this._subs.forEach(fn => {
         try { fn(reason); }
         catch (e) { console.error('[LayoutBus] subscriber error', e); }
@@ -20,6 +22,10 @@
         try { window.onLayoutChange(reason); }
         catch (e) { console.error('[LayoutBus] window.onLayoutChange error', e); }
       }
+      if (L.timing) {
+        L.count('notify', reason);
+        L.timing('notify', reason, t0);
+      }
     }
   };
 
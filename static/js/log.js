@@ -33,5 +33,66 @@
     return el;
   }
 
-  window.Demeza.Log = { log, warn, err, numPx, byId };
+  // Layout timing beacon. Pages opt in with
+  //   <meta name="demeza-perf" content="<template>" data-endpoint="..." data-sample="0.1">
+  // (baked pages drop the tag). Only a sampled fraction of page loads
+  // record anything; the rest pay one boolean check per call.
+  const perfMeta = document.querySelector('meta[name="demeza-perf"]');
+  const perfOn = !!(perfMeta && navigator.sendBeacon && window.performance &&
+    Math.random() < (parseFloat(perfMeta.dataset.sample) || 0));
+  const PERF_MAX_BATCH = 50;
+  const PERF_FLUSH_MS = 15000;
+  const perfQueue = [];   // [kind, reason, ms]
+  let perfCounts = {};    // 'kind|reason' -> n
+  let perfTimer = null;
+
+  function perfFlush() {
+    if (perfTimer) { clearTimeout(perfTimer); perfTimer = null; }
+    const counts = Object.keys(perfCounts).map(key => {
+      const i = key.indexOf('|');
+      return [key.slice(0, i), key.slice(i + 1), perfCounts[key]];
+    });
+    if (!perfQueue.length && !counts.length) return;
+    const payload = JSON.stringify({
+      template: perfMeta.content,
+      samples: perfQueue.splice(0),
+      counts
+    });
+    perfCounts = {};
+    navigator.sendBeacon(perfMeta.dataset.endpoint, payload);
+  }
+
+  function perfSoon() {
+    if (perfQueue.length >= PERF_MAX_BATCH) perfFlush();
+    else if (!perfTimer) perfTimer = setTimeout(perfFlush, PERF_FLUSH_MS);
+  }
+
+  // Current time in ms for timing(); 0 when this page load isn't sampled
+  function now() {
+    return perfOn ? performance.now() : 0;
+  }
+
+  // Record one duration (ms since start = now()) for kind/reason
+  function timing(kind, reason, start) {
+    if (!perfOn) return;
+    perfQueue.push([kind, String(reason), Math.round((performance.now() - start) * 100) / 100]);
+    perfSoon();
+  }
+
+  // Count an event for kind/reason (sent as totals, not samples)
+  function count(kind, reason) {
+    if (!perfOn) return;
+    const key = `${kind}|${reason}`;
+    perfCounts[key] = (perfCounts[key] || 0) + 1;
+    perfSoon();
+  }
+
+  if (perfOn) {
+    document.addEventListener('visibilitychange', () => {
+      if (document.visibilityState === 'hidden') perfFlush();
+    });
+    window.addEventListener('pagehide', perfFlush);
+  }
+
+  window.Demeza.Log = { log, warn, err, numPx, byId, now, timing, count };
 })();
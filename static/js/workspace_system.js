@@ -57,6 +57,7 @@
 
     fit(reason) {
       if (!this.frame || !this.header || !this.grid || !this.tile || !this.canvas) return;
+      const t0 = L.now();
 
       const isLive = document.body.classList.contains('view-live');
       const bodyStyle = window.getComputedStyle(document.body);
@@ -107,6 +108,7 @@
       // --- VISUALS (Grid / Icon) ---
       this.updateVisuals();
 
+      L.timing('fit', reason, t0);
       L.log('[Workspace] fit', { reason, isLive, frameH: this.frame.style.height });
     },
 
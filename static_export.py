@@ -0,0 +1,206 @@
+"""Freeze every flask_app.py route into a static dist/ tree.
+
+Each GET route is rendered once through the test client and written
+where a plain file server finds it ('/' -> index.html, '/classic' ->
+classic/index.html, '/static/css/x.css' as is), with precompressed .gz
+(and, with --brotli, .br) siblings. dist/manifest.json records every
+file's content hash, so a re-export only rewrites (and recompresses)
+outputs whose bytes changed, and deletes outputs no route produces any
+more. Routes with arguments are expanded from the app's own state:
+every asset name for serve_static, every prerendered page for bake.
+
+nginx serves the tree with no Python in the request path:
+
+    root /srv/demeza/dist;
+    gzip_static on;      # and brotli_static on; with ngx_brotli
+    location / { try_files $uri $uri/ =404; }
+    location ~ "^/static/.+\\.[0-9a-f]{12}\\.[a-z0-9]+$" {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+Usage:
+    python static_export.py              # -> dist/
+    python static_export.py -o site --brotli
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import posixpath
+
+from asset_pipeline import brotli, encode_variants
+
+MANIFEST = "manifest.json"
+# GET routes whose answer changes at runtime: nothing to freeze
+DYNAMIC_ENDPOINTS = ("perf_summary",)
+SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def _argument_values(app_module):
+    """Endpoint -> callable listing the argument dicts to export it with."""
+    return {
+        "serve_static": lambda: [
+            {"filename": name} for name in sorted(app_module.assets.by_name)
+        ],
+        "bake": lambda: [
+            {"template": os.path.splitext(name)[0]} for name in app_module.PAGES
+        ],
+    }
+
+
+def export_urls(app_module):
+    """Every URL to freeze, in URL-map order; prints routes it can't expand."""
+    app = app_module.app
+    expanders = _argument_values(app_module)
+    urls = []
+    with app.test_request_context():
+        adapter = app.url_map.bind("localhost")
+        for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+            if "GET" not in rule.methods or rule.endpoint in DYNAMIC_ENDPOINTS:
+                continue
+            if not rule.arguments:
+                urls.append(adapter.build(rule.endpoint))
+            elif rule.endpoint in expanders:
+                urls.extend(
+                    adapter.build(rule.endpoint, values)
+                    for values in expanders[rule.endpoint]()
+                )
+            else:
+                print(f"[EXPORT] Skipped {rule.rule}: no values for its arguments")
+    return urls
+
+
+def output_path(url):
+    """dist-relative file for url: extensionless paths become directories."""
+    path = url.lstrip("/")
+    if not path or path.endswith("/"):
+        return f"{path}index.html"
+    if not posixpath.splitext(posixpath.basename(path))[1]:
+        return f"{path}/index.html"
+    return path
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def export(app_module, out_dir="dist", encodings=("gzip",)):
+    """Write every route of app_module under out_dir.
+
+    Returns (written, unchanged, failed) counts.
+    """
+    t0 = time.perf_counter()
+    out_dir = os.path.abspath(out_dir)
+    old = _load_manifest(out_dir)
+    old_files = old.get("files", {}) if old.get("encodings") == list(encodings) else {}
+
+    files, written, unchanged, failed = {}, 0, 0, 0
+    client = app_module.app.test_client()
+    for url in export_urls(app_module):
+        rel = output_path(url)
+        if rel == MANIFEST or rel in files:
+            print(f"[EXPORT] {url}: {rel} is already taken")
+            failed += 1
+            continue
+        response = client.get(url)
+        if response.status_code != 200:
+            print(f"[EXPORT] {url}: HTTP {response.status_code}")
+            failed += 1
+            continue
+        data = response.get_data()
+        entry = {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "type": response.mimetype,
+        }
+        path = os.path.join(out_dir, *rel.split("/"))
+
+        prev = old_files.get(rel)
+        if (
+            prev is not None
+            and prev["sha256"] == entry["sha256"]
+            and all(
+                os.path.exists(path + SUFFIXES.get(e, ""))
+                for e in ["identity", *prev["encodings"]]
+            )
+        ):
+            files[rel] = prev
+            unchanged += 1
+            continue
+
+        variants = encode_variants(data, entry["type"], encodings)
+        for encoding, body in variants.items():
+            _write(path + SUFFIXES.get(encoding, ""), body)
+        for encoding, suffix in SUFFIXES.items():
+            if encoding not in variants:
+                # A sibling left from an older version would be served stale
+                _remove(path + suffix)
+        entry["encodings"] = [e for e in SUFFIXES if e in variants]
+        files[rel] = entry
+        written += 1
+
+    for rel in old.get("files", {}):
+        if rel not in files:
+            path = os.path.join(out_dir, *rel.split("/"))
+            for suffix in ("", *SUFFIXES.values()):
+                _remove(path + suffix)
+
+    manifest = {"encodings": list(encodings), "files": dict(sorted(files.items()))}
+    _write(
+        os.path.join(out_dir, MANIFEST),
+        json.dumps(manifest, indent=1).encode("utf-8"),
+    )
+    print(
+        f"[EXPORT] {len(files)} files -> {out_dir} in "
+        f"{(time.perf_counter() - t0) * 1000:.0f} ms "
+        f"({written} written, {unchanged} unchanged"
+        + (f", {failed} failed)" if failed else ")")
+    )
+    return written, unchanged, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--out", default="dist", help="output directory")
+    parser.add_argument(
+        "--brotli", action="store_true",
+        help="also write .br siblings (needs: pip install brotli)",
+    )
+    args = parser.parse_args(argv)
+    if args.brotli and brotli is None:
+        print("[EXPORT] --brotli needs the brotli package (pip install brotli)")
+        return 1
+
+    # Rendering every route is not traffic worth logging
+    os.environ.setdefault("DEMEZA_REQUEST_LOG", "0")
+    import flask_app
+
+    encodings = ("gzip", "br") if args.brotli else ("gzip",)
+    _, _, failed = export(flask_app, args.out, encodings)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
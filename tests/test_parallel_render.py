@@ -0,0 +1,102 @@
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import _Review_Functions as rf
+
+SOURCES = {
+    ".py": 'import os\n\n\nclass Item{i}:\n    """Item {i}."""\n\n'
+    "    def size(self):\n        # comment {i}\n        return {i}\n\n",
+    ".js": "/* block {i} */\nfunction f{i}(a) {{\n"
+    "  return `${{a}}-{i}`.replace(/[{{}}]/g, ''); // tail\n}}\n",
+    ".css": "/* rule {i} */\n.item-{i} {{ color: #{i:06x}; }}\n",
+    ".html": "<!-- s{i} -->\n<div id=\"d{i}\"><p>{i}</p></div>\n"
+    "<script>var n{i} = {i};</script>\n",
+    ".json": '{{"id": {i}, "tags": ["a", "b"]}}\n',
+    ".md": "## Heading {i}\n\nText for item {i}.\n",
+}
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 1, 2, 3, 4, 5)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Enough files of every kind to fill several pool batches, with
+    copies so duplicates are referenced across batch boundaries."""
+    root = tmp_path / "project"
+    exts = list(SOURCES)
+    for n in range(300):
+        ext = exts[n % len(exts)]
+        path = root / f"pkg{n % 7}" / f"sub{n % 3}" / f"file_{n}{ext}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        i = n % 50 if n % 5 == 0 else n  # every fifth file repeats another
+        path.write_text(
+            "".join(SOURCES[ext].format(i=i + k) for k in range(1 + n % 40)),
+            encoding="utf-8",
+        )
+    return root
+
+
+def aggregate(root, out_dir, **options):
+    out_dir.mkdir()
+    agg = rf.CodeAggregator(
+        root_dir=root,
+        output_filename=str(out_dir / "out.txt"),
+        use_cache=False,
+        instrument=False,
+        split_at=400,
+        dedupe="exact",
+        **options,
+    )
+    agg.aggregate()
+    return {p.name: p.read_bytes() for p in sorted(out_dir.iterdir())}
+
+
+@pytest.mark.parametrize("compaction_level", ["none", "whitespace", "stubs"])
+@pytest.mark.parametrize("comments", [False, True])
+def test_pools_match_serial(tree, tmp_path, monkeypatch, compaction_level, comments):
+    monkeypatch.setattr(rf, "datetime", FrozenDatetime)
+    options = dict(compaction_level=compaction_level, comments=comments)
+    serial = aggregate(tree, tmp_path / "serial", workers=1, **options)
+    assert len(serial) > 2  # out_1.txt ... and the manifest
+
+    for pool in ("thread", "process"):
+        parallel = aggregate(
+            tree, tmp_path / pool, workers=4, worker_pool=pool, **options
+        )
+        assert parallel.keys() == serial.keys()
+        for name, data in serial.items():
+            assert parallel[name] == data, f"{pool} pool: {name} differs"
+
+
+def test_thread_pools_in_one_process_keep_their_own_options(tree, tmp_path, monkeypatch):
+    monkeypatch.setattr(rf, "datetime", FrozenDatetime)
+    levels = ("none", "stubs")
+    serial = {
+        level: aggregate(tree, tmp_path / f"serial-{level}", workers=1,
+                         compaction_level=level)
+        for level in levels
+    }
+    results = {}
+
+    def run(level):
+        results[level] = aggregate(
+            tree, tmp_path / f"thread-{level}", workers=4,
+            worker_pool="thread", compaction_level=level,
+        )
+
+    runners = [threading.Thread(target=run, args=(level,)) for level in levels]
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+    assert results == serial
@@ -0,0 +1,59 @@
+import sys
+import json
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from perf_beacon import PerfCollector
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    PerfCollector(["classic"]).init_app(app)
+    return app.test_client()
+
+
+def post(client, body):
+    return client.post("/perf/beacon", data=body, content_type="text/plain")
+
+
+def summary(client):
+    response = client.get("/perf/summary")
+    assert response.status_code == 200
+
+    def reject(constant):
+        raise AssertionError(f"summary is not valid JSON: {constant}")
+
+    return json.loads(response.get_data(as_text=True), parse_constant=reject)
+
+
+@pytest.mark.parametrize("body", [
+    '{"template": "classic", "samples": [["fit", "resize", NaN]]}',
+    '{"template": "classic", "samples": [["fit", "resize", Infinity]]}',
+    '{"template": "classic", "counts": [["notify", "resize", Infinity]]}',
+    '{"template": "classic", "counts": [["notify", "resize", NaN]]}',
+    '{"template": "classic", "counts": [["notify", "resize", 1.5]]}',
+    '{"template": "classic", "counts": [["notify", "resize", -1]]}',
+    '{"template": "classic", "samples": [["other", "resize", 1]]}',
+    '{"template": ["classic"], "samples": [["fit", "resize", 1]]}',
+])
+def test_rejects_bad_numbers_and_keys(client, body):
+    assert post(client, body).status_code == 400
+    assert summary(client) == {}
+
+
+def test_valid_beacon_is_summarized(client):
+    body = {
+        "template": "classic",
+        "samples": [["fit", "resize", 1.5], ["fit", "resize", 3]],
+        "counts": [["notify", "resize", 4]],
+    }
+    assert post(client, json.dumps(body)).status_code == 204
+    out = summary(client)["classic"]
+    assert out["fit"]["resize"]["samples"] == 2
+    assert out["fit"]["resize"]["max_ms"] == 3
+    assert out["notify"]["resize"]["events"] == 4
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from _Review_Functions import strip_css_comments, strip_js_comments
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("x = a++ / 2 // c", "x = a++ / 2"),
+    ("x = a-- / 2 // c", "x = a-- / 2"),
+    ("x = a /* n */ / 2 // c", "x = a  / 2"),
+    ("x = a+++/re\\/\\//.source // c", "x = a+++/re\\/\\//.source"),
+    ("return /* n */ /a\\/\\/b/g // c", "return  /a\\/\\/b/g"),
+    ("s = '//' + `/*${b // c\n}*/`", "s = '//' + `/*${b\n}*/`"),
+])
+def test_js_division_and_regex(source, expected):
+    assert strip_js_comments(source) == expected
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("a{} /* c */ b{}", "a{}  b{}"),
+    ("a{content:'/*'} /* c */", "a{content:'/*'} "),
+    ('a{content:"/*"}/* c */b{}', 'a{content:"/*"} b{}'),
+    ("a{} /* open", "a{} /* open"),
+])
+def test_css_comments(source, expected):
+    assert strip_css_comments(source) == expected